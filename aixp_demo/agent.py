@@ -1,16 +1,27 @@
 import requests
-from typing import Dict, Any, List
+from concurrent.futures import Future
+from typing import Dict, Any, List, Iterator, Optional, Sequence, Tuple
 import logging
 import os
+import queue
 import sys
-import json
+import threading
+import time
+import uuid
+
+import codec
+from calls import CallError, reply_result
+from ratelimit import AdaptivePacer, overload_hint
+from runtime import AgentRuntime
+from textstats import CHUNK_SIZE, analyze_texts, iter_chunks
+from transport import Batcher, HistoryReporter, LocalBus, local_entry
 
 # 禁用代理设置
 os.environ['NO_PROXY'] = '127.0.0.1,localhost'
 
 # 配置日志
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.environ.get("AIXP_LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(sys.stdout)
@@ -19,30 +30,158 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class AIXPAgent:
-    def __init__(self, agent_id: str, capabilities: List[str], server_url: str = "http://127.0.0.1:9000"):
+    def __init__(self, agent_id: str, capabilities: List[str], server_url: Optional[str] = "http://127.0.0.1:9000",
+                 encoding: str = "json", bus: Optional[LocalBus] = None):
         self.agent_id = agent_id
         self.capabilities = capabilities
         self.server_url = server_url
+        # 消息编码：json（默认）或 msgpack；msgpack 更紧凑，data 中的 bytes 原样传输而不做 base64
+        self.encoding = codec.encoding_name(encoding)
         # 设置请求不使用代理
         self.session = requests.Session()
         self.session.proxies = {'http': None, 'https': None}
+        # 注册租约：后台线程在租约到期前发送心跳
+        self.lease_ttl: Optional[float] = None
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        # 请求/响应调用：correlation_id -> 等待响应的 future，由后台接收线程分发
+        self._calls: Dict[str, Future] = {}
+        self._calls_lock = threading.Lock()
+        self._dispatcher: Optional[threading.Thread] = None
+        # 接收线程启动后，非响应消息暂存于此，由 receive() 取出
+        self._received: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        # 服务器过载（429）时自适应放慢发送，并按建议时间重试至多 max_retries 次
+        self.pacer = AdaptivePacer()
+        self.max_retries = 5
+        # 进程内总线：发给同一总线上代理的消息直接投递，投递记录由 _reporter 在后台补报给服务器；
+        # server_url 为 None 时只在总线上通信，不注册也不补报（适合测试）
+        self.bus = bus
+        self._reporter: Optional[HistoryReporter] = None
+        # 已订阅的主题模式，租约过期重新注册后自动恢复
+        self._topics: List[str] = []
         logger.info(f"初始化代理 {agent_id}，能力：{capabilities}")
-        self.register()
+        if server_url is not None:
+            self.register()
+        if bus is not None:
+            bus.attach(self)
+            if server_url is not None:
+                self._reporter = HistoryReporter(self._post_report, agent_id)
+                # 其他进程发来的消息由接收线程放入本地队列，与总线上的消息一起由 receive() 取出
+                self._start_dispatcher()
+
+    def close(self):
+        """停止发送心跳和接收响应，租约到期后服务器会自动注销该代理"""
+        self._stopped.set()
+        if self.bus is not None:
+            self.bus.detach(self.agent_id)
+        if self._reporter is not None:
+            self._reporter.close()
+            self._reporter = None
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+        with self._calls_lock:
+            pending, self._calls = self._calls, {}
+        for future in pending.values():
+            future.set_exception(CallError("代理已关闭"))
+
+    def _post(self, path: str, body: Any, **kwargs) -> requests.Response:
+        """按代理的编码发送请求体，并请求同一编码的响应"""
+        return self.session.post(
+            f"{self.server_url}{path}",
+            data=codec.encode(body, self.encoding),
+            headers={"Content-Type": self.encoding, "Accept": self.encoding},
+            **kwargs
+        )
+
+    def _post_paced(self, path: str, body: Any) -> requests.Response:
+        """发送消息类请求：按自适应节奏发送，服务器返回 429 时等待建议的时间后重试"""
+        for _ in range(self.max_retries + 1):
+            delay = self.pacer.reserve()
+            if delay:
+                time.sleep(delay)
+            response = self._post(path, body)
+            if response.status_code != 429:
+                self.pacer.success()
+                return response
+            retry_after, limit = overload_hint(response.headers)
+            logger.debug(f"服务器过载，{retry_after:.3f} 秒后重试: {response.text}")
+            self.pacer.backoff(retry_after, limit)
+        return response
+
+    def _post_report(self, entries: List[Dict[str, Any]]):
+        response = self._post("/report_messages", entries)
+        if response.status_code != 200:
+            raise Exception(f"{response.status_code} - {response.text}")
+
+    def _is_local(self, receiver_id: Optional[str]) -> bool:
+        return self.bus is not None and receiver_id is not None and receiver_id in self.bus
+
+    def _deliver_local(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """经总线投递给本进程中的代理，返回与服务器相同格式的发送结果"""
+        self.bus.deliver(entry)
+        self._report(entry)
+        return {
+            "status": "success",
+            "message": "Message delivered",
+            "message_id": entry["message_id"],
+            "receiver": entry["receiver_id"],
+            "task": entry["task"],
+            "correlation_id": entry.get("correlation_id")
+        }
+
+    def _accept(self, message: Dict[str, Any]):
+        """总线投递的消息：响应交给对应调用的 Future，其他消息放入本地队列"""
+        if not self._resolve_reply(message):
+            self._received.put(message)
+
+    def _resolve_reply(self, message: Dict[str, Any]) -> bool:
+        """把响应（或超时通知）交给对应调用的 Future；不是本代理等待中的调用的响应时返回 False"""
+        correlation_id = message.get("in_reply_to")
+        if correlation_id is None:
+            return False
+        with self._calls_lock:
+            future = self._calls.pop(correlation_id, None)
+        if future is None:
+            return False
+        try:
+            future.set_result(reply_result(message))
+        except CallError as e:
+            future.set_exception(e)
+        return True
+
+    def _report(self, entry: Dict[str, Any]):
+        if self._reporter is not None:
+            self._reporter.report(entry)
+
+    @staticmethod
+    def _decode(response: requests.Response) -> Any:
+        """按响应的 Content-Type 解码"""
+        return codec.decode(response.content, codec.media_type(response.headers.get("content-type")))
 
     def register(self):
         """向服务器注册代理"""
         try:
             logger.info(f"正在注册代理 {self.agent_id}...")
-            response = self.session.post(
-                f"{self.server_url}/register",
-                json={"agent_id": self.agent_id, "capabilities": self.capabilities}
+            response = self._post(
+                "/register",
+                {"agent_id": self.agent_id, "capabilities": self.capabilities}
             )
             response_text = response.text
             logger.info(f"注册响应：{response.status_code} - {response_text}")
             
             if response.status_code == 200:
                 logger.info(f"代理 {self.agent_id} 注册成功")
-                return response.json()
+                result = self._decode(response)
+                self.lease_ttl = result.get("ttl")
+                if self.lease_ttl and self._heartbeat_thread is None:
+                    self._heartbeat_thread = threading.Thread(
+                        target=self._heartbeat_loop, name=f"heartbeat-{self.agent_id}", daemon=True
+                    )
+                    self._heartbeat_thread.start()
+                if self._topics:
+                    self._update_subscriptions("/subscribe", self._topics)
+                return result
             else:
                 error_msg = f"代理 {self.agent_id} 注册失败: {response_text}"
                 logger.error(error_msg)
@@ -51,34 +190,316 @@ class AIXPAgent:
             logger.error(f"注册代理时发生错误: {str(e)}")
             raise
 
-    def send_message(self, receiver_id: str, task: str, data: Dict[str, Any]):
-        """发送消息给其他代理"""
+    def _heartbeat_loop(self):
+        """每隔三分之一个租约时长续约一次，租约已过期时重新注册"""
+        while not self._stopped.wait(self.lease_ttl / 3):
+            try:
+                response = self.session.post(
+                    f"{self.server_url}/agents/{self.agent_id}/heartbeat",
+                    timeout=self.lease_ttl / 3
+                )
+                if response.status_code == 404:
+                    logger.warning(f"代理 {self.agent_id} 的租约已过期，重新注册")
+                    self.register()
+                elif response.status_code != 200:
+                    logger.warning(f"代理 {self.agent_id} 心跳失败: {response.status_code} - {response.text}")
+            except Exception as e:
+                logger.error(f"代理 {self.agent_id} 发送心跳时发生错误: {str(e)}")
+
+    def send_message(self, receiver_id: str, task: str, data: Dict[str, Any],
+                     correlation_id: Optional[str] = None, timeout: Optional[float] = None):
+        """发送消息给其他代理
+
+        指定 correlation_id 或 timeout 时作为一次调用发送，接收方的响应（或超时通知）会带有
+        in_reply_to 并由服务器路由回本代理；通常直接使用 call()。
+        接收方在同一总线上时直接投递，不经过服务器。
+        """
         try:
+            if self._is_local(receiver_id):
+                logger.debug(f"经总线发送消息给 {receiver_id}: {task}")
+                return self._deliver_local(local_entry(self.agent_id, receiver_id, task, data,
+                                                       correlation_id=correlation_id, timeout=timeout))
             message = {
                 "sender_id": self.agent_id,
                 "receiver_id": receiver_id,
                 "task": task,
                 "data": data
             }
-            logger.info(f"发送消息: {json.dumps(message, ensure_ascii=False)}")
+            if correlation_id is not None:
+                message["correlation_id"] = correlation_id
+            if timeout is not None:
+                message["timeout"] = timeout
+            logger.debug(f"发送消息给 {receiver_id}: {task}")
             
-            response = self.session.post(
-                f"{self.server_url}/send_message",
-                json=message
-            )
-            response_text = response.text
-            logger.info(f"发送响应：{response.status_code} - {response_text}")
+            response = self._post_paced("/send_message", message)
+            
+            if response.status_code == 200:
+                result = self._decode(response)
+                logger.debug(f"发送响应：{response.status_code} - {result}")
+                return result
+            else:
+                error_msg = f"发送消息失败: {response.text}"
+                logger.error(error_msg)
+                raise Exception(error_msg)
+        except Exception as e:
+            logger.error(f"发送消息时发生错误: {str(e)}")
+            raise
+
+    def call(self, receiver_id: Optional[str], task: str, data: Dict[str, Any], timeout: float = 30.0,
+             capability: Optional[str] = None, **options) -> Future:
+        """发起请求/响应调用，返回 Future，其结果为响应消息
+
+        receiver_id 为 None 时按 capability 路由（options 可指定 routing、route_key）。
+        超时由服务器计时：到期未收到响应时 Future 以 CallTimeout 结束，错误响应以 CallError 结束。
+        响应由后台接收线程按 correlation_id 分发，同一代理可以同时进行任意多个调用。
+        """
+        correlation_id = uuid.uuid4().hex
+        future: Future = Future()
+        with self._calls_lock:
+            self._calls[correlation_id] = future
+        if self._is_local(receiver_id):
+            # 总线上的调用由总线计时，响应直接交给 _accept()
+            try:
+                self._deliver_local(local_entry(self.agent_id, receiver_id, task, data,
+                                                correlation_id=correlation_id, timeout=timeout))
+            except Exception as e:
+                with self._calls_lock:
+                    self._calls.pop(correlation_id, None)
+                if not future.done():
+                    future.set_exception(e)
+            return future
+        self._start_dispatcher()
+        message = {
+            "sender_id": self.agent_id,
+            "task": task,
+            "data": data,
+            "correlation_id": correlation_id,
+            "timeout": timeout,
+            **options
+        }
+        if receiver_id is not None:
+            message["receiver_id"] = receiver_id
+        else:
+            message["capability"] = capability
+        try:
+            response = self._post_paced("/send_message", message)
+            if response.status_code != 200:
+                raise CallError(f"发起调用失败: {response.status_code} - {response.text}")
+        except Exception as e:
+            with self._calls_lock:
+                self._calls.pop(correlation_id, None)
+            if not future.done():
+                future.set_exception(e)
+        return future
+
+    def reply(self, request: Dict[str, Any], data: Dict[str, Any], error: Optional[str] = None):
+        """响应收到的调用，服务器把响应路由回调用方；调用已超时或已响应时抛出异常"""
+        if request.get("transport") == "local":
+            # 经总线收到的调用，响应同样经总线送回
+            entry = local_entry(self.agent_id, request["sender_id"], request["task"], data,
+                                in_reply_to=request["correlation_id"], error=error)
+            try:
+                return self._deliver_local(entry)
+            except (CallError, LookupError) as e:
+                raise CallError(f"响应调用失败: {str(e)}")
+        message = {
+            "sender_id": self.agent_id,
+            "task": request["task"],
+            "data": data,
+            "in_reply_to": request["correlation_id"]
+        }
+        if error is not None:
+            message["error"] = error
+        response = self._post_paced("/send_message", message)
+        if response.status_code != 200:
+            raise CallError(f"响应调用失败: {response.status_code} - {response.text}")
+        return self._decode(response)
+
+    def _start_dispatcher(self):
+        if self._dispatcher is None and self.server_url is not None:
+            with self._calls_lock:
+                if self._dispatcher is None:
+                    self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+                    self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        """持续接收消息：响应交给对应调用的 Future，其他消息留给 receive()"""
+        while not self._stopped.is_set():
+            try:
+                messages = self._fetch(100, 5.0)
+            except Exception:
+                self._stopped.wait(1.0)
+                continue
+            for message in messages:
+                if not self._resolve_reply(message):
+                    self._received.put(message)
+
+    def send_many(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量发送消息，一次 HTTP 请求
+
+        每条消息为包含 receiver_id（或 capability）、task、data 的字典，sender_id 自动填充。
+        返回服务器的批量结果，其中 results 按顺序给出每条消息的状态。
+        接收方在同一总线上的消息直接投递，其余消息一次发送给服务器。
+        """
+        if self.bus is not None:
+            local = [index for index, message in enumerate(messages) if self._is_local(message.get("receiver_id"))]
+            if local:
+                return self._send_many_local(messages, local)
+        try:
+            batch = [dict(message, sender_id=self.agent_id) for message in messages]
+            logger.info(f"批量发送 {len(batch)} 条消息")
+            
+            response = self._post_paced("/send_messages", batch)
+            if response.status_code == 200:
+                result = self._retry_throttled(batch, self._decode(response))
+                if result["rejected"]:
+                    logger.warning(f"批量发送中有 {result['rejected']} 条消息被拒绝")
+                return result
+            else:
+                error_msg = f"批量发送消息失败: {response.text}"
+                logger.error(error_msg)
+                raise Exception(error_msg)
+        except Exception as e:
+            logger.error(f"批量发送消息时发生错误: {str(e)}")
+            raise
+
+    def _send_many_local(self, messages: List[Dict[str, Any]], local: List[int]) -> Dict[str, Any]:
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        for index in local:
+            message = messages[index]
+            try:
+                sent = self._deliver_local(local_entry(
+                    self.agent_id, message["receiver_id"], message["task"], message["data"],
+                    correlation_id=message.get("correlation_id"), timeout=message.get("timeout")
+                ))
+                results[index] = {"index": index, "status": "success", "message_id": sent["message_id"],
+                                  "receiver": sent["receiver"], "correlation_id": sent["correlation_id"]}
+            except (CallError, LookupError) as e:
+                results[index] = {"index": index, "status": "error", "code": 404 if isinstance(e, LookupError) else 409,
+                                  "detail": str(e)}
+        remote = [index for index in range(len(messages)) if results[index] is None]
+        if remote:
+            sent = self.send_many([messages[index] for index in remote])
+            for index, item in zip(remote, sent["results"]):
+                item["index"] = index
+                results[index] = item
+        accepted = sum(1 for item in results if item["status"] == "success")
+        return {"status": "success", "accepted": accepted, "rejected": len(results) - accepted, "results": results}
+
+    def _retry_throttled(self, batch: List[Dict[str, Any]], result: Dict[str, Any]) -> Dict[str, Any]:
+        """批量结果中因过载（429）被拒绝的消息，按建议时间等待后重新发送
+
+        超过限速突发容量的批次会分多轮被接受；连续 max_retries 轮没有任何消息被接受时放弃。
+        """
+        results = result["results"]
+        stalled = 0
+        while stalled < self.max_retries:
+            throttled = [item for item in results if item.get("code") == 429]
+            if not throttled:
+                break
+            time.sleep(max(item.get("retry_after", 1.0) for item in throttled))
+            response = self._post("/send_messages", [batch[item["index"]] for item in throttled])
+            if response.status_code != 200:
+                break
+            retried = self._decode(response)
+            stalled = 0 if retried["accepted"] else stalled + 1
+            for original, item in zip(throttled, retried["results"]):
+                item["index"] = original["index"]
+                results[original["index"]] = item
+        result["accepted"] = sum(1 for item in results if item["status"] == "success")
+        result["rejected"] = len(results) - result["accepted"]
+        return result
+
+    def runtime(self, executor: str = "thread", **options) -> AgentRuntime:
+        """创建任务处理运行时，并登记 setup_handlers() 中声明的处理函数
+
+        options 为 AgentRuntime 的参数（max_concurrency、max_workers、timeout、cache 等）；
+        runtime.start() 在后台线程中处理消息，runtime.run() 在当前线程中处理。
+        """
+        runtime = AgentRuntime(self, executor=executor, **options)
+        self.setup_handlers(runtime)
+        return runtime
+
+    def setup_handlers(self, runtime: AgentRuntime):
+        """子类在此通过 runtime.register(task, function) 登记任务处理函数"""
+
+    def batcher(self, max_batch_size: int = 100, max_delay: float = 0.05) -> "MessageBatcher":
+        """创建自动批量发送器，消息攒满 max_batch_size 条或等待 max_delay 秒后合并发送"""
+        return MessageBatcher(self, max_batch_size=max_batch_size, max_delay=max_delay)
+
+    def send_to_capability(self, capability: str, task: str, data: Dict[str, Any],
+                           routing: Optional[str] = None, route_key: Optional[str] = None):
+        """发送消息给任意一个具备指定能力的代理，由服务器按路由策略选择接收方
+
+        routing 可选 round_robin、least_outstanding、consistent_hash；
+        consistent_hash 按 data[route_key] 选择代理，相同的键总是落到同一代理。
+        """
+        try:
+            message = {
+                "sender_id": self.agent_id,
+                "capability": capability,
+                "task": task,
+                "data": data
+            }
+            if routing is not None:
+                message["routing"] = routing
+            if route_key is not None:
+                message["route_key"] = route_key
+            logger.info(f"按能力 {capability} 发送消息: {task}")
+            
+            response = self._post_paced("/send_message", message)
             
             if response.status_code == 200:
-                return response.json()
+                result = self._decode(response)
+                logger.debug(f"发送响应：{response.status_code} - {result}")
+                return result
             else:
-                error_msg = f"发送消息失败: {response_text}"
+                error_msg = f"发送消息失败: {response.text}"
                 logger.error(error_msg)
                 raise Exception(error_msg)
         except Exception as e:
             logger.error(f"发送消息时发生错误: {str(e)}")
             raise
 
+    def subscribe(self, *topics: str) -> List[str]:
+        """订阅主题模式（"." 分层，"*" 匹配一层，"#" 作为最后一层匹配零层或多层），返回当前的全部订阅
+
+        发布到匹配主题的消息进入本代理的收件箱，带有 topic 字段，由 receive() 取出。
+        """
+        return self._update_subscriptions("/subscribe", list(topics))
+
+    def unsubscribe(self, *topics: str) -> List[str]:
+        """取消订阅（不指定主题时取消全部订阅），返回剩余的订阅"""
+        return self._update_subscriptions("/unsubscribe", list(topics) if topics else None)
+
+    def _update_subscriptions(self, path: str, topics: Optional[List[str]]) -> List[str]:
+        response = self._post(path, {"agent_id": self.agent_id, "topics": topics})
+        if response.status_code != 200:
+            error_msg = f"更新订阅失败: {response.text}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        self._topics = self._decode(response)["subscriptions"]
+        return self._topics
+
+    def publish(self, topic: str, task: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """向主题发布消息：一次请求，服务器只记录一条历史并投递给所有订阅方
+
+        返回 {"message_id", "topic", "subscribers": 匹配的订阅方数量, "delivered": 投递数量, "dropped": 被跳过的订阅方}。
+        """
+        try:
+            logger.debug(f"发布到主题 {topic}: {task}")
+            response = self._post_paced(
+                "/publish", {"sender_id": self.agent_id, "topic": topic, "task": task, "data": data}
+            )
+            if response.status_code == 200:
+                return self._decode(response)
+            error_msg = f"发布消息失败: {response.text}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        except Exception as e:
+            logger.error(f"发布消息时发生错误: {str(e)}")
+            raise
+
     def get_registered_agents(self):
         """获取所有注册的代理列表"""
         try:
@@ -99,45 +520,268 @@ class AIXPAgent:
             logger.error(f"获取代理列表时发生错误: {str(e)}")
             raise
 
+    def find_agents(self, capability: str, limit: Optional[int] = None, page_size: int = 100) -> List[Dict[str, Any]]:
+        """查找具备指定能力的代理，最多返回 limit 个（默认全部）"""
+        try:
+            agents: List[Dict[str, Any]] = []
+            cursor = None
+            while limit is None or len(agents) < limit:
+                params = {"capability": capability, "limit": page_size}
+                if limit is not None:
+                    params["limit"] = min(page_size, limit - len(agents))
+                if cursor is not None:
+                    params["cursor"] = cursor
+                response = self.session.get(f"{self.server_url}/agents", params=params)
+                if response.status_code != 200:
+                    error_msg = f"查找代理失败: {response.text}"
+                    logger.error(error_msg)
+                    raise Exception(error_msg)
+                page = response.json()
+                agents.extend(page["agents"])
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+            logger.info(f"找到 {len(agents)} 个具备能力 {capability} 的代理")
+            return agents
+        except Exception as e:
+            logger.error(f"查找代理时发生错误: {str(e)}")
+            raise
+
+    def receive(self, max_messages: int = 100, timeout: float = 30.0) -> List[Dict[str, Any]]:
+        """从服务器收件箱取出消息，收件箱为空时最多等待 timeout 秒（长轮询）
+
+        发起过调用或加入总线后，收件箱由后台接收线程读取，此时从本地队列中取出非响应消息
+        （包括总线投递的只读消息）。
+        """
+        if self._dispatcher is not None or self.bus is not None:
+            messages = []
+            try:
+                messages.append(self._received.get(timeout=timeout))
+                while len(messages) < max_messages:
+                    messages.append(self._received.get_nowait())
+            except queue.Empty:
+                pass
+            return messages
+        # 长轮询期间可能有其他线程发起调用：调用的响应可能由这次拉取取走，交给对应的 Future
+        return [message for message in self._fetch(max_messages, timeout) if not self._resolve_reply(message)]
+
+    def _fetch(self, max_messages: int, timeout: float) -> List[Dict[str, Any]]:
+        try:
+            response = self.session.get(
+                f"{self.server_url}/inbox/{self.agent_id}",
+                params={"max_messages": max_messages, "timeout": timeout},
+                headers={"Accept": self.encoding},
+                timeout=timeout + 10
+            )
+            if response.status_code == 200:
+                messages = self._decode(response)["messages"]
+                if messages:
+                    logger.info(f"代理 {self.agent_id} 收到 {len(messages)} 条消息")
+                return messages
+            else:
+                error_msg = f"接收消息失败: {response.text}"
+                logger.error(error_msg)
+                raise Exception(error_msg)
+        except Exception as e:
+            logger.error(f"接收消息时发生错误: {str(e)}")
+            raise
+
+    def iter_messages(self, max_messages: int = 100, timeout: float = 30.0) -> Iterator[Dict[str, Any]]:
+        """持续接收消息的迭代器，消息到达后立即返回"""
+        while True:
+            for message in self.receive(max_messages=max_messages, timeout=timeout):
+                yield message
+
+    def upload_blob(self, content: Any, content_type: str = "application/octet-stream") -> Dict[str, Any]:
+        """流式上传大对象，返回可直接放入消息 data 的引用 {"$blob": 摘要, "size": ..., "content_type": ...}
+
+        content 可以是 bytes、打开的文件对象或逐块产出 bytes 的迭代器（以分块传输编码发送），
+        大负载因此无需整体读入内存，也不会随消息进入历史记录和仪表盘。
+        """
+        response = self.session.post(
+            f"{self.server_url}/blobs",
+            data=content,
+            headers={"Content-Type": content_type, "Accept": self.encoding}
+        )
+        if response.status_code != 200:
+            raise Exception(f"上传大对象失败: {response.status_code} - {response.text}")
+        reference = self._decode(response)
+        logger.debug(f"已上传大对象 {reference['$blob']}（{reference['size']} 字节）")
+        return reference
+
+    def open_blob(self, reference: Any, start: int = 0, end: Optional[int] = None,
+                  chunk_size: int = 1 << 20) -> Iterator[bytes]:
+        """按块流式读取大对象的 [start, end] 闭区间（end 为 None 时读到末尾）
+
+        reference 为消息中的引用或摘要字符串。
+        """
+        digest = reference["$blob"] if isinstance(reference, dict) else reference
+        headers = {}
+        if start or end is not None:
+            headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+        response = self.session.get(f"{self.server_url}/blobs/{digest}", headers=headers, stream=True)
+        if response.status_code not in (200, 206):
+            response.close()
+            raise Exception(f"读取大对象失败: {response.status_code} - {response.text}")
+        with response:
+            yield from response.iter_content(chunk_size)
+
+    def download_blob(self, reference: Any, start: int = 0, end: Optional[int] = None) -> bytes:
+        """读取整个大对象（或其中一段）到内存"""
+        return b"".join(self.open_blob(reference, start, end))
+
+    def iter_blob_lines(self, reference: Any) -> Iterator[Any]:
+        """逐行读取 NDJSON 大对象（如分块上传的批量结果），每行解码为一个 JSON 值"""
+        pending = b""
+        for chunk in self.open_blob(reference):
+            *lines, pending = (pending + chunk).split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield codec.loads_json(line)
+        if pending.strip():
+            yield codec.loads_json(pending)
+
+class MessageBatcher:
+    """自动批量发送器
+
+    send() 只把消息放入缓冲区并返回 Future；后台线程在缓冲区达到 max_batch_size
+    或最早的消息等待超过 max_delay 秒时，通过一次 /send_messages 请求发送整批消息。
+    """
+
+    def __init__(self, agent: AIXPAgent, max_batch_size: int = 100, max_delay: float = 0.05):
+        self.agent = agent
+        self._batcher = Batcher(self._send, f"batcher-{agent.agent_id}", max_batch_size, max_delay)
+
+    def send(self, receiver_id: Optional[str], task: str, data: Dict[str, Any], **options) -> Future:
+        """缓冲一条消息，options 可包含 capability、routing、route_key；Future 的结果为该消息的发送状态"""
+        message = {"receiver_id": receiver_id, "task": task, "data": data}
+        message.update(options)
+        future: Future = Future()
+        if not self._batcher.add((message, future)):
+            raise RuntimeError("MessageBatcher is closed")
+        return future
+
+    def flush(self):
+        """立即发送缓冲区中的所有消息"""
+        self._batcher.flush()
+
+    def close(self):
+        """发送剩余消息并停止后台线程"""
+        self._batcher.close()
+
+    def __enter__(self) -> "MessageBatcher":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _send(self, batch: List[Tuple[Dict[str, Any], Future]]):
+        if not batch:
+            return
+        messages = [
+            {key: value for key, value in message.items() if value is not None}
+            for message, _ in batch
+        ]
+        try:
+            result = self.agent.send_many(messages)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), item in zip(batch, result["results"]):
+            future.set_result(item)
+
+# 示例处理函数：定义在模块级，可以交给进程池执行
+def analyze_text(data: Dict[str, Any]) -> Dict[str, Any]:
+    """文本分析，data 为 {"text": ...}"""
+    text = data["text"]
+    # 这里可以添加实际的文本处理逻辑
+    return {
+        "word_count": len(text.split()),
+        "text_length": len(text),
+        "sample_analysis": "这是一个示例分析"
+    }
+
+def analyze_image(data: Dict[str, Any]) -> Dict[str, Any]:
+    """图像分析，data 为 {"image_url": ...}"""
+    # 这里可以添加实际的图像处理逻辑
+    return {
+        "detected_objects": ["示例对象1", "示例对象2"],
+        "image_format": "jpg",
+        "sample_analysis": "这是一个示例图像分析"
+    }
+
 # 示例：文本处理代理
 class TextProcessingAgent(AIXPAgent):
-    def __init__(self, agent_id: str):
+    def __init__(self, agent_id: str, **options):
         logger.info(f"创建文本处理代理 {agent_id}")
-        super().__init__(agent_id, capabilities=["text_analysis", "sentiment_analysis"])
+        super().__init__(agent_id, capabilities=["text_analysis", "sentiment_analysis"], **options)
+
+    def setup_handlers(self, runtime: AgentRuntime):
+        runtime.register("process_text", analyze_text, cached=True)
+        # 批量任务可能要上传结果，需要访问代理本身，在线程池中执行
+        runtime.register("process_texts", self.process_texts_task, executor="thread")
 
     def process_text(self, text: str) -> Dict[str, Any]:
         """处理文本的示例方法"""
         try:
             logger.info(f"处理文本: {text}")
-            # 这里可以添加实际的文本处理逻辑
-            word_count = len(text.split())
-            result = {
-                "word_count": word_count,
-                "text_length": len(text),
-                "sample_analysis": "这是一个示例分析"
-            }
+            result = analyze_text({"text": text})
             logger.info(f"文本处理结果: {result}")
             return result
         except Exception as e:
             logger.error(f"处理文本时发生错误: {str(e)}")
             raise
 
+    def process_texts(self, texts: Sequence[str], chunk_size: int = CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+        """批量处理文本，逐块产出 {"offset": 起始下标, "word_count": [...], "text_length": [...]}
+
+        每块一次向量化计算，不逐条记录日志；逐块消费时只占用一块结果的内存。
+        """
+        logger.debug(f"批量处理 {len(texts)} 条文本")
+        for offset, columns in iter_chunks(texts, chunk_size):
+            yield {"offset": offset, **columns}
+
+    def process_texts_task(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """process_texts 任务：data 为 {"texts": [...], "chunk_size": 可选}
+
+        结果不超过一块时直接放在响应中；否则逐块编码为 NDJSON 流式上传为大对象，
+        响应中的 results 为其引用（接收方用 iter_blob_lines() 逐块读取），两端都不必一次持有整批结果。
+        """
+        texts = data["texts"]
+        chunk_size = data.get("chunk_size", CHUNK_SIZE)
+        summary = {"count": len(texts), "total_words": 0, "total_length": 0}
+        if len(texts) <= chunk_size:
+            columns = analyze_texts(texts)
+            summary["total_words"] = sum(columns["word_count"])
+            summary["total_length"] = sum(columns["text_length"])
+            return {**summary, **columns}
+
+        def lines() -> Iterator[bytes]:
+            for chunk in self.process_texts(texts, chunk_size):
+                summary["total_words"] += sum(chunk["word_count"])
+                summary["total_length"] += sum(chunk["text_length"])
+                yield (codec.dumps_json(chunk) + "\n").encode("utf-8")
+
+        summary["results"] = self.upload_blob(lines(), "application/x-ndjson")
+        summary["chunks"] = (len(texts) + chunk_size - 1) // chunk_size
+        return summary
+
 # 示例：图像处理代理
 class ImageProcessingAgent(AIXPAgent):
-    def __init__(self, agent_id: str):
+    def __init__(self, agent_id: str, **options):
         logger.info(f"创建图像处理代理 {agent_id}")
-        super().__init__(agent_id, capabilities=["image_analysis", "object_detection"])
+        super().__init__(agent_id, capabilities=["image_analysis", "object_detection"], **options)
+
+    def setup_handlers(self, runtime: AgentRuntime):
+        # 图像分析是 CPU 密集的处理，交给进程池
+        runtime.register("process_image", analyze_image, executor="process", cached=True)
 
     def process_image(self, image_url: str) -> Dict[str, Any]:
         """处理图像的示例方法"""
         try:
             logger.info(f"处理图像: {image_url}")
-            # 这里可以添加实际的图像处理逻辑
-            result = {
-                "detected_objects": ["示例对象1", "示例对象2"],
-                "image_format": "jpg",
-                "sample_analysis": "这是一个示例图像分析"
-            }
+            result = analyze_image({"image_url": image_url})
             logger.info(f"图像处理结果: {result}")
             return result
         except Exception as e:
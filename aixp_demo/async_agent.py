@@ -0,0 +1,517 @@
+import asyncio
+import logging
+import uuid
+from typing import Dict, Any, List, Optional, AsyncIterator, Set
+
+import httpx
+
+import codec
+from calls import CallTimeout, reply_result
+from ratelimit import AdaptivePacer, overload_hint
+from runtime import AgentRuntime
+
+logger = logging.getLogger(__name__)
+
+
+class AIXPConnection:
+    """多个异步代理共享的服务器连接
+
+    - 所有 HTTP 请求复用同一个 httpx.AsyncClient 连接池
+    - 注册请求在短时间窗口内合并，通过 /register_batch 批量提交
+    - 收件箱通过 /inboxes/poll 多路长轮询：每组至多 poll_group_size 个代理共用一个轮询循环，
+      收到的消息再分发到各代理的本地队列
+    - 所有已注册代理的租约由一个后台任务通过 /heartbeat 批量续约，租约已过期的代理自动重新注册
+    - 调用的响应在轮询循环中按 correlation_id 直接交给等待的 future，不进入代理的消息队列
+
+    单个进程因此可以用少量连接和协程驱动上万个代理。
+    """
+
+    def __init__(self, server_url: str = "http://127.0.0.1:9000", max_connections: int = 100,
+                 register_batch_size: int = 500, register_delay: float = 0.01,
+                 poll_group_size: int = 1000, poll_timeout: float = 30.0, encoding: str = "json"):
+        self.server_url = server_url
+        # 请求体和响应的编码：json（默认）或 msgpack
+        self.encoding = codec.encoding_name(encoding)
+        self.client = httpx.AsyncClient(
+            base_url=server_url,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(poll_timeout + 10),
+            # 不使用系统代理设置
+            trust_env=False
+        )
+        self.register_batch_size = register_batch_size
+        self.register_delay = register_delay
+        self.poll_group_size = poll_group_size
+        self.poll_timeout = poll_timeout
+        self._pending_registrations: List[tuple] = []
+        self._register_task: Optional[asyncio.Task] = None
+        # 接收消息的代理：agent_id -> 本地队列
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._pending_subscriptions: List[str] = []
+        # 已在某个轮询组中（或等待组建）的代理；取消订阅后仍留在原组中，重新订阅时由原组继续轮询
+        self._polled: Set[str] = set()
+        self._subscribe_task: Optional[asyncio.Task] = None
+        self._poll_tasks: List[asyncio.Task] = []
+        # 需要续约的代理：agent_id -> 能力列表，及其中最短的租约时长
+        self._leases: Dict[str, List[str]] = {}
+        self._lease_ttl: Optional[float] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        # 代理的主题订阅：agent_id -> 订阅模式，租约过期重新注册后恢复
+        self._topics: Dict[str, List[str]] = {}
+        # 已重新注册但订阅尚未恢复的代理，下次心跳时重试
+        self._unrestored: Set[str] = set()
+        # 等待响应的调用：correlation_id -> future
+        self._calls: Dict[str, asyncio.Future] = {}
+        # 服务器过载（429）时所有代理共用的发送节奏
+        self.pacer = AdaptivePacer()
+        self.max_retries = 5
+        self._closed = False
+
+    async def __aenter__(self) -> "AIXPConnection":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """停止所有轮询循环并关闭连接池"""
+        self._closed = True
+        tasks = self._poll_tasks + [
+            t for t in (self._register_task, self._subscribe_task, self._heartbeat_task) if t
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.client.aclose()
+
+    async def request(self, method: str, path: str, json: Any = None, **kwargs) -> Any:
+        """发送请求并返回解码后的响应，非 200 状态码时抛出异常
+
+        请求体 json 按连接的编码序列化，响应按其 Content-Type 解码。
+        """
+        headers = {"Accept": self.encoding}
+        if json is not None:
+            kwargs["content"] = codec.encode(json, self.encoding)
+            headers["Content-Type"] = self.encoding
+        response = await self.client.request(method, path, headers=headers, **kwargs)
+        if response.status_code != 200:
+            raise Exception(f"{method} {path} 失败: {response.status_code} - {response.text}")
+        return codec.decode(response.content, codec.media_type(response.headers.get("content-type")))
+
+    async def upload_blob(self, content: Any, content_type: str = "application/octet-stream") -> Dict[str, Any]:
+        """流式上传大对象，返回可放入消息 data 的引用；content 为 bytes 或逐块产出 bytes 的异步迭代器"""
+        response = await self.client.post(
+            "/blobs", content=content, headers={"Content-Type": content_type, "Accept": self.encoding}
+        )
+        if response.status_code != 200:
+            raise Exception(f"上传大对象失败: {response.status_code} - {response.text}")
+        return codec.decode(response.content, codec.media_type(response.headers.get("content-type")))
+
+    async def open_blob(self, reference: Any, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """按块流式读取大对象的 [start, end] 闭区间；reference 为消息中的引用或摘要字符串"""
+        digest = reference["$blob"] if isinstance(reference, dict) else reference
+        headers = {}
+        if start or end is not None:
+            headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+        async with self.client.stream("GET", f"/blobs/{digest}", headers=headers) as response:
+            if response.status_code not in (200, 206):
+                await response.aread()
+                raise Exception(f"读取大对象失败: {response.status_code} - {response.text}")
+            async for chunk in response.aiter_bytes():
+                yield chunk
+
+    async def download_blob(self, reference: Any, start: int = 0, end: Optional[int] = None) -> bytes:
+        return b"".join([chunk async for chunk in self.open_blob(reference, start, end)])
+
+    async def iter_blob_lines(self, reference: Any) -> AsyncIterator[Any]:
+        """逐行读取 NDJSON 大对象（如分块上传的批量结果），每行解码为一个 JSON 值"""
+        digest = reference["$blob"] if isinstance(reference, dict) else reference
+        async with self.client.stream("GET", f"/blobs/{digest}") as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise Exception(f"读取大对象失败: {response.status_code} - {response.text}")
+            async for line in response.aiter_lines():
+                if line.strip():
+                    yield codec.loads_json(line)
+
+    async def send(self, path: str, body: Any) -> Any:
+        """发送消息类请求：按自适应节奏发送，服务器返回 429 时等待建议的时间后重试"""
+        for attempt in range(self.max_retries + 1):
+            delay = self.pacer.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            response = await self.client.post(
+                path, content=codec.encode(body, self.encoding),
+                headers={"Content-Type": self.encoding, "Accept": self.encoding}
+            )
+            if response.status_code == 429 and attempt < self.max_retries:
+                self.pacer.backoff(*overload_hint(response.headers))
+                continue
+            if response.status_code != 200:
+                raise Exception(f"POST {path} 失败: {response.status_code} - {response.text}")
+            self.pacer.success()
+            return codec.decode(response.content, codec.media_type(response.headers.get("content-type")))
+
+    async def register(self, agent_id: str, capabilities: List[str]):
+        """登记一个待注册的代理，与同一时间窗口内的其他注册合并提交"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending_registrations.append(({"agent_id": agent_id, "capabilities": capabilities}, future))
+        if len(self._pending_registrations) >= self.register_batch_size:
+            self._flush_registrations()
+        elif self._register_task is None:
+            self._register_task = asyncio.create_task(self._delayed_flush())
+        await future
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.register_delay)
+        self._register_task = None
+        self._flush_registrations()
+
+    def _flush_registrations(self):
+        batch, self._pending_registrations = self._pending_registrations, []
+        if batch:
+            asyncio.create_task(self._submit_registrations(batch))
+
+    async def _submit_registrations(self, batch: List[tuple]):
+        try:
+            result = await self.request("POST", "/register_batch", json=[info for info, _ in batch])
+        except Exception as e:
+            logger.error(f"批量注册 {len(batch)} 个代理失败: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        logger.info(f"批量注册 {len(batch)} 个代理成功")
+        for info, _ in batch:
+            ttl = result.get("ttl", {}).get(info["agent_id"])
+            if ttl:
+                self._leases[info["agent_id"]] = info["capabilities"]
+                self._lease_ttl = min(ttl, self._lease_ttl or ttl)
+        if self._leases and self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    def release(self, agent_id: str):
+        """停止为代理续约"""
+        self._leases.pop(agent_id, None)
+        self._topics.pop(agent_id, None)
+        self._unrestored.discard(agent_id)
+
+    def track_subscriptions(self, agent_id: str, topics: List[str]):
+        """记录代理当前的全部订阅，重新注册后据此恢复"""
+        if topics:
+            self._topics[agent_id] = list(topics)
+        else:
+            self._topics.pop(agent_id, None)
+
+    async def _reregister(self, agent_id: str):
+        """重新注册租约已过期的代理，并恢复其主题订阅（服务器注销代理时已移除其订阅）"""
+        await self.register(agent_id, self._leases[agent_id])
+        await self._restore_subscriptions(agent_id)
+
+    async def _restore_subscriptions(self, agent_id: str):
+        topics = self._topics.get(agent_id)
+        if not topics:
+            self._unrestored.discard(agent_id)
+            return
+        try:
+            await self.request("POST", "/subscribe", json={"agent_id": agent_id, "topics": topics})
+        except Exception as e:
+            self._unrestored.add(agent_id)
+            logger.error(f"恢复代理 {agent_id} 的 {len(topics)} 个订阅失败: {str(e)}")
+            return
+        self._unrestored.discard(agent_id)
+
+    async def _heartbeat_loop(self):
+        """每隔三分之一个租约时长批量续约一次"""
+        while not self._closed:
+            await asyncio.sleep(self._lease_ttl / 3)
+            if self._unrestored:
+                await asyncio.gather(*(self._restore_subscriptions(agent_id) for agent_id in list(self._unrestored)))
+            agent_ids = list(self._leases)
+            for start in range(0, len(agent_ids), self.register_batch_size):
+                chunk = agent_ids[start:start + self.register_batch_size]
+                try:
+                    result = await self.request("POST", "/heartbeat", json={"agent_ids": chunk})
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"批量续约 {len(chunk)} 个代理失败: {str(e)}")
+                    continue
+                # 租约已过期的代理重新注册并恢复订阅（失败时已记录日志，下次心跳会重试）
+                expired = [agent_id for agent_id in result["unknown"] if agent_id in self._leases]
+                if expired:
+                    logger.warning(f"{len(expired)} 个代理的租约已过期，重新注册")
+                    await asyncio.gather(
+                        *(self._reregister(agent_id) for agent_id in expired),
+                        return_exceptions=True
+                    )
+
+    def expect_reply(self, correlation_id: str) -> asyncio.Future:
+        """登记一个等待响应的调用，响应到达时 future 的结果为响应消息"""
+        future = self._calls[correlation_id] = asyncio.get_running_loop().create_future()
+        return future
+
+    def forget_reply(self, correlation_id: str):
+        self._calls.pop(correlation_id, None)
+
+    def subscribe(self, agent_id: str) -> asyncio.Queue:
+        """开始为代理接收消息，返回其本地消息队列"""
+        queue = self._queues.get(agent_id)
+        if queue is not None:
+            return queue
+        queue = self._queues[agent_id] = asyncio.Queue()
+        if agent_id in self._polled:
+            return queue
+        # 同一时间窗口内的订阅合并成一组，每组启动一个轮询循环
+        self._polled.add(agent_id)
+        self._pending_subscriptions.append(agent_id)
+        if self._subscribe_task is None:
+            self._subscribe_task = asyncio.create_task(self._start_poll_groups())
+        return queue
+
+    def unsubscribe(self, agent_id: str):
+        self._queues.pop(agent_id, None)
+
+    async def _start_poll_groups(self):
+        await asyncio.sleep(self.register_delay)
+        self._subscribe_task = None
+        pending, self._pending_subscriptions = self._pending_subscriptions, []
+        for start in range(0, len(pending), self.poll_group_size):
+            group = pending[start:start + self.poll_group_size]
+            self._poll_tasks.append(asyncio.create_task(self._poll_loop(group)))
+
+    async def _poll_loop(self, group: List[str]):
+        """一组代理共用的长轮询循环"""
+        while not self._closed:
+            agent_ids = [agent_id for agent_id in group if agent_id in self._queues]
+            if not agent_ids:
+                self._polled.difference_update(group)
+                return
+            try:
+                result = await self.request("POST", "/inboxes/poll", json={
+                    "agent_ids": agent_ids,
+                    "timeout": self.poll_timeout
+                })
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"轮询收件箱失败: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            for agent_id, messages in result["messages"].items():
+                if self._calls:
+                    messages = self._dispatch_replies(messages)
+                queue = self._queues.get(agent_id)
+                if queue is None:
+                    if messages:
+                        logger.warning(f"代理 {agent_id} 已停止接收，丢弃 {len(messages)} 条消息")
+                    continue
+                for message in messages:
+                    queue.put_nowait(message)
+            # 尚未完成注册的代理会出现在 unknown 中，稍后重试即可
+            if result["unknown"] and not result["messages"]:
+                await asyncio.sleep(0.1)
+
+
+    def _dispatch_replies(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """把响应交给等待的调用，返回其余消息"""
+        remaining = []
+        for message in messages:
+            future = self._calls.pop(message.get("in_reply_to"), None)
+            if future is None:
+                remaining.append(message)
+            elif not future.done():
+                future.set_result(message)
+        return remaining
+
+
+class AsyncAIXPAgent:
+    """AIXPAgent 的异步版本
+
+    构造时不做任何网络请求，首次使用时才（批量）注册；多个代理可以共享同一个 AIXPConnection。
+    """
+
+    def __init__(self, agent_id: str, capabilities: List[str],
+                 connection: Optional[AIXPConnection] = None,
+                 server_url: str = "http://127.0.0.1:9000", encoding: str = "json"):
+        self.agent_id = agent_id
+        self.capabilities = capabilities
+        self._owns_connection = connection is None
+        # 共享连接时使用连接的编码
+        self.connection = connection or AIXPConnection(server_url, encoding=encoding)
+        self._registration: Optional[asyncio.Future] = None
+
+    async def __aenter__(self) -> "AsyncAIXPAgent":
+        await self.register()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """停止接收消息和续约；代理独占连接时一并关闭连接"""
+        self.connection.unsubscribe(self.agent_id)
+        self.connection.release(self.agent_id)
+        if self._owns_connection:
+            await self.connection.close()
+
+    async def register(self):
+        """向服务器注册代理（多次调用只注册一次）"""
+        if self._registration is None:
+            self._registration = asyncio.ensure_future(
+                self.connection.register(self.agent_id, self.capabilities)
+            )
+        try:
+            await asyncio.shield(self._registration)
+        except Exception:
+            # 注册失败后允许重试
+            self._registration = None
+            raise
+
+    async def send_message(self, receiver_id: str, task: str, data: Dict[str, Any],
+                           correlation_id: Optional[str] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """发送消息给其他代理；指定 correlation_id 或 timeout 时作为一次调用发送（通常直接使用 call()）"""
+        await self.register()
+        logger.debug(f"代理 {self.agent_id} 发送消息给 {receiver_id}: {task}")
+        message = {"sender_id": self.agent_id, "receiver_id": receiver_id, "task": task, "data": data}
+        if correlation_id is not None:
+            message["correlation_id"] = correlation_id
+        if timeout is not None:
+            message["timeout"] = timeout
+        return await self.connection.send("/send_message", message)
+
+    async def call(self, receiver_id: Optional[str], task: str, data: Dict[str, Any], timeout: float = 30.0,
+                   capability: Optional[str] = None, **options) -> Dict[str, Any]:
+        """发起请求/响应调用并等待响应消息
+
+        receiver_id 为 None 时按 capability 路由。超时由服务器计时，到期抛出 CallTimeout，
+        错误响应抛出 CallError。多个调用可以用 asyncio.gather 同时进行，共用连接的轮询循环接收响应。
+        """
+        await self.register()
+        self.connection.subscribe(self.agent_id)
+        correlation_id = uuid.uuid4().hex
+        future = self.connection.expect_reply(correlation_id)
+        message = {
+            "sender_id": self.agent_id,
+            "task": task,
+            "data": data,
+            "correlation_id": correlation_id,
+            "timeout": timeout,
+            **options
+        }
+        if receiver_id is not None:
+            message["receiver_id"] = receiver_id
+        else:
+            message["capability"] = capability
+        try:
+            await self.connection.send("/send_message", message)
+            # 服务器负责超时；本地多等一个轮询周期，防止服务器不可达时永远等待
+            try:
+                reply = await asyncio.wait_for(future, timeout + self.connection.poll_timeout)
+            except asyncio.TimeoutError:
+                raise CallTimeout(f"Call {correlation_id} timed out")
+            return reply_result(reply)
+        finally:
+            self.connection.forget_reply(correlation_id)
+
+    async def reply(self, request: Dict[str, Any], data: Dict[str, Any], error: Optional[str] = None) -> Dict[str, Any]:
+        """响应收到的调用，服务器把响应路由回调用方"""
+        message = {
+            "sender_id": self.agent_id,
+            "task": request["task"],
+            "data": data,
+            "in_reply_to": request["correlation_id"]
+        }
+        if error is not None:
+            message["error"] = error
+        return await self.connection.send("/send_message", message)
+
+    def runtime(self, executor: str = "asyncio", **options) -> AgentRuntime:
+        """创建任务处理运行时（在本代理所在的事件循环中 await runtime.serve()），见 AIXPAgent.runtime"""
+        return AgentRuntime(self, executor=executor, **options)
+
+    async def send_to_capability(self, capability: str, task: str, data: Dict[str, Any],
+                                 routing: Optional[str] = None,
+                                 route_key: Optional[str] = None) -> Dict[str, Any]:
+        """发送消息给任意一个具备指定能力的代理"""
+        await self.register()
+        message = {"sender_id": self.agent_id, "capability": capability, "task": task, "data": data}
+        if routing is not None:
+            message["routing"] = routing
+        if route_key is not None:
+            message["route_key"] = route_key
+        return await self.connection.send("/send_message", message)
+
+    async def subscribe(self, *topics: str) -> List[str]:
+        """订阅主题模式，返回当前的全部订阅"""
+        await self.register()
+        result = await self.connection.request("POST", "/subscribe", {"agent_id": self.agent_id, "topics": list(topics)})
+        self.connection.track_subscriptions(self.agent_id, result["subscriptions"])
+        return result["subscriptions"]
+
+    async def unsubscribe(self, *topics: str) -> List[str]:
+        """取消订阅（不指定主题时取消全部订阅），返回剩余的订阅"""
+        await self.register()
+        body = {"agent_id": self.agent_id, "topics": list(topics) if topics else None}
+        result = await self.connection.request("POST", "/unsubscribe", body)
+        self.connection.track_subscriptions(self.agent_id, result["subscriptions"])
+        return result["subscriptions"]
+
+    async def publish(self, topic: str, task: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """向主题发布消息，一次请求投递给所有订阅方"""
+        await self.register()
+        return await self.connection.send(
+            "/publish", {"sender_id": self.agent_id, "topic": topic, "task": task, "data": data}
+        )
+
+    async def send_many(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量发送消息，一次 HTTP 请求"""
+        await self.register()
+        batch = [dict(message, sender_id=self.agent_id) for message in messages]
+        return await self.connection.send("/send_messages", batch)
+
+    async def get_registered_agents(self) -> Dict[str, List[str]]:
+        """获取所有注册的代理列表"""
+        return await self.connection.request("GET", "/agents")
+
+    async def find_agents(self, capability: str, limit: Optional[int] = None,
+                          page_size: int = 100) -> List[Dict[str, Any]]:
+        """查找具备指定能力的代理，最多返回 limit 个（默认全部）"""
+        agents: List[Dict[str, Any]] = []
+        cursor = None
+        while limit is None or len(agents) < limit:
+            params = {"capability": capability, "limit": page_size}
+            if limit is not None:
+                params["limit"] = min(page_size, limit - len(agents))
+            if cursor is not None:
+                params["cursor"] = cursor
+            page = await self.connection.request("GET", "/agents", params=params)
+            agents.extend(page["agents"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        return agents
+
+    async def receive(self, max_messages: int = 100, timeout: float = 30.0) -> List[Dict[str, Any]]:
+        """接收消息，没有消息时最多等待 timeout 秒"""
+        await self.register()
+        queue = self.connection.subscribe(self.agent_id)
+        messages = []
+        if queue.empty():
+            try:
+                messages.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                return messages
+        while len(messages) < max_messages and not queue.empty():
+            messages.append(queue.get_nowait())
+        return messages
+
+    async def iter_messages(self) -> AsyncIterator[Dict[str, Any]]:
+        """持续接收消息的异步迭代器"""
+        await self.register()
+        queue = self.connection.subscribe(self.agent_id)
+        while True:
+            yield await queue.get()
@@ -0,0 +1,406 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import codec
+from inbox import Inbox, InboxFull, InboxRegistry
+
+logger = logging.getLogger(__name__)
+
+# 集群事件：(事件类型, 历史记录条目)，事件类型为 agent_registered、agent_removed、
+# topic_subscribed、topic_unsubscribed 或 message
+Event = Tuple[str, Dict[str, Any]]
+
+
+class BackendBusy(Exception):
+    """共享后端在 busy_timeout 内没有取得写锁（其他工作进程正在写入），请求应稍后重试"""
+
+
+class Backend:
+    """共享状态与发布/订阅后端
+
+    服务器的注册表、消息历史和仪表盘事件流是每个工作进程本地的视图，
+    由后端按全局顺序投递的事件（包括本进程发布的事件）驱动更新；
+    收件箱则直接存放在后端中，任何工作进程都可以投递和取出。
+    """
+
+    inboxes: InboxRegistry
+
+    def bind(self, on_events: Callable[[List[Event]], None]):
+        """设置事件回调：每批事件按全局顺序传给回调"""
+        self._on_events = on_events
+
+    def load_state(self) -> Tuple[Dict[str, List[str]], List[Dict[str, Any]]]:
+        """启动时加载已有状态：(agent_id -> 能力列表, 最近的历史记录条目)"""
+        return {}, []
+
+    def load_subscriptions(self) -> Dict[str, List[str]]:
+        """启动时加载已有的主题订阅：agent_id -> 订阅模式列表"""
+        return {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish(self, events: List[Event]):
+        """发布一批事件，返回前本进程已应用这些事件"""
+        raise NotImplementedError
+
+    def refresh(self):
+        """立即拉取其他工作进程发布的事件（读取前调用以获得最新视图）"""
+
+    def renew(self, leases: Dict[str, float]):
+        """记录续约后的到期时间（agent_id -> 到期时间），供其他工作进程判断租约是否真的过期"""
+
+    def claim_expired(self, agent_ids: List[str], now: float) -> Tuple[List[str], Dict[str, float]]:
+        """确认本地租约已到期的代理
+
+        返回 (确实过期、由本进程负责发布注销事件的代理, 已在其他工作进程续约的代理 -> 新的到期时间)。
+        """
+        return agent_ids, {}
+
+
+class InMemoryBackend(Backend):
+    """进程内后端：所有状态只存在于当前进程，适用于单工作进程部署"""
+
+    def __init__(self, inbox_size: int = 1000):
+        self.inboxes = InboxRegistry(maxsize=inbox_size)
+
+    def publish(self, events: List[Event]):
+        if events:
+            self._on_events(events)
+
+
+class SqliteBackend(Backend):
+    """基于 SQLite（WAL 模式）的共享后端
+
+    同一台机器上的多个工作进程共享一个数据库文件：
+    - agents 表保存注册表，subscriptions 表保存主题订阅，启动时加载
+    - events 表是全局有序的事件日志，每个进程按自增 id 追踪并应用新事件，实现发布/订阅
+    - inbox 表保存所有代理的收件箱，取消息在写事务中完成，保证每条消息只被取出一次
+    新消息事件到达时唤醒本进程中等待对应收件箱的长轮询和推送连接。
+    """
+
+    def __init__(self, path: str, inbox_size: int = 1000, poll_interval: float = 0.02,
+                 event_retention: int = 100000, history_size: int = 1000, busy_timeout: float = 0.1):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.event_retention = event_retention
+        self.history_size = history_size
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # 所有读写都在事件循环中同步执行：写锁被占用时只短暂等待，超时后抛出 BackendBusy，
+        # 避免一个被阻塞的写入拖住本进程的全部请求
+        self.conn.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS agents (
+                agent_id TEXT PRIMARY KEY,
+                capabilities TEXT NOT NULL,
+                expires_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS inbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                agent_id TEXT NOT NULL,
+                message TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS inbox_agent ON inbox (agent_id, id);
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                agent_id TEXT NOT NULL,
+                pattern TEXT NOT NULL,
+                PRIMARY KEY (agent_id, pattern)
+            );
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(agents)")]
+        if "expires_at" not in columns:
+            self.conn.execute("ALTER TABLE agents ADD COLUMN expires_at REAL")
+        self.inboxes = SharedInboxRegistry(self, maxsize=inbox_size)
+        self.last_event_id = 0
+        self._poll_task: Optional[asyncio.Task] = None
+        self._polls = 0
+
+    @contextmanager
+    def transaction(self):
+        """写事务：BEGIN IMMEDIATE 立即获取写锁，避免多个进程的读后写冲突
+
+        在 busy_timeout 内取不到锁时抛出 BackendBusy。
+        """
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            raise BackendBusy(str(e)) from e
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        try:
+            self.conn.execute("COMMIT")
+        except sqlite3.OperationalError as e:
+            self.conn.execute("ROLLBACK")
+            raise BackendBusy(str(e)) from e
+
+    def load_state(self):
+        agents = {
+            agent_id: json.loads(capabilities)
+            for agent_id, capabilities in self.conn.execute("SELECT agent_id, capabilities FROM agents")
+        }
+        rows = self.conn.execute(
+            "SELECT id, data FROM events ORDER BY id DESC LIMIT ?", (self.history_size,)
+        ).fetchall()
+        self.last_event_id = rows[0][0] if rows else 0
+        history = [codec.loads_json(data) for _, data in reversed(rows)]
+        return agents, history
+
+    def load_subscriptions(self):
+        subscriptions: Dict[str, List[str]] = {}
+        for agent_id, pattern in self.conn.execute("SELECT agent_id, pattern FROM subscriptions"):
+            subscriptions.setdefault(agent_id, []).append(pattern)
+        return subscriptions
+
+    async def start(self):
+        self._poll_task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            await asyncio.gather(self._poll_task, return_exceptions=True)
+        self.conn.close()
+
+    def publish(self, events: List[Event]):
+        if not events:
+            return
+        with self.transaction() as conn:
+            for event_type, entry in events:
+                if event_type == "agent_registered":
+                    ttl = entry["data"].get("ttl")
+                    conn.execute(
+                        "INSERT OR REPLACE INTO agents (agent_id, capabilities, expires_at) VALUES (?, ?, ?)",
+                        (entry["data"]["agent_id"], json.dumps(entry["data"]["capabilities"]),
+                         time.time() + ttl if ttl else None)
+                    )
+                elif event_type == "agent_removed":
+                    for agent_id in entry["data"]["agent_ids"]:
+                        conn.execute("DELETE FROM agents WHERE agent_id = ?", (agent_id,))
+                        conn.execute("DELETE FROM inbox WHERE agent_id = ?", (agent_id,))
+                        conn.execute("DELETE FROM subscriptions WHERE agent_id = ?", (agent_id,))
+                elif event_type == "topic_subscribed":
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO subscriptions (agent_id, pattern) VALUES (?, ?)",
+                        [(entry["data"]["agent_id"], pattern) for pattern in entry["data"]["topics"]]
+                    )
+                elif event_type == "topic_unsubscribed":
+                    conn.executemany(
+                        "DELETE FROM subscriptions WHERE agent_id = ? AND pattern = ?",
+                        [(entry["data"]["agent_id"], pattern) for pattern in entry["data"]["topics"]]
+                    )
+                conn.execute(
+                    "INSERT INTO events (type, data) VALUES (?, ?)",
+                    (event_type, codec.dumps_json(entry))
+                )
+        # 立即应用，保证本进程读到自己刚写入的状态
+        self.refresh()
+
+    def refresh(self):
+        rows = self.conn.execute(
+            "SELECT id, type, data FROM events WHERE id > ? ORDER BY id", (self.last_event_id,)
+        ).fetchall()
+        if not rows:
+            return
+        if rows[0][0] > self.last_event_id + 1 and self.last_event_id:
+            oldest = self.conn.execute("SELECT MIN(id) FROM events").fetchone()[0]
+            if oldest > self.last_event_id + 1:
+                logger.error(f"Worker fell behind the shared event log ({self.last_event_id} < {oldest - 1})")
+        self.last_event_id = rows[-1][0]
+        events = [(event_type, codec.loads_json(data)) for _, event_type, data in rows]
+        self._on_events(events)
+        for event_type, entry in events:
+            if event_type == "message":
+                self.inboxes.notify(entry["receiver_id"])
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                self.refresh()
+                self._polls += 1
+                if self._polls % 1000 == 0:
+                    self._trim_events()
+            except Exception as e:
+                logger.error(f"Error polling shared event log: {str(e)}")
+
+    def renew(self, leases: Dict[str, float]):
+        if not leases:
+            return
+        with self.transaction() as conn:
+            conn.executemany(
+                "UPDATE agents SET expires_at = ? WHERE agent_id = ?",
+                [(expires_at, agent_id) for agent_id, expires_at in leases.items()]
+            )
+
+    def claim_expired(self, agent_ids, now):
+        claimed = []
+        renewed = {}
+        with self.transaction() as conn:
+            for agent_id in agent_ids:
+                # 多个工作进程可能同时发现同一个代理过期，只有删除成功的进程发布注销事件
+                row = conn.execute(
+                    "DELETE FROM agents WHERE agent_id = ? AND expires_at <= ? RETURNING agent_id",
+                    (agent_id, now)
+                ).fetchone()
+                if row is not None:
+                    claimed.append(agent_id)
+                    continue
+                row = conn.execute("SELECT expires_at FROM agents WHERE agent_id = ?", (agent_id,)).fetchone()
+                if row is not None and row[0] is not None:
+                    renewed[agent_id] = row[0]
+        return claimed, renewed
+
+    def _trim_events(self):
+        """只保留最近 event_retention 个事件"""
+        self.conn.execute(
+            "DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?", (self.event_retention,)
+        )
+
+    # 收件箱存储
+
+    def push(self, agent_id: str, message: Dict[str, Any], maxsize: int):
+        with self.transaction() as conn:
+            if self.depth(agent_id) >= maxsize:
+                raise InboxFull(f"Inbox is full ({maxsize} messages)")
+            conn.execute(
+                "INSERT INTO inbox (agent_id, message) VALUES (?, ?)",
+                (agent_id, codec.dumps_json(message))
+            )
+
+    def push_many(self, agent_ids: List[str], message: Dict[str, Any], maxsize: int) -> Tuple[List[str], List[str]]:
+        """在一个事务中把同一条消息投递到多个收件箱，消息只编码一次"""
+        data = codec.dumps_json(message)
+        delivered = []
+        full = []
+        with self.transaction() as conn:
+            for agent_id in agent_ids:
+                if self.depth(agent_id) >= maxsize:
+                    full.append(agent_id)
+                else:
+                    delivered.append(agent_id)
+            conn.executemany("INSERT INTO inbox (agent_id, message) VALUES (?, ?)",
+                             [(agent_id, data) for agent_id in delivered])
+        return delivered, full
+
+    def pop(self, agent_ids: List[str], max_messages: int) -> Dict[str, List[Dict[str, Any]]]:
+        """原子地取出每个代理至多 max_messages 条消息"""
+        if not agent_ids:
+            return {}
+        placeholders = ",".join("?" * len(agent_ids))
+        with self.transaction() as conn:
+            rows = conn.execute(f"""
+                SELECT id, agent_id, message FROM (
+                    SELECT id, agent_id, message,
+                           ROW_NUMBER() OVER (PARTITION BY agent_id ORDER BY id) AS rank
+                    FROM inbox WHERE agent_id IN ({placeholders})
+                ) WHERE rank <= ? ORDER BY id
+            """, (*agent_ids, max_messages)).fetchall()
+            if rows:
+                conn.executemany("DELETE FROM inbox WHERE id = ?", [(row[0],) for row in rows])
+        messages: Dict[str, List[Dict[str, Any]]] = {}
+        for _, agent_id, message in rows:
+            messages.setdefault(agent_id, []).append(codec.loads_json(message))
+        return messages
+
+    def depth(self, agent_id: str) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM inbox WHERE agent_id = ?", (agent_id,)).fetchone()[0]
+
+
+class SharedInbox(Inbox):
+    """存放在 SqliteBackend 中的收件箱，本地只保留等待者"""
+
+    def __init__(self, store: SqliteBackend, agent_id: str, maxsize: int):
+        super().__init__(maxsize)
+        self.store = store
+        self.agent_id = agent_id
+
+    def __len__(self) -> int:
+        return self.store.depth(self.agent_id)
+
+    def put(self, message: Dict[str, Any]):
+        self.store.push(self.agent_id, message, self.maxsize)
+        self._wake()
+
+    def get_nowait(self, max_messages: int) -> List[Dict[str, Any]]:
+        return self.store.pop([self.agent_id], max_messages).get(self.agent_id, [])
+
+    def notify(self):
+        self._wake()
+
+
+class SharedInboxRegistry(InboxRegistry):
+    """SqliteBackend 的收件箱集合，接口与 InboxRegistry 相同"""
+
+    def __init__(self, store: SqliteBackend, maxsize: int = 1000):
+        super().__init__(maxsize)
+        self.store = store
+
+    def _new_inbox(self, agent_id: str) -> Inbox:
+        return SharedInbox(self.store, agent_id, self.maxsize)
+
+    def depth(self, agent_id: str) -> int:
+        return self.store.depth(agent_id)
+
+    def total_depth(self) -> int:
+        return self.store.conn.execute("SELECT COUNT(*) FROM inbox").fetchone()[0]
+
+    def put_many(self, agent_ids, message):
+        delivered, full = self.store.push_many(
+            [agent_id for agent_id in agent_ids if agent_id in self._inboxes], message, self.maxsize
+        )
+        for agent_id in delivered:
+            self._inboxes[agent_id].notify()
+        return delivered, full
+
+    def notify(self, agent_id: str):
+        """其他工作进程向 agent_id 投递了消息"""
+        inbox = self._inboxes.get(agent_id)
+        if inbox is not None:
+            inbox.notify()
+
+    async def get_many(self, agent_ids, max_messages, timeout):
+        known = [agent_id for agent_id in agent_ids if agent_id in self._inboxes]
+        unknown = [agent_id for agent_id in agent_ids if agent_id not in self._inboxes]
+        messages = self.store.pop(known, max_messages)
+        if messages or timeout == 0 or not known:
+            return messages, unknown
+        waiter = asyncio.get_running_loop().create_future()
+        targets = [self._inboxes[agent_id] for agent_id in known]
+        for inbox in targets:
+            inbox.add_waiter(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for inbox in targets:
+                inbox.discard_waiter(waiter)
+        return self.store.pop(known, max_messages), unknown
+
+
+def create_backend(name: str, inbox_size: int, sqlite_path: str, poll_interval: float,
+                   history_size: int, busy_timeout: float = 0.1) -> Backend:
+    """按名称创建后端：memory（默认）或 sqlite"""
+    if name == "memory":
+        return InMemoryBackend(inbox_size=inbox_size)
+    if name == "sqlite":
+        return SqliteBackend(sqlite_path, inbox_size=inbox_size, poll_interval=poll_interval,
+                             history_size=history_size, busy_timeout=busy_timeout)
+    raise ValueError(f"Unknown backend: {name}")
@@ -0,0 +1,316 @@
+"""AIXP 服务器负载生成与延迟基准测试
+
+示例：
+    python benchmark.py --agents 200 --messages 5000 --rate 1000 --payload-size 256 --dashboards 5 --output result.json
+
+默认在本机随机端口启动一个 server.py 子进程；使用 --url 测试已运行的服务器，
+或使用 --in-process 在当前进程的后台线程中启动服务器。
+结果（吞吐量与 p50/p95/p99 延迟）以 JSON 输出，便于在版本之间比较。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+import codec
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+logger = logging.getLogger("benchmark")
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, Any]:
+    """汇总延迟样本（秒），返回吞吐量和毫秒级分位数"""
+    samples = sorted(latencies)
+    count = len(samples)
+
+    def percentile(p: float) -> Optional[float]:
+        if not samples:
+            return None
+        # 最近秩法
+        rank = max(1, math.ceil(p / 100.0 * count))
+        return round(samples[rank - 1] * 1000, 3)
+
+    return {
+        "count": count,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(count / elapsed, 1) if elapsed > 0 else None,
+        "mean_ms": round(sum(samples) / count * 1000, 3) if samples else None,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": round(samples[-1] * 1000, 3) if samples else None,
+    }
+
+
+class ServerProcess:
+    """在本机随机端口启动 server.py"""
+
+    def __init__(self, in_process: bool = False):
+        self.in_process = in_process
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._process = None
+        self._server = None
+
+    def __enter__(self) -> "ServerProcess":
+        here = os.path.dirname(os.path.abspath(__file__))
+        if self.in_process:
+            import uvicorn
+            sys.path.insert(0, here)
+            import server
+            config = uvicorn.Config(server.app, host="127.0.0.1", port=self.port, log_level="warning")
+            self._server = uvicorn.Server(config)
+            threading.Thread(target=self._server.run, daemon=True).start()
+        else:
+            self._process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "server:app",
+                 "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning"],
+                cwd=here,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+        _wait_for_port(self.port)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._server is not None:
+            self._server.should_exit = True
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait(timeout=10)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+class DashboardClient:
+    """模拟仪表盘：订阅 /ws，记录每条消息事件的到达时间"""
+
+    def __init__(self, url: str, sent_at: Dict[str, float], media: str = codec.JSON, compression: bool = True):
+        self.url = url.replace("http://", "ws://") + "/ws"
+        if media == codec.MSGPACK:
+            self.url += "?encoding=msgpack"
+        self.media = media
+        self.compression = compression
+        self.sent_at = sent_at
+        self.latencies: List[float] = []
+        self.ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        # 默认协商 permessage-deflate
+        compression = "deflate" if self.compression else None
+        async with websockets.connect(self.url, max_size=None, compression=compression) as ws:
+            async for frame in ws:
+                now = time.perf_counter()
+                event = codec.decode(frame, self.media)
+                if event["event"] == "snapshot":
+                    self.ready.set()
+                    continue
+                for item in event.get("events", [event]):
+                    if item["event"] != "message":
+                        continue
+                    started = self.sent_at.get(item["data"]["data"].get("bench_id"))
+                    if started is not None:
+                        self.latencies.append(now - started)
+
+
+async def run_benchmark(url: str, agents: int, messages: int, rate: float, payload_size: int,
+                        dashboards: int, concurrency: int, encoding: str = "json",
+                        compression: bool = True) -> Dict[str, Any]:
+    media = codec.encoding_name(encoding)
+    headers = {"Content-Type": media, "Accept": media}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60, trust_env=False) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        run_id = uuid.uuid4().hex[:8]
+        agent_ids = [f"bench_{run_id}_{i}" for i in range(agents)]
+
+        # 仪表盘客户端
+        sent_at: Dict[str, float] = {}
+        clients: List[DashboardClient] = []
+        if dashboards:
+            if websockets is None:
+                logger.warning("websockets is not installed, skipping dashboard clients")
+            else:
+                clients = [DashboardClient(url, sent_at, media, compression) for _ in range(dashboards)]
+                for dashboard in clients:
+                    dashboard.start()
+                await asyncio.wait_for(asyncio.gather(*(d.ready.wait() for d in clients)), 30)
+
+        # 注册
+        register_latencies: List[float] = []
+        register_errors = 0
+
+        async def register(agent_id: str):
+            nonlocal register_errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/register", json={"agent_id": agent_id, "capabilities": ["benchmark"]})
+                if response.status_code == 200:
+                    register_latencies.append(time.perf_counter() - started)
+                else:
+                    register_errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(register(agent_id) for agent_id in agent_ids))
+        register_result = summarize(register_latencies, time.perf_counter() - started, register_errors)
+
+        # 发送：按目标速率开环发送，速率为 0 时尽可能快
+        payload = "x" * payload_size
+        send_latencies: List[float] = []
+        send_errors = 0
+        send_throttled = 0
+
+        async def send(i: int):
+            nonlocal send_errors, send_throttled
+            bench_id = f"{run_id}-{i}"
+            body = {
+                "sender_id": agent_ids[i % agents],
+                "receiver_id": agent_ids[(i + 1) % agents],
+                "task": "benchmark",
+                "data": {"bench_id": bench_id, "payload": payload}
+            }
+            async with semaphore:
+                begin = time.perf_counter()
+                sent_at[bench_id] = begin
+                response = await client.post("/send_message", content=codec.encode(body, media), headers=headers)
+                if response.status_code == 200:
+                    send_latencies.append(time.perf_counter() - begin)
+                else:
+                    send_errors += 1
+                    if response.status_code == 429:
+                        send_throttled += 1
+
+        tasks = []
+        started = time.perf_counter()
+        for i in range(messages):
+            if rate > 0:
+                delay = started + i / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(i)))
+        await asyncio.gather(*tasks)
+        send_result = summarize(send_latencies, time.perf_counter() - started, send_errors)
+        # 其中被准入控制拒绝（429）的请求数
+        send_result["throttled"] = send_throttled
+
+        # 等待仪表盘收到剩余事件
+        broadcast_result = None
+        if clients:
+            deadline = time.monotonic() + 10
+            expected = len(send_latencies)
+            while time.monotonic() < deadline and any(len(d.latencies) < expected for d in clients):
+                await asyncio.sleep(0.05)
+            for dashboard in clients:
+                await dashboard.stop()
+            latencies = [latency for dashboard in clients for latency in dashboard.latencies]
+            broadcast_result = summarize(latencies, time.perf_counter() - started)
+            broadcast_result["missing"] = expected * len(clients) - len(latencies)
+            # 服务器端的序列化耗时与写入耗时
+            response = await client.get("/broadcaster/stats")
+            if response.status_code == 200:
+                stats = response.json()
+                for key in ("frames_encoded", "encoded_size", "encode_seconds", "total_sent_size", "total_write_seconds"):
+                    broadcast_result[key] = stats.get(key)
+
+        # 清理测试代理
+        await asyncio.gather(*(client.delete(f"/agents/{agent_id}") for agent_id in agent_ids))
+
+    return {
+        "register": register_result,
+        "send": send_result,
+        "broadcast_to_dashboard": broadcast_result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AIXP 服务器基准测试")
+    parser.add_argument("--url", help="已运行的服务器地址；不指定时在本机启动一个")
+    parser.add_argument("--in-process", action="store_true", help="在当前进程的后台线程中启动服务器")
+    parser.add_argument("--agents", type=int, default=100, help="注册的代理数")
+    parser.add_argument("--messages", type=int, default=2000, help="发送的消息数")
+    parser.add_argument("--rate", type=float, default=0, help="目标发送速率（条/秒），0 表示尽可能快")
+    parser.add_argument("--payload-size", type=int, default=128, help="每条消息的负载字节数")
+    parser.add_argument("--dashboards", type=int, default=1, help="仪表盘 WebSocket 客户端数")
+    parser.add_argument("--concurrency", type=int, default=32, help="最大并发请求数")
+    parser.add_argument("--encoding", choices=["json", "msgpack"], default="json", help="消息和仪表盘事件的编码")
+    parser.add_argument("--no-compression", action="store_true", help="仪表盘客户端不协商 permessage-deflate")
+    parser.add_argument("--output", help="结果 JSON 文件路径，默认输出到标准输出")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # 每个请求一行的 httpx 日志会干扰测量
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    params = {key: value for key, value in vars(args).items() if key != "output"}
+
+    def run(url: str) -> Dict[str, Any]:
+        return asyncio.run(run_benchmark(
+            url, args.agents, args.messages, args.rate, args.payload_size, args.dashboards, args.concurrency,
+            args.encoding, not args.no_compression
+        ))
+
+    if args.url:
+        results = run(args.url)
+    else:
+        with ServerProcess(in_process=args.in_process) as server:
+            results = run(server.url)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        logger.info(f"Results written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+# 消息 data 中引用大对象的字段：{"$blob": 摘要, "size": 字节数, "content_type": 媒体类型}
+BLOB_KEY = "$blob"
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+# 单个字节区间：first-last、first-、-suffix，均为无符号十进制数
+_BYTE_RANGE = re.compile(r"(\d*)-(\d*)", re.ASCII)
+
+
+class BlobNotFound(Exception):
+    """大对象不存在"""
+
+
+class BlobTooLarge(Exception):
+    """大对象超过大小上限"""
+
+
+class DigestMismatch(Exception):
+    """上传内容与声明的摘要不一致"""
+
+
+class RangeNotSatisfiable(Exception):
+    """Range 请求超出对象大小"""
+
+
+def is_reference(value: Any) -> bool:
+    return isinstance(value, dict) and isinstance(value.get(BLOB_KEY), str)
+
+
+def references(data: Dict[str, Any]) -> Iterator[str]:
+    """消息 data 顶层字段中引用的大对象摘要"""
+    for value in data.values():
+        if is_reference(value):
+            yield value[BLOB_KEY]
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """解析单个 Range（bytes=a-b、bytes=a-、bytes=-n），返回闭区间 (start, end)
+
+    没有 Range 头、不是 bytes 单位、包含多个区间或语法不合法（如 last < first）时返回 None（按整个对象响应）；
+    区间与对象没有交集（包括空对象）时抛出 RangeNotSatisfiable。
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    match = _BYTE_RANGE.fullmatch(header[6:].strip())
+    if match is None or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # 最后 n 个字节
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+class BlobStore:
+    """内容寻址的本地大对象存储
+
+    上传内容边接收边计算 SHA-256 并写入临时文件，完成后按摘要改名为 root/<前两位>/<摘要>；
+    相同内容只保存一份。消息中只携带引用，接收方按需（可分段）读取，
+    大对象因此不会进入消息历史、持久化日志和仪表盘广播。
+    多个工作进程共用同一目录即可共享大对象。
+    """
+
+    def __init__(self, root: str, max_size: int = 0, chunk_size: int = 1 << 20):
+        self.root = root
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+
+    def path(self, digest: str) -> str:
+        if not _DIGEST.match(digest):
+            raise BlobNotFound(f"Invalid blob digest: {digest}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def touch(self, digest: str) -> bool:
+        """刷新大对象的修改时间（被消息引用时调用，推迟清理），不存在时返回 False"""
+        try:
+            os.utime(self.path(digest))
+            return True
+        except (BlobNotFound, OSError):
+            return False
+
+    def stat(self, digest: str) -> Dict[str, Any]:
+        """返回大对象的引用（摘要、大小和媒体类型）"""
+        path = self.path(digest)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            raise BlobNotFound(f"Blob {digest} not found")
+        content_type = "application/octet-stream"
+        try:
+            with open(path + ".meta", encoding="utf-8") as f:
+                content_type = json.load(f).get("content_type", content_type)
+        except (OSError, ValueError):
+            pass
+        return {BLOB_KEY: digest, "size": size, "content_type": content_type}
+
+    async def write(self, chunks: AsyncIterator[bytes], content_type: str = "application/octet-stream",
+                    expected: Optional[str] = None) -> Dict[str, Any]:
+        """流式写入大对象并返回引用；expected 为声明的摘要，不一致时抛出 DigestMismatch
+
+        文件写入和摘要计算在线程池中按 chunk_size 批量进行，不阻塞事件循环。
+        """
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+        hasher = hashlib.sha256()
+        size = 0
+        pending = []
+        pending_size = 0
+        f = open(tmp_path, "wb")
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if self.max_size and size > self.max_size:
+                    raise BlobTooLarge(f"Blob exceeds {self.max_size} bytes")
+                pending.append(chunk)
+                pending_size += len(chunk)
+                if pending_size >= self.chunk_size:
+                    await asyncio.to_thread(self._write_chunk, f, hasher, b"".join(pending))
+                    pending.clear()
+                    pending_size = 0
+            if pending:
+                await asyncio.to_thread(self._write_chunk, f, hasher, b"".join(pending))
+            f.close()
+            digest = hasher.hexdigest()
+            if expected and expected != digest:
+                raise DigestMismatch(f"Content digest {digest} does not match {expected}")
+            await asyncio.to_thread(self._commit, tmp_path, digest, content_type)
+        except BaseException:
+            f.close()
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return {BLOB_KEY: digest, "size": size, "content_type": content_type}
+
+    @staticmethod
+    def _write_chunk(f, hasher, data: bytes):
+        hasher.update(data)
+        f.write(data)
+
+    def _commit(self, tmp_path: str, digest: str, content_type: str):
+        path = self.path(digest)
+        if os.path.exists(path):
+            # 相同内容已存在：丢弃副本，刷新修改时间以免被过早清理
+            os.remove(tmp_path)
+            os.utime(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".meta", "w", encoding="utf-8") as f:
+            json.dump({"content_type": content_type}, f)
+        os.replace(tmp_path, path)
+
+    def read(self, digest: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """按块读取 [start, end] 闭区间的内容（同步迭代器，由 StreamingResponse 在线程池中迭代）"""
+        path = self.path(digest)
+        try:
+            f = open(path, "rb")
+        except OSError:
+            raise BlobNotFound(f"Blob {digest} not found")
+        return self._iter_file(f, start, end)
+
+    def _iter_file(self, f, start: int, end: Optional[int]) -> Iterator[bytes]:
+        with f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                data = f.read(self.chunk_size if remaining is None else min(self.chunk_size, remaining))
+                if not data:
+                    break
+                if remaining is not None:
+                    remaining -= len(data)
+                yield data
+
+    def prune(self, max_age: float) -> int:
+        """删除超过 max_age 秒未被上传或引用的大对象，返回删除的数量"""
+        cutoff = time.time() - max_age
+        removed = 0
+        if not os.path.isdir(self.root):
+            return 0
+        for prefix in os.listdir(self.root):
+            directory = os.path.join(self.root, prefix)
+            if prefix == "tmp" or not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if not _DIGEST.match(name):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                        if os.path.exists(path + ".meta"):
+                            os.remove(path + ".meta")
+                except OSError:
+                    pass
+        return removed
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Any, List, Callable, Deque, Set, Union
+
+from fastapi import WebSocket
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+# 慢客户端处理策略
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+DISCONNECT = "disconnect"
+POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+# 队列中的占位标记：写出时替换为一份最新快照
+RESYNC = object()
+
+
+class Frame:
+    """一个待发送的事件及其按编码缓存的序列化结果
+
+    广播时同一个 Frame 被放入所有客户端的队列，每种编码只序列化一次，
+    各客户端共享同一份不可变的编码结果（JSON 为 str，MessagePack 为 bytes）。
+    """
+
+    __slots__ = ("event", "encoded")
+
+    def __init__(self, event: Dict[str, Any]):
+        self.event = event
+        self.encoded: Dict[str, Union[str, bytes]] = {}
+
+
+class ClientChannel:
+    """单个 WebSocket 客户端的有界出站队列及其写任务"""
+
+    def __init__(self, websocket: WebSocket, maxsize: int, policy: str,
+                 snapshot_factory: Callable[[], Dict[str, Any]], media: str = codec.JSON,
+                 encode: Callable[[Frame, str], Union[str, bytes]] = None):
+        self.websocket = websocket
+        self.media = media
+        self.encode = encode
+        self.client = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else "unknown"
+        self.maxsize = maxsize
+        self.policy = policy
+        self.snapshot_factory = snapshot_factory
+        self.queue: Deque[Any] = deque()
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        # 写入 socket 的耗时（含背压等待）和帧大小（压缩前）
+        self.write_seconds = 0.0
+        self.sent_size = 0
+        self._wakeup = asyncio.Event()
+        self.task: asyncio.Task = None
+
+    def offer(self, item: Any) -> bool:
+        """把事件放入队列，立即返回；返回 False 表示该客户端应被断开"""
+        if self.closed:
+            return False
+        if len(self.queue) >= self.maxsize:
+            if self.policy == DISCONNECT:
+                self.dropped += len(self.queue) + 1
+                self.queue.clear()
+                return False
+            if self.policy == COALESCE:
+                # 积压的增量事件已无意义，合并为一次快照
+                self.resync()
+                return True
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(item)
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self._wakeup.set()
+        return True
+
+    def resync(self):
+        """丢弃积压的事件，改为发送一份最新快照"""
+        self.coalesced += len(self.queue)
+        self.queue.clear()
+        self.queue.append(RESYNC)
+        self._wakeup.set()
+
+    async def run(self):
+        """写任务：依次把队列中的事件发送给客户端"""
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                item = self.queue.popleft()
+                if item is RESYNC:
+                    item = Frame(self.snapshot_factory())
+                elif not isinstance(item, Frame):
+                    # 连接时补发的事件和快照只发送给本客户端
+                    item = Frame(item)
+                data = self.encode(item, self.media)
+                started = time.perf_counter()
+                if isinstance(data, bytes):
+                    await self.websocket.send_bytes(data)
+                else:
+                    await self.websocket.send_text(data)
+                self.write_seconds += time.perf_counter() - started
+                self.sent_size += len(data)
+                self.sent += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error broadcasting to client {self.client}: {str(e)}")
+        finally:
+            self.closed = True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "client": self.client,
+            "encoding": self.media,
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "sent_size": self.sent_size,
+            "write_seconds": round(self.write_seconds, 6),
+        }
+
+
+class Broadcaster:
+    """仪表盘事件广播器
+
+    每个客户端拥有独立的有界队列和写任务，发布方只负责入队并立即返回，
+    单个慢客户端不会拖慢请求处理或其他客户端。
+    每个事件按客户端使用的编码各序列化一次，编码结果由所有客户端共享。
+    """
+
+    def __init__(self, snapshot_factory: Callable[[], Dict[str, Any]],
+                 queue_size: int = 256, policy: str = DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow client policy: {policy}")
+        self.snapshot_factory = snapshot_factory
+        self.queue_size = queue_size
+        self.policy = policy
+        self.channels: Set[ClientChannel] = set()
+        self.disconnected_slow_clients = 0
+        # 序列化统计
+        self.frames_encoded = 0
+        self.encode_seconds = 0.0
+        self.encoded_size = 0
+        # 已断开客户端的写入统计
+        self.closed_write_seconds = 0.0
+        self.closed_sent_size = 0
+
+    def encode(self, frame: Frame, media: str) -> Union[str, bytes]:
+        """返回帧在指定编码下的序列化结果，首次请求时编码并缓存"""
+        data = frame.encoded.get(media)
+        if data is None:
+            started = time.perf_counter()
+            data = codec.dumps_json(frame.event) if media == codec.JSON else codec.encode(frame.event, media)
+            self.encode_seconds += time.perf_counter() - started
+            self.frames_encoded += 1
+            self.encoded_size += len(data)
+            frame.encoded[media] = data
+        return data
+
+    def add(self, websocket: WebSocket, initial: List[Dict[str, Any]], media: str = codec.JSON) -> ClientChannel:
+        """注册客户端并启动写任务，initial 为需要先发送的快照或补发事件，media 为帧编码"""
+        channel = ClientChannel(websocket, self.queue_size, self.policy, self.snapshot_factory, media, self.encode)
+        if len(initial) > self.queue_size:
+            channel.queue.append(RESYNC)
+        else:
+            channel.queue.extend(initial)
+        channel._wakeup.set()
+        channel.task = asyncio.create_task(channel.run())
+        self.channels.add(channel)
+        return channel
+
+    async def remove(self, channel: ClientChannel):
+        """注销客户端并停止写任务"""
+        self.channels.discard(channel)
+        channel.closed = True
+        if channel.task and not channel.task.done():
+            channel.task.cancel()
+            try:
+                await channel.task
+            except asyncio.CancelledError:
+                pass
+        self.closed_write_seconds += channel.write_seconds
+        self.closed_sent_size += channel.sent_size
+
+    def publish(self, event: Dict[str, Any]):
+        """把事件放入所有客户端的队列，不等待发送完成"""
+        if not self.channels:
+            return
+        frame = Frame(event)
+        for channel in list(self.channels):
+            if channel.offer(frame):
+                continue
+            self.channels.discard(channel)
+            if channel.policy == DISCONNECT and not channel.closed:
+                self.disconnected_slow_clients += 1
+                logger.warning(f"Disconnecting slow client {channel.client}")
+                channel.closed = True
+                channel._wakeup.set()
+                asyncio.create_task(self._close(channel))
+
+    async def _close(self, channel: ClientChannel):
+        try:
+            await channel.websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        clients = [channel.stats() for channel in self.channels]
+        return {
+            "policy": self.policy,
+            "queue_size": self.queue_size,
+            "clients": clients,
+            "total_queue_depth": sum(c["queue_depth"] for c in clients),
+            "total_dropped": sum(c["dropped"] for c in clients),
+            "disconnected_slow_clients": self.disconnected_slow_clients,
+            # 序列化耗时与写入 socket 耗时，用于判断广播的瓶颈
+            "frames_encoded": self.frames_encoded,
+            "encoded_size": self.encoded_size,
+            "encode_seconds": round(self.encode_seconds, 6),
+            "total_sent_size": self.closed_sent_size + sum(c["sent_size"] for c in clients),
+            "total_write_seconds": round(self.closed_write_seconds + sum(c["write_seconds"] for c in clients), 6),
+        }
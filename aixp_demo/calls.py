@@ -0,0 +1,75 @@
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+
+class CallTable:
+    """进行中的请求/响应调用
+
+    correlation_id -> (调用方, 截止时间)。截止时间保存在最小堆中，超时任务只需查看堆顶；
+    调用完成（收到响应）时只从字典中删除，堆中的定时项在弹出时丢弃。
+    local 表示调用由本进程受理：只有受理的工作进程负责向调用方发送超时响应，
+    其他工作进程到期后只清理记录。
+    """
+
+    def __init__(self):
+        # correlation_id -> (调用方, 截止时间, 是否由本进程受理)
+        self._calls: Dict[str, Tuple[str, float, bool]] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def __contains__(self, correlation_id: str) -> bool:
+        return correlation_id in self._calls
+
+    def add(self, correlation_id: str, caller: str, deadline: float, local: bool = False):
+        self._calls[correlation_id] = (caller, deadline, local)
+        heapq.heappush(self._heap, (deadline, correlation_id))
+
+    def caller(self, correlation_id: str) -> Optional[str]:
+        call = self._calls.get(correlation_id)
+        return call[0] if call is not None else None
+
+    def pop(self, correlation_id: str) -> Optional[str]:
+        """调用完成，返回调用方；调用不存在（已完成或已超时）时返回 None"""
+        call = self._calls.pop(correlation_id, None)
+        return call[0] if call is not None else None
+
+    def next_deadline(self) -> Optional[float]:
+        """最早的定时项时间（可能已失效，只用于决定下次检查的时间）"""
+        return self._heap[0][0] if self._heap else None
+
+    def expired(self, now: float) -> List[Tuple[str, str]]:
+        """移除所有在 now 之前到期的调用，返回其中由本进程受理的 (correlation_id, 调用方)"""
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, correlation_id = heapq.heappop(self._heap)
+            call = self._calls.get(correlation_id)
+            if call is None or call[1] != deadline:
+                # 已完成，或被同一 correlation_id 的新调用取代
+                continue
+            del self._calls[correlation_id]
+            if call[2]:
+                expired.append((correlation_id, call[0]))
+        return expired
+
+
+class CallError(Exception):
+    """调用收到了错误响应"""
+
+    def __init__(self, message: str, reply: Optional[dict] = None):
+        super().__init__(message)
+        self.reply = reply
+
+
+class CallTimeout(CallError):
+    """调用在截止时间前没有收到响应"""
+
+
+def reply_result(reply: dict) -> dict:
+    """把响应消息转换为调用结果：正常响应原样返回，错误响应和超时抛出异常"""
+    if reply.get("task") == "call_timeout":
+        raise CallTimeout(f"Call {reply['in_reply_to']} timed out", reply)
+    if reply.get("error") is not None:
+        raise CallError(reply["error"], reply)
+    return reply
@@ -0,0 +1,79 @@
+import base64
+import json
+from typing import Any, Optional
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# 支持的编码（媒体类型）
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+# JSON 中二进制数据的表示：{"$bytes": base64 字符串}
+BYTES_KEY = "$bytes"
+
+
+class UnsupportedEncoding(Exception):
+    """请求了无法处理的编码"""
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {BYTES_KEY: base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _object_hook(value: dict) -> Any:
+    if len(value) == 1 and BYTES_KEY in value:
+        return base64.b64decode(value[BYTES_KEY])
+    return value
+
+
+def dumps_json(value: Any) -> str:
+    """编码为 JSON；二进制数据编码为 {"$bytes": base64}，供仪表盘和只支持 JSON 的客户端使用"""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default)
+
+
+def dumps_canonical(value: Any) -> str:
+    """规范 JSON：键排序、无多余空白，相同内容的编码结果总是相同，用于计算内容哈希"""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), sort_keys=True, default=_default)
+
+
+def loads_json(data: Any) -> Any:
+    """解析 JSON，并把 {"$bytes": base64} 还原为二进制数据"""
+    return json.loads(data, object_hook=_object_hook)
+
+
+def media_type(header: Optional[str]) -> str:
+    """从 Content-Type 或 Accept 头中识别编码，未识别时为 JSON"""
+    if header and "msgpack" in header:
+        return MSGPACK
+    return JSON
+
+
+def encoding_name(name: Optional[str]) -> str:
+    """WebSocket 查询参数 encoding=json|msgpack 对应的编码"""
+    if name in (None, "", "json"):
+        return JSON
+    if name == "msgpack":
+        return MSGPACK
+    raise UnsupportedEncoding(f"Unsupported encoding: {name}")
+
+
+def encode(value: Any, media: str = JSON) -> bytes:
+    """按编码序列化；MessagePack 中二进制数据原样保存，不做 base64"""
+    if media == MSGPACK:
+        if msgpack is None:
+            raise UnsupportedEncoding("msgpack is not installed")
+        return msgpack.packb(value, use_bin_type=True)
+    return dumps_json(value).encode("utf-8")
+
+
+def decode(data: bytes, media: str = JSON) -> Any:
+    if media == MSGPACK:
+        if msgpack is None:
+            raise UnsupportedEncoding("msgpack is not installed")
+        return msgpack.unpackb(data, raw=False)
+    return loads_json(data)
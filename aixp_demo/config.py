@@ -0,0 +1,143 @@
+import os
+
+# 服务器配置，均可通过环境变量覆盖
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+# 日志级别，生产环境建议保持 INFO
+LOG_LEVEL = os.environ.get("AIXP_LOG_LEVEL", "INFO").upper()
+
+# 按比例抽样记录单条消息的处理耗时（0 到 1，0 表示不记录）
+TRACE_SAMPLE_RATE = _env_float("AIXP_TRACE_SAMPLE_RATE", 0.0)
+
+# 采样分析器：输出目录、采样间隔（毫秒）、被抽样请求的比例，以及启动后自动分析的秒数（0 表示不自动分析）
+PROFILE_DIR = os.environ.get("AIXP_PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = _env_float("AIXP_PROFILE_INTERVAL", 5.0)
+PROFILE_SAMPLE_RATE = _env_float("AIXP_PROFILE_SAMPLE_RATE", 1.0)
+PROFILE_SECONDS = _env_float("AIXP_PROFILE_SECONDS", 0.0)
+
+
+# 每个仪表盘客户端出站队列的容量
+BROADCAST_QUEUE_SIZE = _env_int("AIXP_BROADCAST_QUEUE_SIZE", 256)
+
+# 慢客户端处理策略：drop_oldest（丢弃最旧事件）、coalesce（合并为一次快照）、disconnect（断开连接）
+BROADCAST_SLOW_CLIENT_POLICY = os.environ.get("AIXP_BROADCAST_SLOW_CLIENT_POLICY", "drop_oldest")
+
+# 每个代理收件箱的容量
+INBOX_SIZE = _env_int("AIXP_INBOX_SIZE", 1000)
+
+# 收件箱长轮询的最长等待时间（秒）
+INBOX_MAX_TIMEOUT = _env_int("AIXP_INBOX_MAX_TIMEOUT", 60)
+
+# 消息历史环形缓冲区的容量，所有事件类型（消息、注册、注销）共用
+HISTORY_SIZE = _env_int("AIXP_HISTORY_SIZE", 1000)
+
+# 仪表盘快照中包含的最近消息条数
+DASHBOARD_HISTORY_SIZE = _env_int("AIXP_DASHBOARD_HISTORY_SIZE", 100)
+
+# 可供断线重连续传的增量事件条数
+EVENT_REPLAY_SIZE = _env_int("AIXP_EVENT_REPLAY_SIZE", 1000)
+
+# /agents 分页查询的默认和最大页大小
+AGENT_PAGE_SIZE = _env_int("AIXP_AGENT_PAGE_SIZE", 100)
+AGENT_PAGE_MAX_SIZE = _env_int("AIXP_AGENT_PAGE_MAX_SIZE", 1000)
+
+# /messages 历史查询的默认和最大页大小
+MESSAGE_PAGE_SIZE = _env_int("AIXP_MESSAGE_PAGE_SIZE", 100)
+MESSAGE_PAGE_MAX_SIZE = _env_int("AIXP_MESSAGE_PAGE_MAX_SIZE", 1000)
+
+# 按能力路由消息时的默认策略：round_robin、least_outstanding、consistent_hash
+ROUTING_POLICY = os.environ.get("AIXP_ROUTING_POLICY", "round_robin")
+
+# 一致性哈希默认使用的 data 字段名
+ROUTING_HASH_KEY = os.environ.get("AIXP_ROUTING_HASH_KEY", "key")
+
+# /send_messages 单批最多消息数
+BATCH_MAX_SIZE = _env_int("AIXP_BATCH_MAX_SIZE", 1000)
+
+# /inboxes/poll 单次请求最多等待的代理数
+POLL_MAX_AGENTS = _env_int("AIXP_POLL_MAX_AGENTS", 1000)
+
+# 持久化目录，设置后消息和注册记录写入分段追加日志，重启时回放；为空时不持久化
+PERSIST_DIR = os.environ.get("AIXP_PERSIST_DIR", "")
+
+# 单个日志分段的大小上限（字节），超过后滚动到新分段
+PERSIST_SEGMENT_BYTES = _env_int("AIXP_PERSIST_SEGMENT_BYTES", 64 * 1024 * 1024)
+
+# 压缩时删除超过该时长（秒）的旧分段，默认 7 天，0 表示不按时间删除
+PERSIST_RETENTION_SECONDS = _env_int("AIXP_PERSIST_RETENTION_SECONDS", 7 * 24 * 3600)
+
+# 日志总大小上限（字节），压缩时从最旧的分段开始删除，默认 1 GiB，0 表示不限制
+# 两项都设为 0 时日志无限增长，启动时会记录警告
+PERSIST_MAX_BYTES = _env_int("AIXP_PERSIST_MAX_BYTES", 1024 * 1024 * 1024)
+
+# 压缩间隔（秒）
+PERSIST_COMPACT_INTERVAL = _env_int("AIXP_PERSIST_COMPACT_INTERVAL", 300)
+
+# 是否等待记录落盘（组提交）后再响应请求
+PERSIST_SYNC = os.environ.get("AIXP_PERSIST_SYNC", "1") == "1"
+
+# 共享状态与发布/订阅后端：memory（进程内，单工作进程）或 sqlite（同一台机器上的多个工作进程共享）
+BACKEND = os.environ.get("AIXP_BACKEND", "memory")
+
+# sqlite 后端的数据库文件（WAL 模式）
+SQLITE_PATH = os.environ.get("AIXP_SQLITE_PATH", "aixp.db")
+
+# sqlite 写事务等待其他工作进程释放写锁的最长时间（毫秒）；写操作在事件循环中执行，
+# 超时后请求立即以 503 失败，而不是让本进程的所有请求和 WebSocket 一起等待
+SQLITE_BUSY_TIMEOUT = _env_int("AIXP_SQLITE_BUSY_TIMEOUT", 100)
+
+# 工作进程拉取其他进程事件的间隔（毫秒）
+BACKEND_POLL_INTERVAL = _env_int("AIXP_BACKEND_POLL_INTERVAL", 20)
+
+# 直接运行 server.py 时的 uvicorn 工作进程数，大于 1 时应使用 sqlite 后端
+WORKERS = _env_int("AIXP_WORKERS", 1)
+
+# 代理注册租约的默认时长（秒），代理需在到期前发送心跳；0 表示不启用租约
+LEASE_TTL = _env_int("AIXP_LEASE_TTL", 30)
+
+# 代理可以请求的最长租约（秒）
+LEASE_MAX_TTL = _env_int("AIXP_LEASE_MAX_TTL", 3600)
+
+# 租约过期检查的时间片（毫秒），同一时间片内到期的代理合并为一次注销事件
+LEASE_RESOLUTION = _env_int("AIXP_LEASE_RESOLUTION", 1000)
+
+# WebSocket 是否协商 permessage-deflate 压缩（直接运行 server.py 时生效，uvicorn 命令行使用 --ws-per-message-deflate）
+WS_COMPRESSION = os.environ.get("AIXP_WS_COMPRESSION", "1") == "1"
+
+# 大对象存储目录（内容寻址），多个工作进程共用同一目录；
+# 默认位于用户目录下的 ~/.aixp/blobs，不随工作目录变化，也不会写入源码树
+BLOB_DIR = os.environ.get("AIXP_BLOB_DIR") or os.path.join(os.path.expanduser("~"), ".aixp", "blobs")
+
+# 单个大对象的大小上限（字节），0 表示不限制
+BLOB_MAX_BYTES = _env_int("AIXP_BLOB_MAX_BYTES", 1024 * 1024 * 1024)
+
+# 删除超过该时长（秒）未被上传或引用的大对象，0 表示不清理
+BLOB_RETENTION_SECONDS = _env_int("AIXP_BLOB_RETENTION_SECONDS", 0)
+
+# 请求/响应调用的默认超时和最长超时（秒）
+CALL_TIMEOUT = _env_float("AIXP_CALL_TIMEOUT", 30.0)
+CALL_MAX_TIMEOUT = _env_float("AIXP_CALL_MAX_TIMEOUT", 300.0)
+
+# 每个发送方的限速（条/秒）及突发容量，0 表示不限速；突发容量为 0 时等于一秒的配额
+SENDER_RATE = _env_float("AIXP_SENDER_RATE", 0.0)
+SENDER_BURST = _env_float("AIXP_SENDER_BURST", 0.0)
+
+# 本工作进程所有发送方合计的限速（条/秒）及突发容量，0 表示不限速
+GLOBAL_RATE = _env_float("AIXP_GLOBAL_RATE", 0.0)
+GLOBAL_BURST = _env_float("AIXP_GLOBAL_BURST", 0.0)
+
+# 收件箱高水位：积压达到该条数后新消息返回 429，留出余量避免收件箱被写满；0 表示只在写满时拒绝（503）
+INBOX_HIGH_WATER = _env_int("AIXP_INBOX_HIGH_WATER", INBOX_SIZE * 9 // 10)
+
+# 收件箱超过高水位时建议发送方等待的时间（秒）
+INBOX_RETRY_AFTER = _env_float("AIXP_INBOX_RETRY_AFTER", 1.0)
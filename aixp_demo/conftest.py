@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# 模块以扁平方式相互导入（from agent import ...），测试时把本目录加入导入路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 需要运行中的服务器的手动测试脚本，直接运行而不由 pytest 收集
+collect_ignore = ["test_agents.py", "test_messages.py"]
+
+# 服务器在导入时读取配置；测试中的大对象和分析输出写到临时目录，不落到用户目录或仓库里
+_scratch = tempfile.mkdtemp(prefix="aixp-test-")
+os.environ.setdefault("AIXP_BLOB_DIR", os.path.join(_scratch, "blobs"))
+os.environ.setdefault("AIXP_PROFILE_DIR", os.path.join(_scratch, "profiles"))
@@ -0,0 +1,39 @@
+from typing import Dict, Any, List, Optional
+import uuid
+
+from history import RingBuffer
+
+
+class EventStream:
+    """带序号的增量事件流
+
+    每个事件分配一个单调递增的序号，并在内存中保留最近的若干事件，
+    断线重连的客户端可以凭借最后收到的序号补齐遗漏的事件，而无需重新拉取全量快照。
+    """
+
+    def __init__(self, maxlen: int = 1000):
+        # 事件流标识，进程重启后改变，避免客户端用旧序号续传到新的事件流
+        self.stream_id = uuid.uuid4().hex
+        self._events = RingBuffer(maxlen)
+
+    @property
+    def seq(self) -> int:
+        """最新事件的序号"""
+        return self._events.last_seq
+
+    def publish(self, event_type: str, data: Any) -> Dict[str, Any]:
+        """生成一个新事件并记录到回放缓冲区"""
+        event = {"event": event_type, "seq": self._events.next_seq, "data": data}
+        self._events.append(event)
+        return event
+
+    def since(self, seq: int) -> Optional[List[Dict[str, Any]]]:
+        """返回序号大于 seq 的所有事件
+
+        如果所需事件已被淘汰出缓冲区（或序号非法），返回 None，调用方应改为发送快照。
+        """
+        if seq > self.seq or seq < 0:
+            return None
+        if seq + 1 < self._events.first_seq:
+            return None
+        return self._events.since(seq)
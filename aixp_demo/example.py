@@ -81,6 +81,13 @@ def main():
         logger.info("\n图像处理结果：")
         logger.info(image_result)
 
+        # 示例：图像代理启动任务处理运行时（图像分析在进程池中执行），文本代理以调用的方式请求分析
+        image_runtime = image_agent.runtime().start()
+        reply = text_agent.call("image_agent_1", "process_image", {"image_url": image_url}, timeout=10).result()
+        logger.info("\n调用结果：")
+        logger.info(reply["data"])
+        image_runtime.stop()
+
     except Exception as e:
         logger.error(f"运行示例时发生错误: {str(e)}")
         logger.exception("详细错误信息：")  # 添加详细错误信息
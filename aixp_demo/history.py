@@ -0,0 +1,207 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# 二级索引覆盖的字段
+INDEXED_FIELDS = ("sender_id", "receiver_id", "task")
+
+
+class RingBuffer:
+    """固定容量的环形缓冲区
+
+    每个元素按写入顺序分配递增序号（从 1 开始）。写满后覆盖最旧的元素，
+    追加和淘汰都是 O(1)；按序号或“最近 N 条”切片只复制所需的元素。
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._items: List[Any] = [None] * capacity
+        # 最旧元素的序号，以及下一个写入元素的序号
+        self.first_seq = 1
+        self.next_seq = 1
+
+    def __len__(self) -> int:
+        return self.next_seq - self.first_seq
+
+    def __iter__(self) -> Iterator[Any]:
+        for seq in range(self.first_seq, self.next_seq):
+            yield self._items[seq % self.capacity]
+
+    @property
+    def last_seq(self) -> int:
+        """最新元素的序号，缓冲区为空时为 0（或最后一个被淘汰元素的序号）"""
+        return self.next_seq - 1
+
+    def append(self, item: Any) -> int:
+        """追加一个元素，返回它的序号"""
+        seq = self.next_seq
+        self._items[seq % self.capacity] = item
+        self.next_seq += 1
+        if self.next_seq - self.first_seq > self.capacity:
+            self.first_seq += 1
+        return seq
+
+    def get(self, seq: int) -> Optional[Any]:
+        """按序号取元素，已被淘汰或尚未写入时返回 None"""
+        if self.first_seq <= seq < self.next_seq:
+            return self._items[seq % self.capacity]
+        return None
+
+    def last(self, n: int) -> List[Any]:
+        """最近的 n 个元素，按写入顺序排列"""
+        start = max(self.first_seq, self.next_seq - max(n, 0))
+        return self._slice(start, self.next_seq)
+
+    def since(self, seq: int, limit: Optional[int] = None) -> List[Any]:
+        """序号大于 seq 的元素（至多 limit 个），已被淘汰的部分不会返回"""
+        start = max(self.first_seq, seq + 1)
+        stop = self.next_seq if limit is None else min(self.next_seq, start + max(limit, 0))
+        return self._slice(start, stop)
+
+    def _slice(self, start: int, stop: int) -> List[Any]:
+        if start >= stop:
+            return []
+        i, j = start % self.capacity, stop % self.capacity
+        if i < j:
+            return self._items[i:j]
+        return self._items[i:] + self._items[:j]
+
+
+class Postings:
+    """一个索引键对应的升序位置列表
+
+    位置紧凑地存放在 array 中；淘汰总是从最旧的一端进行，只移动起点，
+    被跳过的部分超过一半时才整体搬移。
+    """
+
+    __slots__ = ("positions", "start")
+
+    def __init__(self):
+        self.positions = array("q")
+        self.start = 0
+
+    def __len__(self) -> int:
+        return len(self.positions) - self.start
+
+    def add(self, position: int):
+        positions = self.positions
+        if not positions or positions[-1] < position:
+            positions.append(position)
+        else:
+            positions.insert(bisect_left(positions, position, self.start), position)
+
+    def trim(self, before: int):
+        """移除小于 before 的位置"""
+        self.start = bisect_left(self.positions, before, self.start)
+        if self.start > 1024 and self.start * 2 > len(self.positions):
+            del self.positions[:self.start]
+            self.start = 0
+
+
+class HistoryIndex:
+    """消息历史的二级索引（按发送方、接收方、任务，以及全部记录的时间顺序）
+
+    位置是历史记录的序号（环形缓冲区序号或持久化日志的记录序号），随追加递增。
+    记录按时间顺序追加，位置顺序即时间顺序，时间范围和游标都在位置列表上二分查找。
+    查询选择最短的候选列表，按位置顺序取回条目并校验其余条件，凑满一页即停止，
+    不会扫描整个历史。fetch(position) 取回条目，条目已不存在时返回 None。
+    """
+
+    def __init__(self, fetch: Callable[[int], Optional[Dict[str, Any]]]):
+        self.fetch = fetch
+        self._keys: Dict[str, Dict[str, Postings]] = {field: {} for field in INDEXED_FIELDS}
+        self._all = Postings()
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+    def add(self, position: int, entry: Dict[str, Any]):
+        self._all.add(position)
+        for field, index in self._keys.items():
+            key = entry.get(field)
+            if key is None:
+                continue
+            postings = index.get(key)
+            if postings is None:
+                postings = index[key] = Postings()
+            postings.add(position)
+
+    def evict(self, position: int, entry: Dict[str, Any]):
+        """移除最旧的一条记录（环形缓冲区覆盖最旧元素时调用），只涉及该记录所在的列表"""
+        self._all.trim(position + 1)
+        for field, index in self._keys.items():
+            key = entry.get(field)
+            postings = index.get(key)
+            if postings is None:
+                continue
+            postings.trim(position + 1)
+            if not postings:
+                del index[key]
+
+    def remove_before(self, position: int):
+        """移除所有小于 position 的位置（日志旧分段被删除后调用）"""
+        self._all.trim(position)
+        for index in self._keys.values():
+            empty = []
+            for key, postings in index.items():
+                postings.trim(position)
+                if not postings:
+                    empty.append(key)
+            for key in empty:
+                del index[key]
+
+    def query(self, filters: Dict[str, str], since: Optional[str] = None, until: Optional[str] = None,
+              cursor: Optional[int] = None, limit: int = 100,
+              descending: bool = True) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """按字段精确匹配和时间范围（闭区间，与条目的 timestamp 格式相同）查询
+
+        cursor 为上一页返回的游标，返回 (本页条目, 下一页游标)；没有更多候选记录时游标为 None。
+        """
+        candidates = [self._all]
+        for field, value in filters.items():
+            postings = self._keys[field].get(value)
+            if postings is None:
+                return [], None
+            candidates.append(postings)
+        postings = min(candidates, key=len)
+        positions = postings.positions
+        lo, hi = postings.start, len(positions)
+        if cursor is not None:
+            if descending:
+                hi = bisect_left(positions, cursor, lo, hi)
+            else:
+                lo = bisect_right(positions, cursor, lo, hi)
+        if since is not None:
+            lo = self._bisect_time(positions, since, lo, hi)
+        if until is not None:
+            hi = self._bisect_time(positions, until, lo, hi, right=True)
+        order = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        entries: List[Dict[str, Any]] = []
+        for i in order:
+            position = positions[i]
+            entry = self.fetch(position)
+            if entry is None or any(entry.get(field) != value for field, value in filters.items()):
+                continue
+            # 多个工作进程的记录时间戳可能略有交错，二分查找之后仍逐条校验
+            timestamp = entry.get("timestamp", "")
+            if (since is not None and timestamp < since) or (until is not None and timestamp > until):
+                continue
+            entries.append(entry)
+            if len(entries) == limit:
+                more = i > lo if descending else i < hi - 1
+                return entries, position if more else None
+        return entries, None
+
+    def _bisect_time(self, positions: array, timestamp: str, lo: int, hi: int, right: bool = False) -> int:
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self.fetch(positions[mid])
+            # 已不存在的条目只可能是最旧的记录
+            value = entry.get("timestamp", "") if entry is not None else ""
+            if value < timestamp or (right and value == timestamp):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
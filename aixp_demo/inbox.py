@@ -0,0 +1,156 @@
+import asyncio
+from collections import deque
+from typing import Dict, Any, List, Optional, Deque, Set, Tuple
+
+
+class InboxFull(Exception):
+    """收件箱已满"""
+
+
+class Inbox:
+    """单个代理的有界收件箱
+
+    消费方（长轮询请求或 WebSocket 推送）在收件箱为空时挂起等待，
+    新消息到达时立即被唤醒，无需忙轮询。
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self.queue: Deque[Dict[str, Any]] = deque()
+        self._waiters: Set[asyncio.Future] = set()
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    def put(self, message: Dict[str, Any]):
+        """投递一条消息，收件箱已满时抛出 InboxFull"""
+        if len(self.queue) >= self.maxsize:
+            raise InboxFull(f"Inbox is full ({self.maxsize} messages)")
+        self.queue.append(message)
+        self._wake()
+
+    def get_nowait(self, max_messages: int) -> List[Dict[str, Any]]:
+        """立即取出至多 max_messages 条消息"""
+        count = min(max_messages, len(self.queue))
+        return [self.queue.popleft() for _ in range(count)]
+
+    async def get(self, max_messages: int, timeout: Optional[float]) -> List[Dict[str, Any]]:
+        """取出至多 max_messages 条消息，收件箱为空时最多等待 timeout 秒"""
+        if not len(self) and timeout != 0:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._waiters.discard(waiter)
+        return self.get_nowait(max_messages)
+
+    def add_waiter(self, waiter: asyncio.Future):
+        """登记一个等待者，有新消息时被唤醒（可同时登记到多个收件箱）"""
+        self._waiters.add(waiter)
+
+    def discard_waiter(self, waiter: asyncio.Future):
+        self._waiters.discard(waiter)
+
+    def close(self):
+        """唤醒所有等待者，用于代理注销时"""
+        self._wake()
+
+    def _wake(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+
+class InboxRegistry:
+    """所有代理的收件箱"""
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self._inboxes: Dict[str, Inbox] = {}
+
+    def __contains__(self, agent_id: str) -> bool:
+        return agent_id in self._inboxes
+
+    def get(self, agent_id: str) -> Optional[Inbox]:
+        return self._inboxes.get(agent_id)
+
+    def create(self, agent_id: str) -> Inbox:
+        """为代理创建收件箱，已存在时保留其中的消息"""
+        inbox = self._inboxes.get(agent_id)
+        if inbox is None:
+            inbox = self._inboxes[agent_id] = self._new_inbox(agent_id)
+        return inbox
+
+    def _new_inbox(self, agent_id: str) -> Inbox:
+        return Inbox(self.maxsize)
+
+    def remove(self, agent_id: str):
+        inbox = self._inboxes.pop(agent_id, None)
+        if inbox is not None:
+            inbox.close()
+
+    def depth(self, agent_id: str) -> int:
+        inbox = self._inboxes.get(agent_id)
+        return len(inbox) if inbox is not None else 0
+
+    def put_many(self, agent_ids: List[str], message: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+        """把同一条消息投递到多个收件箱（各收件箱保存同一个对象的引用，不复制）
+
+        返回 (已投递的 agent_id, 收件箱已满的 agent_id)；没有收件箱的代理直接跳过。
+        """
+        delivered = []
+        full = []
+        for agent_id in agent_ids:
+            inbox = self._inboxes.get(agent_id)
+            if inbox is None:
+                continue
+            try:
+                inbox.put(message)
+            except InboxFull:
+                full.append(agent_id)
+                continue
+            delivered.append(agent_id)
+        return delivered, full
+
+    def notify(self, agent_id: str):
+        """其他工作进程向 agent_id 投递了消息；进程内的收件箱在 put 时已唤醒等待者"""
+
+    def total_depth(self) -> int:
+        """所有收件箱中待取出的消息总数"""
+        return sum(len(inbox) for inbox in self._inboxes.values())
+
+    async def get_many(self, agent_ids: List[str], max_messages: int,
+                       timeout: Optional[float]) -> Tuple[Dict[str, List[Dict[str, Any]]], List[str]]:
+        """同时等待多个收件箱，任一收件箱有消息即取出所有非空收件箱中的消息
+
+        返回 (agent_id -> 消息列表, 不存在的 agent_id 列表)。
+        """
+        targets = []
+        unknown = []
+        for agent_id in agent_ids:
+            inbox = self._inboxes.get(agent_id)
+            if inbox is None:
+                unknown.append(agent_id)
+            else:
+                targets.append((agent_id, inbox))
+        if timeout != 0 and targets and not any(len(inbox) for _, inbox in targets):
+            # 一个共享的 future 同时登记到所有收件箱，任一收件箱收到消息都会唤醒它
+            waiter = asyncio.get_running_loop().create_future()
+            for _, inbox in targets:
+                inbox.add_waiter(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                for _, inbox in targets:
+                    inbox.discard_waiter(waiter)
+        messages = {}
+        for agent_id, inbox in targets:
+            if len(inbox):
+                messages[agent_id] = inbox.get_nowait(max_messages)
+        return messages, unknown
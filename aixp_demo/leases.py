@@ -0,0 +1,82 @@
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+
+class LeaseTable:
+    """代理注册租约
+
+    每个代理持有一个到期时间，心跳只更新字典中的到期时间（O(1)），不触碰堆；
+    最小堆中每个代理至多有一个有效的定时项，弹出时若发现租约已被续期，
+    按新的到期时间重新入堆。因此检查过期只需查看堆顶，无需扫描全部代理。
+    """
+
+    def __init__(self):
+        # agent_id -> 到期时间
+        self._expires: Dict[str, float] = {}
+        # agent_id -> 租约时长（秒）
+        self._ttls: Dict[str, float] = {}
+        # agent_id -> 堆中有效定时项的时间
+        self._scheduled: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def __contains__(self, agent_id: str) -> bool:
+        return agent_id in self._expires
+
+    def grant(self, agent_id: str, ttl: float, now: float) -> float:
+        """授予（或替换）租约，返回到期时间"""
+        self._ttls[agent_id] = ttl
+        return self.extend(agent_id, now + ttl)
+
+    def extend(self, agent_id: str, expires_at: float) -> float:
+        """把租约的到期时间设置为 expires_at"""
+        self._expires[agent_id] = expires_at
+        scheduled = self._scheduled.get(agent_id)
+        if scheduled is None or expires_at < scheduled:
+            # 定时项只能提前不能推后：推后由弹出时重新入堆处理
+            self._scheduled[agent_id] = expires_at
+            heapq.heappush(self._heap, (expires_at, agent_id))
+        return expires_at
+
+    def renew(self, agent_id: str, now: float) -> Optional[float]:
+        """心跳续约，返回新的到期时间；没有租约时返回 None"""
+        if agent_id not in self._expires:
+            return None
+        return self.extend(agent_id, now + self._ttls[agent_id])
+
+    def ttl(self, agent_id: str) -> Optional[float]:
+        return self._ttls.get(agent_id)
+
+    def revoke(self, agent_id: str):
+        """撤销租约（代理注销时），堆中的定时项在弹出时丢弃"""
+        self._expires.pop(agent_id, None)
+        self._ttls.pop(agent_id, None)
+
+    def next_deadline(self) -> Optional[float]:
+        """最早的定时项时间（可能是已失效的定时项，只用于决定下次检查的时间）"""
+        return self._heap[0][0] if self._heap else None
+
+    def expired(self, now: float) -> List[str]:
+        """弹出并返回所有在 now 之前到期的代理
+
+        租约记录仍然保留，由调用方确认后撤销（revoke）或延长（extend）。
+        """
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, agent_id = heapq.heappop(self._heap)
+            if self._scheduled.get(agent_id) != deadline:
+                # 已被更早的定时项取代
+                continue
+            del self._scheduled[agent_id]
+            expires_at = self._expires.get(agent_id)
+            if expires_at is None:
+                continue
+            if expires_at > now:
+                # 期间已续约，按新的到期时间重新入堆
+                self._scheduled[agent_id] = expires_at
+                heapq.heappush(self._heap, (expires_at, agent_id))
+                continue
+            expired.append(agent_id)
+        return expired
@@ -0,0 +1,265 @@
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from array import array
+from concurrent.futures import Future
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+# 记录头：负载长度、负载的 CRC32、记录序号
+HEADER = struct.Struct("<IIQ")
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+
+
+class SegmentLog:
+    """本地磁盘上的分段追加日志
+
+    - 记录以 JSON 编码，带长度、CRC 和全局递增序号，只追加不修改
+    - 后台写线程做组提交：一批待写记录共用一次 write + fsync，调用方通过 Future 等待落盘
+    - 启动时通过 mmap 顺序回放所有分段，遇到未写完的尾部记录时截断
+    - 活动分段超过 segment_bytes 时滚动到新分段；compact() 先写入一条状态快照，
+      再删除超过保留时间或超出总大小上限的旧分段
+    - 记录每条记录所在的分段和偏移，read() 按序号随机读取已落盘的记录
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 retention_seconds: float = 0, max_total_bytes: int = 0, fsync: bool = True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.retention_seconds = retention_seconds
+        self.max_total_bytes = max_total_bytes
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self.next_seq = 1
+        self._file = None
+        self._active_path: Optional[str] = None
+        self._active_size = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        # 每个分段：(第一条记录的序号, 路径, 各记录的偏移)；分段内序号连续。
+        # 写线程只追加偏移或整体替换列表，读取方无需加锁
+        self._locations: List[Tuple[int, str, array]] = []
+        self._readers: Dict[str, Any] = {}
+        # 统计
+        self.commits = 0
+        self.records_written = 0
+
+    # 回放
+
+    def segments(self) -> List[str]:
+        """按序号排列的分段文件路径"""
+        names = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        return [os.path.join(self.directory, name) for name in names]
+
+    def replay(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """按顺序回放所有记录 (seq, record)，必须在 open() 之前调用"""
+        self._locations = []
+        for path in self.segments():
+            size = os.path.getsize(path)
+            if size == 0:
+                continue
+            offsets = array("Q")
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    offset = 0
+                    while offset + HEADER.size <= size:
+                        length, crc, seq = HEADER.unpack_from(view, offset)
+                        start = offset + HEADER.size
+                        payload = view[start:start + length]
+                        if len(payload) < length or zlib.crc32(payload) != crc:
+                            break
+                        if not offsets:
+                            self._locations.append((seq, path, offsets))
+                        offsets.append(offset)
+                        offset = start + length
+                        self.next_seq = seq + 1
+                        yield seq, codec.loads_json(payload)
+            if offset < size:
+                # 崩溃时未写完的尾部记录
+                logger.warning(f"Truncating torn tail of {path} at offset {offset}")
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+
+    # 写入
+
+    def open(self):
+        """打开活动分段并启动写线程"""
+        segments = self.segments()
+        if segments and self.next_seq == 1:
+            # 尚未回放时先扫描一遍以确定下一个序号
+            for _ in self.replay():
+                pass
+        if segments and os.path.getsize(segments[-1]) < self.segment_bytes:
+            self._open_segment(segments[-1])
+        else:
+            self._roll()
+        self._writer = threading.Thread(target=self._run, name="segment-log-writer", daemon=True)
+        self._writer.start()
+
+    def close(self):
+        """写完已提交的记录后停止写线程"""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        for reader in self._readers.values():
+            reader.close()
+        self._readers.clear()
+
+    def append(self, record: Dict[str, Any]) -> Future:
+        """提交一条记录，立即返回；Future 在记录落盘后完成，结果为记录序号"""
+        future: Future = Future()
+        self._queue.put(("record", record, future))
+        return future
+
+    def compact(self, snapshot: Dict[str, Any]) -> Future:
+        """写入状态快照记录后清理旧分段；快照之后的回放不再依赖被删除的分段"""
+        future: Future = Future()
+        self._queue.put(("compact", snapshot, future))
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # 组提交：把写线程忙碌期间积累的记录一起写入
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            batch = [entry for entry in batch if entry is not None]
+            try:
+                self._commit(batch)
+            except Exception as e:
+                logger.error(f"Error writing segment log: {str(e)}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            if stop:
+                return
+
+    def _commit(self, batch: List[Tuple[str, Dict[str, Any], Future]]):
+        if not batch:
+            return
+        done: List[Tuple[Future, int]] = []
+        snapshot_path = None
+        for kind, record, future in batch:
+            if self._active_size >= self.segment_bytes:
+                self._roll()
+            payload = codec.dumps_json(record).encode("utf-8")
+            seq = self.next_seq
+            self.next_seq += 1
+            self._locations[-1][2].append(self._active_size)
+            self._file.write(HEADER.pack(len(payload), zlib.crc32(payload), seq))
+            self._file.write(payload)
+            self._active_size += HEADER.size + len(payload)
+            done.append((future, seq))
+            if kind == "compact":
+                snapshot_path = self._active_path
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.commits += 1
+        self.records_written += len(batch)
+        if snapshot_path is not None:
+            self._delete_old_segments(snapshot_path)
+        for future, seq in done:
+            future.set_result(seq)
+
+    def _open_segment(self, path: str):
+        self._file = open(path, "ab")
+        self._active_path = path
+        self._active_size = os.path.getsize(path)
+        if not self._locations or self._locations[-1][1] != path:
+            self._locations.append((self.next_seq, path, array("Q")))
+
+    def _roll(self):
+        if self._file is not None:
+            self._file.close()
+        name = f"{SEGMENT_PREFIX}{self.next_seq:020d}{SEGMENT_SUFFIX}"
+        self._open_segment(os.path.join(self.directory, name))
+        logger.info(f"Rolled segment log to {name}")
+
+    def _delete_old_segments(self, snapshot_path: str):
+        """删除快照所在分段之前、超过保留时间或超出总大小上限的分段"""
+        sealed = [path for path in self.segments() if path < snapshot_path]
+        now = time.time()
+        total = sum(os.path.getsize(path) for path in self.segments())
+        for path in sealed:
+            expired = self.retention_seconds and now - os.path.getmtime(path) > self.retention_seconds
+            oversized = self.max_total_bytes and total > self.max_total_bytes
+            if not (expired or oversized):
+                continue
+            total -= os.path.getsize(path)
+            os.remove(path)
+            self._locations = [location for location in self._locations if location[1] != path]
+            logger.info(f"Removed compacted segment {os.path.basename(path)}")
+
+    # 读取
+
+    @property
+    def first_seq(self) -> int:
+        """仍可读取的最旧记录的序号"""
+        locations = self._locations
+        return locations[0][0] if locations else self.next_seq
+
+    def read(self, seq: int) -> Optional[Dict[str, Any]]:
+        """按序号读取一条已落盘的记录，所在分段已被删除时返回 None
+
+        只能在同一个线程中调用（各分段的读句柄不加锁共用）。
+        """
+        locations = self._locations
+        # 查询通常集中在最近的记录，从最新的分段往前找
+        for base, path, offsets in reversed(locations):
+            if seq >= base:
+                break
+        else:
+            return None
+        index = seq - base
+        if index >= len(offsets):
+            return None
+        if len(self._readers) > len(locations):
+            # 关闭已删除分段的读句柄
+            live = {location[1] for location in locations}
+            for stale in [name for name in self._readers if name not in live]:
+                self._readers.pop(stale).close()
+        try:
+            reader = self._readers.get(path)
+            if reader is None:
+                reader = self._readers[path] = open(path, "rb")
+            reader.seek(offsets[index])
+            length, _, _ = HEADER.unpack(reader.read(HEADER.size))
+            return codec.loads_json(reader.read(length))
+        except (OSError, struct.error, ValueError) as e:
+            logger.warning(f"Failed to read record {seq} from {path}: {str(e)}")
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        segments = self.segments()
+        return {
+            "directory": self.directory,
+            "segments": len(segments),
+            "total_bytes": sum(os.path.getsize(path) for path in segments),
+            "next_seq": self.next_seq,
+            "commits": self.commits,
+            "records_written": self.records_written,
+            "pending": self._queue.qsize(),
+        }
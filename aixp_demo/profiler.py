@@ -0,0 +1,248 @@
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 不属于任何被抽样请求的样本
+IDLE = "<idle>"
+OTHER = "<other>"
+
+# 事件循环空闲时栈顶所在的函数
+IDLE_FUNCTIONS = {"select", "poll", "run_until_complete", "run_forever"}
+
+
+class ProfilerRunning(Exception):
+    """分析器已在运行"""
+
+
+def _frame_name(code: CodeType) -> str:
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """按路由归集调用栈的采样分析器
+
+    后台线程每隔 interval 秒读取一次事件循环线程的当前调用栈。被抽样的请求由
+    ProfilingMiddleware 登记其所在的栈帧，采样时沿栈向外查找该栈帧即可知道样本属于哪个路由；
+    不属于任何被抽样请求的样本记为 <idle>（事件循环在等待 IO）或 <other>（后台任务、未被抽样的请求）。
+    停止时写出 collapsed stack（可直接交给 flamegraph.pl）和 speedscope 格式的文件。
+    """
+
+    def __init__(self, output_dir: str, interval: float = 0.005):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.sample_rate = 1.0
+        self.running = False
+        # 被抽样请求的中间件栈帧 -> ASGI scope
+        self.requests: Dict[FrameType, Dict[str, Any]] = {}
+        self.sampled_requests = 0
+        self.last_result: Optional[Dict[str, Any]] = None
+        # 端点函数 -> "METHOD /path"
+        self._routes: Dict[Any, str] = {}
+        # (路由, 从外到内的代码对象) -> 样本数
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._target: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._started_at = 0.0
+        self._deadline: Optional[float] = None
+
+    def set_routes(self, routes: List[Any]):
+        """记录各端点函数对应的路由名，用于给样本命名"""
+        for route in routes:
+            endpoint = getattr(route, "endpoint", None)
+            if endpoint is None:
+                continue
+            methods = ",".join(sorted(getattr(route, "methods", None) or ()))
+            self._routes[endpoint] = f"{methods} {route.path}".strip()
+
+    def start(self, duration: Optional[float] = None, sample_rate: float = 1.0,
+              interval: Optional[float] = None):
+        """开始采样；必须在事件循环线程中调用。指定 duration 时到期自动停止并写出文件"""
+        if self.running:
+            raise ProfilerRunning("Profiler is already running")
+        if interval:
+            self.interval = interval
+        self.sample_rate = sample_rate
+        self.requests.clear()
+        self.sampled_requests = 0
+        self._stacks = Counter()
+        self._samples = 0
+        self._target = threading.get_ident()
+        self._started_at = time.monotonic()
+        self._deadline = self._started_at + duration if duration else None
+        self._stop_event.clear()
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="aixp-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Profiler started (interval={self.interval * 1000:g}ms, sample_rate={sample_rate}, "
+                    f"duration={duration or 'until stopped'})")
+
+    def stop(self) -> Optional[Dict[str, Any]]:
+        """停止采样并写出文件，返回摘要；会阻塞到采样线程退出"""
+        thread = self._thread
+        if thread is None:
+            return self.last_result
+        self._stop_event.set()
+        thread.join()
+        return self.last_result
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "sample_rate": self.sample_rate,
+            "samples": self._samples,
+            "sampled_requests": self.sampled_requests,
+            "elapsed_seconds": round(time.monotonic() - self._started_at, 3) if self.running else None,
+            "last_result": self.last_result,
+        }
+
+    def _run(self):
+        try:
+            while not self._stop_event.wait(self.interval):
+                if self._deadline is not None and time.monotonic() >= self._deadline:
+                    break
+                self._sample()
+        finally:
+            self.running = False
+            self.requests.clear()
+            self.last_result = self._dump()
+            self._thread = None
+
+    def _sample(self):
+        frame = sys._current_frames().get(self._target)
+        if frame is None:
+            return
+        top = frame.f_code
+        codes = []
+        route = None
+        while frame is not None:
+            codes.append(frame.f_code)
+            if route is None:
+                scope = self.requests.get(frame)
+                if scope is not None:
+                    route = self._route_name(scope)
+            frame = frame.f_back
+        if route is None:
+            route = IDLE if top.co_name in IDLE_FUNCTIONS else OTHER
+        codes.reverse()
+        self._stacks[(route, tuple(codes))] += 1
+        self._samples += 1
+
+    def _route_name(self, scope: Dict[str, Any]) -> str:
+        # 路由匹配后 Starlette 会把端点函数写入同一个 scope
+        endpoint = scope.get("endpoint")
+        name = self._routes.get(endpoint) if endpoint is not None else None
+        return name or f"{scope.get('method', '')} {scope.get('path', '')}".strip()
+
+    def _dump(self) -> Dict[str, Any]:
+        routes: Counter = Counter()
+        for (route, _), count in self._stacks.items():
+            routes[route] += count
+        result = {
+            "samples": self._samples,
+            "sampled_requests": self.sampled_requests,
+            "duration_seconds": round(time.monotonic() - self._started_at, 3),
+            "interval_ms": self.interval * 1000,
+            "routes": dict(routes.most_common()),
+            "files": [],
+        }
+        if not self._samples:
+            return result
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            base = os.path.join(self.output_dir, f"aixp-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}")
+            with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                f.write(self.collapsed())
+            with open(base + ".speedscope.json", "w", encoding="utf-8") as f:
+                json.dump(self.speedscope(), f)
+            result["files"] = [base + ".collapsed", base + ".speedscope.json"]
+            logger.info(f"Profiler stopped: {self._samples} samples written to {base}.*")
+        except OSError as e:
+            logger.error(f"Failed to write profile: {str(e)}")
+        return result
+
+    def collapsed(self) -> str:
+        """collapsed stack 格式：每行 "路由;外层帧;...;内层帧 样本数" """
+        lines = []
+        for (route, codes), count in self._stacks.items():
+            lines.append(";".join([route] + [_frame_name(code) for code in codes]) + f" {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> Dict[str, Any]:
+        """speedscope 文件格式，每个路由一个 sampled profile"""
+        frames: List[Dict[str, Any]] = []
+        frame_index: Dict[CodeType, int] = {}
+        profiles: Dict[str, Tuple[List[List[int]], List[float]]] = {}
+        for (route, codes), count in self._stacks.items():
+            stack = []
+            for code in codes:
+                index = frame_index.get(code)
+                if index is None:
+                    index = frame_index[code] = len(frames)
+                    frames.append({
+                        "name": getattr(code, "co_qualname", code.co_name),
+                        "file": code.co_filename,
+                        "line": code.co_firstlineno,
+                    })
+                stack.append(index)
+            samples, weights = profiles.setdefault(route, ([], []))
+            samples.append(stack)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "exporter": "aixp_demo",
+            "name": f"aixp worker {os.getpid()}",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": route,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+                for route, (samples, weights) in sorted(profiles.items(), key=lambda item: -sum(item[1][1]))
+            ],
+        }
+
+
+class ProfilingMiddleware:
+    """ASGI 中间件：分析器运行时按 sample_rate 抽样登记 HTTP 请求
+
+    分析器未运行时每个请求只多一次属性检查。
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if not profiler.running or scope["type"] != "http" or random.random() >= profiler.sample_rate:
+            await self.app(scope, receive, send)
+            return
+        await self._profiled(scope, receive, send)
+
+    async def _profiled(self, scope, receive, send):
+        # 登记本协程的栈帧，采样线程沿调用栈找到它即可把样本归到这个请求
+        frame = sys._getframe()
+        self.profiler.requests[frame] = scope
+        self.profiler.sampled_requests += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.requests.pop(frame, None)
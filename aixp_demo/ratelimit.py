@@ -0,0 +1,115 @@
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒的速度补充令牌，最多积攒 burst 个"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """取出 amount 个令牌前需要等待的秒数，0 表示可以立即取出（不消耗令牌）"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= amount:
+            return 0.0
+        return (min(amount, self.burst) - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """按键（如发送方）分别限速的令牌桶集合，rate 为 0 时不限速
+
+    长时间空闲、令牌已补满的桶与新建的桶等价，定期清理以限制内存占用。
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, prune_every: int = 4096):
+        self.rate = rate
+        self.burst = burst if burst else max(rate, 1.0)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._prune_every = prune_every
+        self._calls = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def bucket(self, key: str, now: float) -> Optional[TokenBucket]:
+        if not self.rate:
+            return None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+        self._calls += 1
+        if self._calls >= self._prune_every:
+            self._calls = 0
+            self._prune(now)
+        return bucket
+
+    def _prune(self, now: float):
+        refill = self.burst / self.rate
+        for key in [key for key, bucket in self._buckets.items() if now - bucket.updated >= refill]:
+            del self._buckets[key]
+
+
+class AdaptivePacer:
+    """客户端发送节奏：收到 429 时按服务器建议的时间暂停并加倍发送间隔，之后每次成功逐步缩小（AIMD）
+
+    加倍后的间隔不小于服务器通告的限速（X-RateLimit-Limit）对应的间隔，持续过载时
+    发送方在限速附近小幅振荡，而不是所有请求一起重试、反复触发 429。线程安全。
+    """
+
+    def __init__(self, max_interval: float = 1.0, decrease: float = 0.9):
+        self.max_interval = max_interval
+        self.decrease = decrease
+        self.interval = 0.0
+        self._next_at = 0.0
+        # 本轮退避窗口的结束时间：窗口内并发请求收到的多个 429 只加倍一次间隔
+        self._backoff_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """预约下一次发送，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            if not self.interval and self._next_at <= now:
+                return 0.0
+            start = max(now, self._next_at)
+            self._next_at = start + self.interval
+            return start - now
+
+    def backoff(self, retry_after: float, limit: Optional[float] = None):
+        """收到 429：retry_after 秒内不再发送，并加倍发送间隔"""
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._backoff_until:
+                floor = 1.0 / limit if limit else 0.001
+                self.interval = min(max(self.interval * 2, floor), self.max_interval)
+                self._backoff_until = now + max(retry_after, self.interval)
+            self._next_at = max(self._next_at, now + retry_after)
+
+    def success(self):
+        with self._lock:
+            if self.interval:
+                self.interval *= self.decrease
+                if self.interval < 0.0005:
+                    self.interval = 0.0
+
+
+def overload_hint(headers: Any) -> Tuple[float, Optional[float]]:
+    """从 429 响应头中读取 (建议等待秒数, 限速条/秒)；优先使用毫秒精度的 X-Retry-After-Ms"""
+    retry_after = headers.get("X-Retry-After-Ms")
+    if retry_after is not None:
+        retry_after = float(retry_after) / 1000
+    else:
+        retry_after = float(headers.get("Retry-After") or 1.0)
+    limit = headers.get("X-RateLimit-Limit")
+    return retry_after, float(limit) if limit else None
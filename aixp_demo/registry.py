@@ -0,0 +1,114 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple, Iterator
+
+_EMPTY: FrozenSet[str] = frozenset()
+
+
+class AgentRegistry:
+    """已注册代理及其能力的倒排索引
+
+    除了 agent_id -> 能力列表 的主表外，还维护 能力 -> 代理集合 的倒排索引，
+    以及按 agent_id 排序的列表，用于按能力查找和基于游标的分页，
+    查询代价与结果大小相关，而与注册代理总数无关。
+    """
+
+    def __init__(self):
+        self._agents: Dict[str, List[str]] = {}
+        self._by_capability: Dict[str, Set[str]] = {}
+        # 排序后的 agent_id 列表：全部代理及每种能力各一份
+        self._sorted_all: List[str] = []
+        self._sorted_by_capability: Dict[str, List[str]] = {}
+        # 每次注册或注销后递增，供依赖成员关系的缓存判断是否失效
+        self.version = 0
+        self._capability_versions: Dict[str, int] = {}
+
+    def __contains__(self, agent_id: str) -> bool:
+        return agent_id in self._agents
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def get(self, agent_id: str) -> Optional[List[str]]:
+        return self._agents.get(agent_id)
+
+    def items(self) -> Iterator[Tuple[str, List[str]]]:
+        return iter(self._agents.items())
+
+    def as_dict(self) -> Dict[str, List[str]]:
+        return self._agents
+
+    def register(self, agent_id: str, capabilities: List[str]):
+        """注册代理，重复注册时以新的能力列表为准"""
+        if agent_id in self._agents:
+            self._unindex(agent_id)
+        else:
+            insort(self._sorted_all, agent_id)
+        self._agents[agent_id] = capabilities
+        for capability in set(capabilities):
+            self._by_capability.setdefault(capability, set()).add(agent_id)
+            insort(self._sorted_by_capability.setdefault(capability, []), agent_id)
+            self._bump(capability)
+        self.version += 1
+
+    def unregister(self, agent_id: str) -> bool:
+        """注销代理，代理不存在时返回 False"""
+        if agent_id not in self._agents:
+            return False
+        self._unindex(agent_id)
+        del self._agents[agent_id]
+        _remove_sorted(self._sorted_all, agent_id)
+        self.version += 1
+        return True
+
+    def agents_with(self, capability: str) -> Set[str]:
+        """具备指定能力的所有代理（只读视图，调用方不应修改）"""
+        return self._by_capability.get(capability, _EMPTY)
+
+    def capability_version(self, capability: str) -> int:
+        """某项能力的成员版本号，仅在该能力的代理集合变化时递增"""
+        return self._capability_versions.get(capability, 0)
+
+    def ordered(self, capability: str) -> List[str]:
+        """具备指定能力的代理，按 agent_id 排序（只读视图，调用方不应修改）"""
+        return self._sorted_by_capability.get(capability, [])
+
+    def count(self, capability: Optional[str] = None) -> int:
+        if capability is None:
+            return len(self._agents)
+        return len(self._by_capability.get(capability, _EMPTY))
+
+    def page(self, capability: Optional[str] = None, limit: int = 100,
+             cursor: Optional[str] = None) -> Tuple[List[Tuple[str, List[str]]], Optional[str]]:
+        """按 agent_id 顺序分页列出代理
+
+        cursor 为上一页最后一个 agent_id，返回 (本页代理, 下一页游标)，没有更多结果时游标为 None。
+        """
+        if capability is None:
+            ids = self._sorted_all
+        else:
+            ids = self._sorted_by_capability.get(capability, [])
+        start = bisect_right(ids, cursor) if cursor is not None else 0
+        page_ids = ids[start:start + limit]
+        next_cursor = page_ids[-1] if start + limit < len(ids) and page_ids else None
+        return [(agent_id, self._agents[agent_id]) for agent_id in page_ids], next_cursor
+
+    def _bump(self, capability: str):
+        self._capability_versions[capability] = self._capability_versions.get(capability, 0) + 1
+
+    def _unindex(self, agent_id: str):
+        for capability in set(self._agents[agent_id]):
+            members = self._by_capability.get(capability)
+            if members is None:
+                continue
+            members.discard(agent_id)
+            self._bump(capability)
+            _remove_sorted(self._sorted_by_capability[capability], agent_id)
+            if not members:
+                del self._by_capability[capability]
+                del self._sorted_by_capability[capability]
+
+
+def _remove_sorted(ids: List[str], agent_id: str):
+    i = bisect_left(ids, agent_id)
+    if i < len(ids) and ids[i] == agent_id:
+        del ids[i]
@@ -0,0 +1,231 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """任务处理结果的内容寻址缓存
+
+    键为 (task, data) 规范 JSON 的 SHA-256，相同任务和相同数据总是命中同一条目。
+    - 内存中按最近使用顺序（LRU）保存，总大小（结果 JSON 编码后的字节数）不超过 max_bytes，
+      条目在写入 ttl 秒后过期（None 表示不过期）
+    - 指定 spill_dir 时，被 LRU 淘汰的条目写入该目录（root/<前两位>/<键>），命中后重新放回内存；
+      磁盘总大小超过 spill_max_bytes 时删除最旧的文件，过期的文件在读取或 prune() 时删除
+    - 线程安全；stats() 返回命中、未命中、淘汰等计数
+    - get() 未命中内存时会读磁盘；在事件循环中可先调用 get_memory()，未命中时在线程中调用 get_spilled()
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = None,
+                 spill_dir: Optional[str] = None, spill_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        # 键 -> (结果, 编码后的字节数, 过期时间)
+        self._entries: OrderedDict[str, Tuple[Dict[str, Any], int, Optional[float]]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._spill_bytes = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._spill_bytes = sum(size for _, size, _ in self._spilled_files())
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.spills = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(task: str, data: Any) -> str:
+        return hashlib.sha256(codec.dumps_canonical([task, data]).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """取出缓存的结果，未命中（或已过期）时返回 None"""
+        value = self.get_memory(key)
+        if value is None:
+            value = self.get_spilled(key)
+        return value
+
+    def get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        """只查内存，不读磁盘；未命中时不计入 misses（由随后的 get_spilled() 计入）"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, expires_at = entry
+            if expires_at is None or expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self._bytes -= size
+            self.expirations += 1
+        return None
+
+    def get_spilled(self, key: str) -> Optional[Dict[str, Any]]:
+        """查磁盘（未指定 spill_dir 时直接未命中），命中后放回内存；可能阻塞，应在线程中调用"""
+        value = self._load(key, time.time()) if self.spill_dir else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        size = len(codec.dumps_json(value).encode("utf-8"))
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        self._insert(key, value, size, expires_at)
+
+    def _insert(self, key: str, value: Dict[str, Any], size: int, expires_at: Optional[float]):
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                # 超过整个内存预算的结果直接写入磁盘
+                evicted.append((key, value, size, expires_at))
+            else:
+                self._entries[key] = (value, size, expires_at)
+                self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key, (old_value, old_size, old_expires_at) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+                evicted.append((old_key, old_value, old_size, old_expires_at))
+        if self.spill_dir:
+            now = time.time()
+            for old_key, old_value, old_size, old_expires_at in evicted:
+                if old_expires_at is None or old_expires_at > now:
+                    self._spill(old_key, old_value, old_expires_at)
+
+    # 磁盘
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, key[:2], key)
+
+    def _spill(self, key: str, value: Dict[str, Any], expires_at: Optional[float]):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        data = codec.dumps_json({"expires_at": expires_at, "value": value}).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入缓存文件 {path} 失败: {str(e)}")
+            return
+        with self._lock:
+            self.spills += 1
+            self._spill_bytes += len(data)
+            over = self.spill_max_bytes and self._spill_bytes > self.spill_max_bytes
+        if over:
+            self._trim_spilled()
+
+    def _load(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            record = codec.loads_json(data)
+        except (OSError, ValueError):
+            return None
+        if record["expires_at"] is not None and record["expires_at"] <= now:
+            self._remove(path, len(data))
+            with self._lock:
+                self.expirations += 1
+            return None
+        value = record["value"]
+        # 放回内存（磁盘上的副本保留，再次被淘汰时无需重写）
+        self._insert(key, value, len(codec.dumps_json(value).encode("utf-8")), record["expires_at"])
+        return value
+
+    def _remove(self, path: str, size: int):
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._spill_bytes -= size
+
+    def _spilled_files(self):
+        for prefix in os.listdir(self.spill_dir):
+            directory = os.path.join(self.spill_dir, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _trim_spilled(self):
+        """从最旧的文件开始删除，直到磁盘总大小降到上限的 90%"""
+        target = self.spill_max_bytes * 0.9
+        for path, size, _ in sorted(self._spilled_files(), key=lambda item: item[2]):
+            if self._spill_bytes <= target:
+                break
+            self._remove(path, size)
+
+    def prune(self) -> int:
+        """删除内存和磁盘中已过期的条目，返回删除的数量"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for key in [key for key, (_, _, expires_at) in self._entries.items()
+                        if expires_at is not None and expires_at <= now]:
+                self._bytes -= self._entries.pop(key)[1]
+                removed += 1
+        if self.spill_dir:
+            for path, size, _ in list(self._spilled_files()):
+                try:
+                    with open(path, "rb") as f:
+                        expires_at = codec.loads_json(f.read())["expires_at"]
+                except (OSError, ValueError, KeyError):
+                    continue
+                if expires_at is not None and expires_at <= now:
+                    self._remove(path, size)
+                    removed += 1
+        with self._lock:
+            self.expirations += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "spill_bytes": self._spill_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "spills": self.spills,
+        }
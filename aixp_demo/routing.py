@@ -0,0 +1,126 @@
+import hashlib
+import random
+from bisect import bisect_right
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from registry import AgentRegistry
+
+# 路由策略名称
+ROUND_ROBIN = "round_robin"
+LEAST_OUTSTANDING = "least_outstanding"
+CONSISTENT_HASH = "consistent_hash"
+
+
+class NoRouteError(Exception):
+    """没有具备所需能力的代理"""
+
+
+class RoutingPolicy:
+    """路由策略：从具备某项能力的候选代理中选出一个"""
+
+    def choose(self, capability: str, candidates: List[str], data: Dict[str, Any],
+               route_key: Optional[str]) -> str:
+        raise NotImplementedError
+
+
+class RoundRobinPolicy(RoutingPolicy):
+    """按 agent_id 顺序轮询"""
+
+    def __init__(self):
+        self._counters: Dict[str, int] = {}
+
+    def choose(self, capability, candidates, data, route_key):
+        n = self._counters.get(capability, 0)
+        self._counters[capability] = n + 1
+        return candidates[n % len(candidates)]
+
+
+class LeastOutstandingPolicy(RoutingPolicy):
+    """选择收件箱中待处理消息最少的代理
+
+    候选较少时精确比较全部代理；候选很多时采用“二选一”（随机取两个，选较空闲者），
+    代价为常数且负载分布接近最优。
+    """
+
+    def __init__(self, depth: Callable[[str], int], exact_threshold: int = 32):
+        self.depth = depth
+        self.exact_threshold = exact_threshold
+
+    def choose(self, capability, candidates, data, route_key):
+        if len(candidates) <= self.exact_threshold:
+            return min(candidates, key=self.depth)
+        first, second = random.sample(candidates, 2)
+        return first if self.depth(first) <= self.depth(second) else second
+
+
+class ConsistentHashPolicy(RoutingPolicy):
+    """按 data 中某个字段做一致性哈希，相同键的消息落到同一代理（亲和性）
+
+    每种能力一个带虚拟节点的哈希环，代理增减时只有少量键会迁移；
+    哈希环按该能力的成员版本缓存，成员不变时不会重建。消息缺少路由键时退化为轮询。
+    """
+
+    def __init__(self, registry: AgentRegistry, default_key: str = "key", replicas: int = 64):
+        self.registry = registry
+        self.default_key = default_key
+        self.replicas = replicas
+        self._rings: Dict[str, Tuple[int, List[int], List[str]]] = {}
+        self._fallback = RoundRobinPolicy()
+
+    def choose(self, capability, candidates, data, route_key):
+        key = data.get(route_key or self.default_key)
+        if key is None:
+            return self._fallback.choose(capability, candidates, data, route_key)
+        hashes, owners = self._ring(capability, candidates)
+        i = bisect_right(hashes, _hash(str(key))) % len(hashes)
+        return owners[i]
+
+    def _ring(self, capability: str, candidates: List[str]) -> Tuple[List[int], List[str]]:
+        cached = self._rings.get(capability)
+        version = self.registry.capability_version(capability)
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+        points = sorted(
+            (_hash(f"{agent_id}#{i}"), agent_id)
+            for agent_id in candidates
+            for i in range(self.replicas)
+        )
+        hashes = [h for h, _ in points]
+        owners = [agent_id for _, agent_id in points]
+        self._rings[capability] = (version, hashes, owners)
+        return hashes, owners
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class Router:
+    """按能力路由消息，策略可按消息指定或使用默认策略"""
+
+    def __init__(self, registry: AgentRegistry, depth: Callable[[str], int],
+                 default_policy: str = ROUND_ROBIN, hash_key: str = "key"):
+        self.registry = registry
+        self.policies: Dict[str, RoutingPolicy] = {
+            ROUND_ROBIN: RoundRobinPolicy(),
+            LEAST_OUTSTANDING: LeastOutstandingPolicy(depth),
+            CONSISTENT_HASH: ConsistentHashPolicy(registry, default_key=hash_key),
+        }
+        if default_policy not in self.policies:
+            raise ValueError(f"Unknown routing policy: {default_policy}")
+        self.default_policy = default_policy
+
+    def register_policy(self, name: str, policy: RoutingPolicy):
+        """注册自定义路由策略"""
+        self.policies[name] = policy
+
+    def route(self, capability: str, data: Dict[str, Any], policy: Optional[str] = None,
+              route_key: Optional[str] = None) -> str:
+        """为消息选择一个具备 capability 的代理"""
+        name = policy or self.default_policy
+        if name not in self.policies:
+            raise ValueError(f"Unknown routing policy: {name}")
+        candidates = self.registry.ordered(capability)
+        if not candidates:
+            raise NoRouteError(f"No agent with capability {capability}")
+        return self.policies[name].choose(capability, candidates, data, route_key)
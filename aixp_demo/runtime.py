@@ -0,0 +1,310 @@
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Set
+
+from resultcache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+# 处理函数的执行方式：asyncio（在事件循环中运行，适合 IO 密集的协程）、
+# thread（线程池）、process（进程池，适合 CPU 密集的处理，可用满所有核心）
+EXECUTORS = ("asyncio", "thread", "process")
+
+
+class Handler:
+    """一个任务的处理函数及其执行方式"""
+
+    __slots__ = ("task", "function", "executor", "timeout", "with_message", "cached", "semaphore")
+
+    def __init__(self, task: str, function: Callable, executor: str, timeout: Optional[float],
+                 with_message: bool, cached: bool, max_concurrency: Optional[int]):
+        self.task = task
+        self.function = function
+        self.executor = executor
+        self.timeout = timeout
+        self.with_message = with_message
+        self.cached = cached
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+
+class AgentRuntime:
+    """代理的任务处理运行时
+
+    按 task 名登记处理函数，运行时从收件箱拉取消息并分发给处理函数，处理结果自动发回：
+    调用（带 correlation_id 的消息）以 reply() 响应，处理失败或超时时响应错误；
+    普通消息的非 None 结果以 "<task>_result" 任务发回发送方。
+
+    - 调度在一个事件循环中进行；同时处理的消息不超过 max_concurrency 条，
+      槽位用满时不再拉取，积压留在服务器收件箱中（超过高水位后发送方收到 429）
+    - 处理函数接收消息的 data（with_message=True 时为整条消息），返回 dict；
+      process 执行器中的处理函数和参数必须可以 pickle（模块级函数）
+    - 超时从消息分发开始计时，并且不超过调用的截止时间；截止时间已过的调用直接丢弃。
+      线程和进程中已经开始执行的处理函数无法中断，超时后其结果被丢弃
+    - 指定 cache 时，登记为 cached 的任务按 (task, data) 缓存结果：命中时直接响应，不进入执行器；
+      相同的未命中请求同时到达时只执行一次，其余请求等待同一个结果
+
+    同时支持 AIXPAgent（阻塞调用在线程中执行）和 AsyncAIXPAgent（须在代理所在的事件循环中 serve()）。
+    """
+
+    def __init__(self, agent: Any, executor: str = "thread", max_concurrency: Optional[int] = None,
+                 max_workers: Optional[int] = None, timeout: Optional[float] = None, poll_timeout: float = 5.0,
+                 cache: Optional[ResultCache] = None):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor}, expected one of {', '.join(EXECUTORS)}")
+        self.agent = agent
+        self.executor = executor
+        # 线程池和进程池的大小，默认分别使用标准库的默认值和 CPU 核数
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency or max(2 * (max_workers or os.cpu_count() or 1), 16)
+        self.timeout = timeout
+        # 长轮询等待时长，也是 stop() 后最多等待的时间
+        self.poll_timeout = poll_timeout
+        self.cache = cache
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.expired = 0
+        self.coalesced = 0
+        self._handlers: Dict[str, Handler] = {}
+        self._pools: Dict[str, Executor] = {}
+        # 缓存键 -> 正在执行的处理（相同请求合并等待）
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._is_async = inspect.iscoroutinefunction(agent.receive)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._slot_free: Optional[asyncio.Event] = None
+        self._stop_requested = False
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, task: str, function: Callable, executor: Optional[str] = None,
+                 timeout: Optional[float] = None, max_concurrency: Optional[int] = None,
+                 with_message: bool = False, cached: bool = False):
+        """登记任务的处理函数
+
+        executor 默认为：协程函数使用 asyncio，其他函数使用运行时的默认执行器；
+        timeout 默认使用运行时的 timeout；max_concurrency 限制该任务同时处理的消息数。
+        cached 表示结果只取决于 (task, data)，运行时指定了 cache 时缓存其结果。
+        """
+        if executor is None:
+            executor = "asyncio" if inspect.iscoroutinefunction(function) else self.executor
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor}, expected one of {', '.join(EXECUTORS)}")
+        self._handlers[task] = Handler(task, function, executor, timeout, with_message, cached, max_concurrency)
+
+    def handler(self, task: str, **options) -> Callable[[Callable], Callable]:
+        """register() 的装饰器形式"""
+        def decorator(function: Callable) -> Callable:
+            self.register(task, function, **options)
+            return function
+        return decorator
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "expired": self.expired,
+        }
+        if self.cache is not None:
+            stats["coalesced"] = self.coalesced
+            stats["cache"] = self.cache.stats()
+        return stats
+
+    # 运行
+
+    def run(self):
+        """在当前线程中运行，直到 stop()"""
+        asyncio.run(self.serve())
+
+    def start(self) -> "AgentRuntime":
+        """在后台线程中运行（仅用于 AIXPAgent）"""
+        self._thread = threading.Thread(target=self.run, name=f"runtime-{self.agent.agent_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, wait: bool = True):
+        """停止拉取新消息，处理完已拉取的消息后退出；可在任意线程中调用"""
+        self._stop_requested = True
+        loop, stopping = self._loop, self._stopping
+        if loop is not None and stopping is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(stopping.set)
+        if wait and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+
+    async def serve(self):
+        """拉取并处理消息，直到 stop()"""
+        self._stopping = asyncio.Event()
+        self._slot_free = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        if self._stop_requested:
+            self._stopping.set()
+        tasks: Set[asyncio.Task] = set()
+        logger.info(f"代理 {self.agent.agent_id} 开始处理任务：{', '.join(self._handlers) or '无'}")
+        try:
+            while not self._stopping.is_set():
+                while self.in_flight >= self.max_concurrency:
+                    self._slot_free.clear()
+                    await self._slot_free.wait()
+                try:
+                    messages = await self._agent_call("receive", self.max_concurrency - self.in_flight,
+                                                      self.poll_timeout)
+                except Exception as e:
+                    logger.error(f"代理 {self.agent.agent_id} 拉取消息失败: {str(e)}")
+                    await asyncio.sleep(1.0)
+                    continue
+                for message in messages:
+                    self.in_flight += 1
+                    task = asyncio.create_task(self._handle(message))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for pool in self._pools.values():
+                # 超时后仍在运行的处理函数不再等待
+                pool.shutdown(wait=False, cancel_futures=True)
+            self._pools.clear()
+            self._loop = None
+            logger.info(f"代理 {self.agent.agent_id} 停止处理任务：{self.stats()}")
+
+    async def _agent_call(self, name: str, *args, **kwargs) -> Any:
+        """调用代理的方法：AsyncAIXPAgent 直接等待，AIXPAgent 的阻塞调用在线程中执行"""
+        method = getattr(self.agent, name)
+        if self._is_async:
+            return await method(*args, **kwargs)
+        return await asyncio.to_thread(method, *args, **kwargs)
+
+    def _pool(self, executor: str) -> Executor:
+        pool = self._pools.get(executor)
+        if pool is None:
+            if executor == "process":
+                pool = ProcessPoolExecutor(self.max_workers)
+            else:
+                pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f"handler-{self.agent.agent_id}")
+            self._pools[executor] = pool
+        return pool
+
+    async def _handle(self, message: Dict[str, Any]):
+        try:
+            await self._process(message)
+        except Exception as e:
+            logger.error(f"代理 {self.agent.agent_id} 发送处理结果时发生错误: {str(e)}")
+        finally:
+            self.in_flight -= 1
+            self._slot_free.set()
+
+    async def _process(self, message: Dict[str, Any]):
+        task = message.get("task")
+        if message.get("in_reply_to") is not None:
+            # 本代理发起的调用的响应（或超时通知）：处理函数中发起的调用可能在运行时的长轮询进行中开始，
+            # 响应因此由运行时拉取到，交给代理分发给等待的 Future
+            resolve = getattr(self.agent, "_resolve_reply", None)
+            if resolve is None or not resolve(message):
+                logger.debug(f"忽略调用 {message['in_reply_to']} 的响应")
+            return
+        is_call = message.get("correlation_id") is not None
+        handler = self._handlers.get(task)
+        if handler is None:
+            logger.warning(f"代理 {self.agent.agent_id} 没有任务 {task} 的处理函数")
+            self.failed += 1
+            if is_call:
+                await self._agent_call("reply", message, {}, error=f"没有任务 {task} 的处理函数")
+            return
+        timeout = handler.timeout if handler.timeout is not None else self.timeout
+        deadline = message.get("deadline")
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                # 调用方已经收到超时通知
+                self.expired += 1
+                return
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        argument = message if handler.with_message else message.get("data", {})
+        error = None
+        result = None
+        try:
+            if handler.cached and self.cache is not None:
+                result = await self._cache_get(self.cache.key(task, message.get("data", {})))
+            if result is None:
+                result = await asyncio.wait_for(self._execute_once(handler, argument, message), timeout)
+            self.processed += 1
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            error = f"任务 {task} 处理超时（{timeout:g} 秒）"
+        except Exception as e:
+            self.failed += 1
+            error = f"{type(e).__name__}: {str(e)}"
+            logger.error(f"代理 {self.agent.agent_id} 处理任务 {task} 时发生错误: {error}")
+        if result is not None and not isinstance(result, dict):
+            result = {"result": result}
+        if is_call and deadline is not None and time.time() >= deadline:
+            # 处理在调用截止时间之后才结束，调用方已经收到超时通知
+            logger.debug(f"调用 {message['correlation_id']} 已超时，不再响应")
+            return
+        if is_call:
+            await self._agent_call("reply", message, result or {}, error=error)
+        elif error is None and result is not None:
+            await self._agent_call("send_message", message["sender_id"], f"{task}_result", result)
+        elif error is not None:
+            logger.warning(f"代理 {self.agent.agent_id} 的任务 {task} 未完成: {error}")
+
+    async def _execute_once(self, handler: Handler, argument: Any, message: Dict[str, Any]) -> Any:
+        """执行处理函数；可缓存的任务合并相同的并发请求，并把结果写入缓存"""
+        if not handler.cached or self.cache is None:
+            return await self._execute(handler, argument)
+        key = self.cache.key(handler.task, message.get("data", {}))
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.coalesced += 1
+        else:
+            pending = self._pending[key] = asyncio.ensure_future(self._execute(handler, argument))
+            pending.add_done_callback(functools.partial(self._store, key))
+        # 某个等待方超时不影响共享的处理和其他等待方
+        return await asyncio.shield(pending)
+
+    async def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        """查缓存：内存在事件循环中直接查，磁盘在线程中读取，不阻塞其他消息的处理"""
+        result = self.cache.get_memory(key)
+        if result is None:
+            if self.cache.spill_dir:
+                result = await asyncio.to_thread(self.cache.get_spilled, key)
+            else:
+                result = self.cache.get_spilled(key)
+        return result
+
+    def _store(self, key: str, pending: asyncio.Future):
+        del self._pending[key]
+        if pending.cancelled() or pending.exception() is not None:
+            return
+        if pending.result() is None:
+            return
+        if self.cache.spill_dir:
+            # 写入可能把被淘汰的条目写到磁盘，同样放到线程中
+            asyncio.get_running_loop().run_in_executor(None, self.cache.put, key, pending.result())
+        else:
+            self.cache.put(key, pending.result())
+
+    async def _execute(self, handler: Handler, argument: Any) -> Any:
+        if handler.semaphore is not None:
+            async with handler.semaphore:
+                return await self._run_handler(handler, argument)
+        return await self._run_handler(handler, argument)
+
+    async def _run_handler(self, handler: Handler, argument: Any) -> Any:
+        if handler.executor == "asyncio":
+            result = handler.function(argument)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        return await asyncio.get_running_loop().run_in_executor(
+            self._pool(handler.executor), handler.function, argument
+        )
@@ -1,16 +1,42 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
-from typing import Dict, Any, List, Set
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, RootModel, ValidationError
+from typing import Callable, Dict, Any, List, Optional, Tuple
 import uvicorn
+import asyncio
+import functools
 import logging
-import json
+import math
+import random
 import sys
+import time
+import uuid
 from datetime import datetime
 
+import codec
+import config
+from broadcaster import Broadcaster
+from calls import CallTable
+from events import EventStream
+from backends import BackendBusy, create_backend
+from blobstore import (
+    BlobNotFound, BlobStore, BlobTooLarge, DigestMismatch, RangeNotSatisfiable, parse_range, references
+)
+from history import HistoryIndex, INDEXED_FIELDS, RingBuffer
+from inbox import InboxFull
+from leases import LeaseTable
+from metrics import Registry
+from persistence import SegmentLog
+from profiler import ProfilingMiddleware, ProfilerRunning, SamplingProfiler
+from ratelimit import RateLimiter
+from registry import AgentRegistry
+from routing import Router, NoRouteError
+from topics import TopicIndex, validate_topic
+
 # 配置日志
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=config.LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(sys.stdout)
@@ -18,76 +44,612 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 抽样的单条消息处理耗时
+trace_logger = logging.getLogger("aixp.trace")
+
 app = FastAPI(title="AIXP Demo")
 
-# 存储已注册的代理
-registered_agents: Dict[str, List[str]] = {}
+# 按路由归集调用栈的采样分析器，未运行时中间件只做一次属性检查
+profiler = SamplingProfiler(config.PROFILE_DIR, config.PROFILE_INTERVAL / 1000)
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+@app.exception_handler(BackendBusy)
+async def backend_busy(request: Request, exc: BackendBusy):
+    """共享后端的写锁被其他工作进程占用：快速失败，由客户端稍后重试"""
+    throttled_total.inc(reason="backend_busy")
+    return JSONResponse({"detail": f"Shared backend is busy: {str(exc)}"}, status_code=503,
+                        headers={"Retry-After": "1"})
+
+# 存储已注册的代理（带能力倒排索引）
+registered_agents = AgentRegistry()
+
+# 主题订阅（前缀树，发布时按主题匹配订阅方）
+topic_index = TopicIndex()
+
+# 存储消息历史（固定容量的环形缓冲区，写满后淘汰最旧的记录）
+message_history = RingBuffer(config.HISTORY_SIZE)
+
+# 共享状态与发布/订阅后端：单进程时为进程内实现，多工作进程时各进程通过后端同步
+backend = create_backend(
+    config.BACKEND,
+    inbox_size=config.INBOX_SIZE,
+    sqlite_path=config.SQLITE_PATH,
+    poll_interval=config.BACKEND_POLL_INTERVAL / 1000,
+    history_size=config.HISTORY_SIZE,
+    busy_timeout=config.SQLITE_BUSY_TIMEOUT / 1000
+)
+
+# 每个代理的收件箱（由后端存储）
+inboxes = backend.inboxes
+
+# 代理注册租约：到期未续约的代理被自动注销
+leases = LeaseTable()
+
+# 准入控制：每个发送方和本进程全局的令牌桶限速
+sender_limiter = RateLimiter(config.SENDER_RATE, config.SENDER_BURST)
+global_limiter = RateLimiter(config.GLOBAL_RATE, config.GLOBAL_BURST)
+
+# 进行中的请求/响应调用，超时由最小堆驱动
+calls = CallTable()
+
+# 按能力路由消息
+router = Router(
+    registered_agents,
+    depth=inboxes.depth,
+    default_policy=config.ROUTING_POLICY,
+    hash_key=config.ROUTING_HASH_KEY
+)
+
+# 可选的持久化日志：消息和注册记录写入磁盘上的分段追加日志，重启时回放
+# 共享后端自身即持久化存储，且多个工作进程不能共用同一个日志，此时不启用
+message_log = SegmentLog(
+    config.PERSIST_DIR,
+    segment_bytes=config.PERSIST_SEGMENT_BYTES,
+    retention_seconds=config.PERSIST_RETENTION_SECONDS,
+    max_total_bytes=config.PERSIST_MAX_BYTES
+) if config.PERSIST_DIR and config.BACKEND == "memory" else None
+if config.PERSIST_DIR and message_log is None:
+    logger.warning(f"AIXP_PERSIST_DIR is ignored with the {config.BACKEND} backend")
+if message_log is not None and not config.PERSIST_RETENTION_SECONDS and not config.PERSIST_MAX_BYTES:
+    logger.warning("AIXP_PERSIST_RETENTION_SECONDS and AIXP_PERSIST_MAX_BYTES are both 0: "
+                   f"the message log in {config.PERSIST_DIR} will grow without bound")
+
+# 消息历史的二级索引（发送方、接收方、任务、时间），供 /messages 查询。
+# 启用持久化日志时索引日志中的全部记录（位置为日志序号），否则索引内存中的环形缓冲区
+def read_logged(seq: int) -> Optional[Dict[str, Any]]:
+    record = message_log.read(seq)
+    return record.get("entry") if record is not None else None
+
+history_index = HistoryIndex(read_logged if message_log is not None else message_history.get)
+history_source = "log" if message_log is not None else "memory"
+
+# 内容寻址的大对象存储：大负载单独流式上传，消息中只携带引用
+blobs = BlobStore(config.BLOB_DIR, max_size=config.BLOB_MAX_BYTES)
 
-# 存储活动的 WebSocket 连接
-active_connections: Set[WebSocket] = set()
+# 仪表盘增量事件流
+event_stream = EventStream(maxlen=config.EVENT_REPLAY_SIZE)
 
-# 存储消息历史
-message_history: List[Dict[str, Any]] = []
+# 指标：热路径上只做计数和直方图分桶，队列深度等状态在 /metrics 抓取时读取
+metrics = Registry()
+registrations_total = metrics.counter("aixp_registrations_total", "Agents registered", ["endpoint"])
+register_seconds = metrics.histogram("aixp_register_seconds", "Registration request latency", ["endpoint"])
+unregistrations_total = metrics.counter("aixp_unregistrations_total", "Agents removed", ["reason"])
+messages_total = metrics.counter("aixp_messages_total", "Messages submitted for delivery", ["endpoint", "status"])
+send_seconds = metrics.histogram("aixp_send_seconds", "Send request latency", ["endpoint"])
+broadcast_events_total = metrics.counter("aixp_broadcast_events_total", "Dashboard events published")
+broadcast_seconds = metrics.histogram(
+    "aixp_broadcast_seconds", "Time to enqueue a published frame for all dashboard clients",
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+)
+blob_bytes_total = metrics.counter("aixp_blob_bytes_total", "Blob bytes uploaded and downloaded", ["direction"])
+throttled_total = metrics.counter("aixp_throttled_total", "Messages rejected by admission control", ["reason"])
+calls_total = metrics.counter("aixp_calls_total", "Request/response calls", ["outcome"])
+websocket_connections_total = metrics.counter("aixp_websocket_connections_total", "WebSocket connections accepted", ["channel"])
+websocket_disconnections_total = metrics.counter("aixp_websocket_disconnections_total", "WebSocket connections closed", ["channel"])
+websocket_clients = metrics.gauge("aixp_websocket_clients", "Open WebSocket connections", ["channel"])
+websocket_session_seconds = metrics.histogram(
+    "aixp_websocket_session_seconds", "WebSocket connection lifetime", ["channel"],
+    buckets=(1, 10, 60, 300, 900, 3600, 14400, 86400)
+)
+metrics.callback_counter("aixp_broadcast_frames_encoded_total", "Broadcast frames serialized",
+                         lambda: broadcaster.frames_encoded)
+metrics.callback_counter("aixp_broadcast_encode_seconds_total", "Time spent serializing broadcast frames",
+                         lambda: broadcaster.encode_seconds)
+metrics.callback_counter("aixp_broadcast_write_seconds_total", "Time spent writing frames to dashboard sockets",
+                         lambda: broadcaster.stats()["total_write_seconds"])
+metrics.gauge("aixp_broadcast_queue_depth", "Events queued for dashboard clients",
+              function=lambda: sum(len(channel.queue) for channel in broadcaster.channels))
+metrics.gauge("aixp_agents", "Registered agents", function=lambda: len(registered_agents))
+metrics.gauge("aixp_leases", "Agents holding a lease", function=lambda: len(leases))
+metrics.gauge("aixp_topic_subscriptions", "Topic subscriptions", function=lambda: len(topic_index))
+metrics.gauge("aixp_calls_pending", "Calls waiting for a reply", function=lambda: len(calls))
+metrics.gauge("aixp_inbox_messages", "Messages waiting in agent inboxes", function=lambda: inboxes.total_depth())
+metrics.gauge("aixp_history_size", "Entries in the message history", function=lambda: len(message_history))
+metrics.gauge("aixp_event_seq", "Sequence number of the latest dashboard event", function=lambda: event_stream.seq)
+
+def sampled() -> bool:
+    """按 AIXP_TRACE_SAMPLE_RATE 抽样决定是否记录本次处理的耗时"""
+    return config.TRACE_SAMPLE_RATE > 0 and random.random() < config.TRACE_SAMPLE_RATE
 
 class Message(BaseModel):
     sender_id: str
-    receiver_id: str
+    # receiver_id 与 capability 二选一：指定 capability 时由服务器按路由策略选择接收方
+    receiver_id: Optional[str] = None
     task: str
     data: Dict[str, Any]
+    capability: Optional[str] = None
+    # 路由策略（round_robin、least_outstanding、consistent_hash），默认使用服务器配置
+    routing: Optional[str] = None
+    # 一致性哈希使用的 data 字段名
+    route_key: Optional[str] = None
+    # 请求/响应：设置 correlation_id 或 timeout 即发起一次调用（未指定 correlation_id 时由服务器生成），
+    # 接收方的响应在超时（秒）前被路由回调用方，到期未响应时调用方收到 call_timeout
+    correlation_id: Optional[str] = None
+    timeout: Optional[float] = None
+    # 响应所回复的调用，此时无需指定接收方
+    in_reply_to: Optional[str] = None
+    # 响应的错误信息
+    error: Optional[str] = None
     
     class Config:
         arbitrary_types_allowed = True
 
+class ReportedMessage(BaseModel):
+    """代理在进程内总线上直接投递的消息（已由代理生成 message_id 和时间戳）"""
+    message_id: str
+    timestamp: str
+    sender_id: str
+    receiver_id: str
+    task: str
+    data: Dict[str, Any]
+    transport: str = "local"
+    correlation_id: Optional[str] = None
+    deadline: Optional[float] = None
+    in_reply_to: Optional[str] = None
+    error: Optional[str] = None
+
+class ReportBatch(RootModel[List[ReportedMessage]]):
+    pass
+
+class Subscription(BaseModel):
+    agent_id: str
+    # 订阅模式："." 分层，"*" 匹配一层，"#"（只能作为最后一层）匹配零层或多层；
+    # 取消订阅时省略表示取消全部订阅
+    topics: Optional[List[str]] = None
+
+class Publication(BaseModel):
+    sender_id: str
+    # 发布的主题（不含通配符）
+    topic: str
+    task: str
+    data: Dict[str, Any]
+
 class AgentInfo(BaseModel):
     agent_id: str
     capabilities: List[str]
+    # 请求的租约时长（秒），默认使用服务器配置
+    ttl: Optional[float] = None
     
     class Config:
         arbitrary_types_allowed = True
 
+class AgentBatch(RootModel[List[AgentInfo]]):
+    pass
+
+# 状态变更
+def apply_entry(event_type: str, entry: Dict[str, Any]):
+    """把一条历史记录条目应用到本进程的注册表、收件箱和消息历史"""
+    if event_type == "agent_registered":
+        agent_id = entry["data"]["agent_id"]
+        registered_agents.register(agent_id, entry["data"]["capabilities"])
+        inboxes.create(agent_id)
+        if entry["data"].get("ttl"):
+            grant_lease(agent_id, entry["data"]["ttl"])
+        else:
+            leases.revoke(agent_id)
+    elif event_type == "agent_removed":
+        for agent_id in entry["data"]["agent_ids"]:
+            registered_agents.unregister(agent_id)
+            inboxes.remove(agent_id)
+            leases.revoke(agent_id)
+            topic_index.unsubscribe_all(agent_id)
+    elif event_type == "topic_subscribed":
+        for pattern in entry["data"]["topics"]:
+            topic_index.subscribe(entry["data"]["agent_id"], pattern)
+    elif event_type == "topic_unsubscribed":
+        for pattern in entry["data"]["topics"]:
+            topic_index.unsubscribe(entry["data"]["agent_id"], pattern)
+    elif "topic" in entry:
+        if config.BACKEND != "memory":
+            # 其他工作进程发布的主题消息已写入共享收件箱，唤醒本进程中等待的订阅方
+            for agent_id in topic_index.match(entry["topic"], exclude=entry["sender_id"]):
+                inboxes.notify(agent_id)
+    elif "in_reply_to" in entry:
+        calls.pop(entry["in_reply_to"])
+    elif "correlation_id" in entry:
+        # 其他工作进程受理的调用：记录调用方，以便本进程收到响应时路由回去
+        correlation_id = entry["correlation_id"]
+        if correlation_id not in calls and entry["deadline"] > time.time():
+            calls.add(correlation_id, entry["sender_id"], entry["deadline"])
+    record_history(entry)
+
+def record_history(entry: Dict[str, Any]):
+    """追加到消息历史；索引内存历史时同时维护二级索引，被覆盖的最旧记录移出索引"""
+    if message_log is not None:
+        # 日志记录在落盘后按日志序号索引（见 persist）
+        message_history.append(entry)
+        return
+    if len(message_history) == message_history.capacity:
+        oldest = message_history.first_seq
+        history_index.evict(oldest, message_history.get(oldest))
+    history_index.add(message_history.append(entry), entry)
+
+def apply_entries(events: List[Tuple[str, Dict[str, Any]]]):
+    """后端投递的一批事件（按全局顺序）：应用到本地状态，并合并为一帧广播给本进程的仪表盘"""
+    for event_type, entry in events:
+        apply_entry(event_type, entry)
+    broadcast_events(events)
+
+# 租约
+lease_wakeup: Optional[asyncio.Event] = None
+
+def lease_ttl(requested: Optional[float]) -> Optional[float]:
+    """实际授予的租约时长；AIXP_LEASE_TTL 为 0 时不启用租约"""
+    if not config.LEASE_TTL:
+        return None
+    if requested is None:
+        return config.LEASE_TTL
+    return min(max(requested, 1.0), config.LEASE_MAX_TTL)
+
+def grant_lease(agent_id: str, ttl: float):
+    head = leases.next_deadline()
+    expires_at = leases.grant(agent_id, ttl, time.time())
+    if lease_wakeup is not None and (head is None or expires_at < head):
+        # 新租约比当前最早的定时项更早到期，唤醒过期任务重新计算等待时间
+        lease_wakeup.set()
+
+def renew_leases(agent_ids: List[str]) -> Tuple[Dict[str, float], List[str]]:
+    """心跳续约，返回 (agent_id -> 新的到期时间, 未注册的代理)"""
+    if any(agent_id not in registered_agents for agent_id in agent_ids):
+        # 可能刚在其他工作进程注册
+        backend.refresh()
+    now = time.time()
+    renewed = {}
+    unknown = []
+    for agent_id in agent_ids:
+        if agent_id not in registered_agents:
+            unknown.append(agent_id)
+            continue
+        expires_at = leases.renew(agent_id, now)
+        if expires_at is not None:
+            renewed[agent_id] = expires_at
+    backend.renew(renewed)
+    return renewed, unknown
+
+async def evict_expired(agent_ids: List[str], now: float):
+    """注销租约到期的代理，整批作为一个 agent_removed 增量事件发布"""
+    claimed, renewed = backend.claim_expired(agent_ids, now)
+    for agent_id, expires_at in renewed.items():
+        leases.extend(agent_id, expires_at)
+    claimed = [agent_id for agent_id in claimed if agent_id in registered_agents]
+    if not claimed:
+        return
+    logger.info(f"Leases of {len(claimed)} agents expired")
+    unregistrations_total.inc(len(claimed), reason="lease_expired")
+    entry = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "sender_id": "system",
+        "receiver_id": "all",
+        "task": "agent_removed",
+        "data": {"agent_ids": claimed, "reason": "lease_expired"}
+    }
+    await persist([entry])
+    backend.publish([("agent_removed", entry)])
+
+async def expire_leases():
+    """按租约堆的堆顶时间休眠，到期后注销未续约的代理
+
+    唤醒时间向上对齐到 AIXP_LEASE_RESOLUTION 的整数倍，同一时间片内到期的代理合并为一次注销。
+    """
+    resolution = config.LEASE_RESOLUTION / 1000
+    while True:
+        deadline = leases.next_deadline()
+        lease_wakeup.clear()
+        if deadline is not None and resolution > 0:
+            deadline = math.ceil(deadline / resolution) * resolution
+        timeout = None if deadline is None else max(deadline - time.time(), 0.0)
+        try:
+            await asyncio.wait_for(lease_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        now = time.time()
+        expired = leases.expired(now)
+        if not expired:
+            continue
+        try:
+            await evict_expired(expired, now)
+        except Exception as e:
+            logger.error(f"Error expiring leases: {str(e)}")
+
+# 请求/响应调用
+call_wakeup: Optional[asyncio.Event] = None
+
+def start_call(correlation_id: str, caller: str, deadline: float):
+    head = calls.next_deadline()
+    calls.add(correlation_id, caller, deadline, local=True)
+    calls_total.inc(outcome="started")
+    if call_wakeup is not None and (head is None or deadline < head):
+        call_wakeup.set()
+
+async def time_out_calls(expired: List[Tuple[str, str]]):
+    """向调用方发送 call_timeout 响应"""
+    entries = []
+    for correlation_id, caller in expired:
+        inbox = inboxes.get(caller)
+        if inbox is None:
+            # 调用方已注销
+            continue
+        entry = {
+            "message_id": uuid.uuid4().hex,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "sender_id": "system",
+            "receiver_id": caller,
+            "task": "call_timeout",
+            "data": {},
+            "in_reply_to": correlation_id,
+            "error": "Call timed out"
+        }
+        try:
+            inbox.put(entry)
+        except InboxFull:
+            logger.warning(f"Dropped timeout of call {correlation_id}: inbox of {caller} is full")
+            continue
+        entries.append(entry)
+    calls_total.inc(len(expired), outcome="timed_out")
+    await persist(entries)
+    backend.publish([("message", entry) for entry in entries])
+
+async def expire_calls():
+    """按调用堆的堆顶时间休眠，到期后向未收到响应的调用方发送超时响应"""
+    while True:
+        deadline = calls.next_deadline()
+        call_wakeup.clear()
+        timeout = None if deadline is None else max(deadline - time.time(), 0.0)
+        try:
+            await asyncio.wait_for(call_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        expired = calls.expired(time.time())
+        if not expired:
+            continue
+        try:
+            await time_out_calls(expired)
+        except Exception as e:
+            logger.error(f"Error timing out calls: {str(e)}")
+
+# 持久化
+# 以 task 记录事件类型的状态变更条目，其余条目为消息
+STATE_EVENTS = ("agent_registered", "agent_removed", "topic_subscribed", "topic_unsubscribed")
+
+def restore_state():
+    """回放持久化日志，重建代理注册表、能力索引和消息历史"""
+    records = 0
+    for seq, record in message_log.replay():
+        records += 1
+        if record["type"] == "agents":
+            # 压缩时写入的注册表快照
+            snapshot = record["agents"]
+            for agent_id in [agent_id for agent_id, _ in registered_agents.items() if agent_id not in snapshot]:
+                registered_agents.unregister(agent_id)
+            for agent_id, capabilities in snapshot.items():
+                registered_agents.register(agent_id, capabilities)
+            topic_index.clear()
+            for agent_id, patterns in record.get("subscriptions", {}).items():
+                for pattern in patterns:
+                    topic_index.subscribe(agent_id, pattern)
+            continue
+        entry = record["entry"]
+        history_index.add(seq, entry)
+        if entry["task"] in STATE_EVENTS:
+            apply_entry(entry["task"], entry)
+        else:
+            apply_entry("message", entry)
+    for agent_id, _ in registered_agents.items():
+        inboxes.create(agent_id)
+    logger.info(f"Restored {records} records, {len(registered_agents)} agents, {len(topic_index)} subscriptions "
+                f"from {message_log.directory}")
+
+async def persist(entries: List[Dict[str, Any]]):
+    """把历史记录条目写入持久化日志；同步模式下等待组提交落盘"""
+    if message_log is None or not entries:
+        return
+    futures = [message_log.append({"type": "entry", "entry": entry}) for entry in entries]
+    loop = asyncio.get_running_loop()
+    for future, entry in zip(futures, entries):
+        # 在等待落盘的回调之前注册：同步模式下响应返回时记录已可查询
+        future.add_done_callback(functools.partial(index_logged, loop, entry))
+    if config.PERSIST_SYNC:
+        # 日志按提交顺序写入，最后一条落盘即整批落盘
+        await asyncio.wrap_future(futures[-1])
+
+def index_logged(loop: asyncio.AbstractEventLoop, entry: Dict[str, Any], future):
+    """日志记录落盘后（写线程中回调）在事件循环中按日志序号加入二级索引"""
+    if future.exception() is None:
+        loop.call_soon_threadsafe(history_index.add, future.result(), entry)
+
+async def compact_log_periodically():
+    """定期写入注册表和订阅快照并清理旧的日志分段，被删除分段中的记录移出二级索引"""
+    while True:
+        await asyncio.sleep(config.PERSIST_COMPACT_INTERVAL)
+        try:
+            await asyncio.wrap_future(message_log.compact({
+                "type": "agents",
+                "agents": dict(registered_agents.items()),
+                "subscriptions": dict(topic_index.items())
+            }))
+        except Exception as e:
+            logger.error(f"Error compacting segment log: {str(e)}")
+        history_index.remove_before(message_log.first_seq)
+
+async def prune_blobs_periodically():
+    """定期删除超过保留时长未被上传或引用的大对象"""
+    while True:
+        await asyncio.sleep(config.PERSIST_COMPACT_INTERVAL)
+        removed = await asyncio.to_thread(blobs.prune, config.BLOB_RETENTION_SECONDS)
+        if removed:
+            logger.info(f"Pruned {removed} expired blobs")
+
+compaction_task: Optional[asyncio.Task] = None
+expiry_task: Optional[asyncio.Task] = None
+call_expiry_task: Optional[asyncio.Task] = None
+prune_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def startup():
+    global compaction_task, expiry_task, call_expiry_task, prune_task, lease_wakeup, call_wakeup
+    agents, history = backend.load_state()
+    for agent_id, capabilities in agents.items():
+        registered_agents.register(agent_id, capabilities)
+        inboxes.create(agent_id)
+    for agent_id, patterns in backend.load_subscriptions().items():
+        for pattern in patterns:
+            topic_index.subscribe(agent_id, pattern)
+    for entry in history:
+        record_history(entry)
+    if agents or history:
+        logger.info(f"Loaded {len(agents)} agents, {len(history)} history entries from the {config.BACKEND} backend")
+    await backend.start()
+    if message_log is not None:
+        restore_state()
+        message_log.open()
+        compaction_task = asyncio.create_task(compact_log_periodically())
+    # 恢复的代理重新获得一个完整租约，在此期间恢复心跳即可保留注册
+    for agent_id, _ in registered_agents.items():
+        if agent_id not in leases and config.LEASE_TTL:
+            grant_lease(agent_id, config.LEASE_TTL)
+    lease_wakeup = asyncio.Event()
+    expiry_task = asyncio.create_task(expire_leases())
+    call_wakeup = asyncio.Event()
+    call_expiry_task = asyncio.create_task(expire_calls())
+    if config.BLOB_RETENTION_SECONDS:
+        prune_task = asyncio.create_task(prune_blobs_periodically())
+    profiler.set_routes(app.routes)
+    if config.PROFILE_SECONDS:
+        profiler.start(config.PROFILE_SECONDS, config.PROFILE_SAMPLE_RATE)
+
+@app.on_event("shutdown")
+async def shutdown():
+    if compaction_task is not None:
+        compaction_task.cancel()
+    if expiry_task is not None:
+        expiry_task.cancel()
+    if call_expiry_task is not None:
+        call_expiry_task.cancel()
+    if prune_task is not None:
+        prune_task.cancel()
+    if message_log is not None:
+        message_log.close()
+    if profiler.running:
+        profiler.stop()
+    await backend.stop()
+
 # WebSocket 连接管理
-async def broadcast_update():
-    """向所有连接的客户端广播更新"""
-    if active_connections:
-        message = {
-            "event": "update",
-            "data": {
-                "status": "running",
-                "registered_agents": len(registered_agents),
-                "agents": [
-                    {"id": agent_id, "capabilities": capabilities}
-                    for agent_id, capabilities in registered_agents.items()
-                ],
-                "messages": message_history
-            }
+def build_snapshot() -> Dict[str, Any]:
+    """构建当前状态的全量快照，seq 为快照对应的事件序号"""
+    return {
+        "event": "snapshot",
+        "seq": event_stream.seq,
+        "stream": event_stream.stream_id,
+        "data": {
+            "status": "running",
+            "registered_agents": len(registered_agents),
+            "agents": [
+                {"id": agent_id, "capabilities": capabilities}
+                for agent_id, capabilities in registered_agents.items()
+            ],
+            "messages": message_history.last(config.DASHBOARD_HISTORY_SIZE),
+            "history_size": config.DASHBOARD_HISTORY_SIZE
         }
-        for connection in active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to client: {str(e)}")
-                try:
-                    active_connections.remove(connection)
-                except:
-                    pass
+    }
+
+# 仪表盘广播器：每个 WebSocket 连接拥有独立的出站队列
+broadcaster = Broadcaster(
+    build_snapshot,
+    queue_size=config.BROADCAST_QUEUE_SIZE,
+    policy=config.BROADCAST_SLOW_CLIENT_POLICY
+)
+
+def broadcast_event(event_type: str, data: Dict[str, Any]):
+    """生成一个增量事件并放入所有客户端的出站队列"""
+    broadcaster.publish(event_stream.publish(event_type, data))
+
+def broadcast_events(events: List[Tuple[str, Dict[str, Any]]]):
+    """生成一组增量事件，合并为一帧 batch 事件广播（每个事件仍有自己的序号，可单独续传）"""
+    started = time.perf_counter()
+    published = [event_stream.publish(event_type, data) for event_type, data in events]
+    if len(published) == 1:
+        broadcaster.publish(published[0])
+    elif published:
+        broadcaster.publish({"event": "batch", "seq": published[-1]["seq"], "events": published})
+    broadcast_events_total.inc(len(published))
+    broadcast_seconds.observe(time.perf_counter() - started)
+
+# 后端按全局顺序投递的事件（包括本进程发布的）由 apply_entries 应用
+backend.bind(apply_entries)
+
+def initial_events(since: Optional[int]) -> List[Dict[str, Any]]:
+    """连接时需要发送的初始状态：能从 since 续传时只补发遗漏的事件，否则为全量快照"""
+    if since is not None:
+        missed = event_stream.since(since)
+        if missed is not None:
+            logger.debug(f"Resuming client from seq {since}, {len(missed)} missed events")
+            return missed
+    return [build_snapshot()]
 
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    """处理 WebSocket 连接"""
+async def websocket_endpoint(websocket: WebSocket, since: Optional[int] = None, stream: Optional[str] = None,
+                             encoding: Optional[str] = None):
+    """处理 WebSocket 连接
+
+    重连的客户端通过 since（最后收到的序号）和 stream（事件流标识）续传，
+    服务器重启后事件流标识改变，客户端会收到新的快照。
+    encoding=msgpack 时事件以 MessagePack 二进制帧发送，默认为 JSON 文本帧。
+    """
+    try:
+        media = codec.encoding_name(encoding)
+    except codec.UnsupportedEncoding:
+        await websocket.close(code=1003)
+        return
     await websocket.accept()
-    active_connections.add(websocket)
+    connected = websocket_connected("dashboard")
+    if stream != event_stream.stream_id:
+        since = None
+    # 初始状态与后续增量事件经由同一个队列按序发送
+    channel = broadcaster.add(websocket, initial_events(since), media)
     try:
-        # 发送初始状态
-        await broadcast_update()
         # 保持连接并处理消息
         while True:
-            data = await websocket.receive_text()
-            # 这里可以添加消息处理逻辑
+            data = await receive_frame(websocket)
+            # 客户端检测到序号不连续时请求重新同步
+            if data in ("resync", b"resync"):
+                channel.resync()
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {str(e)}")
-        active_connections.remove(websocket)
+    finally:
+        await broadcaster.remove(channel)
+        websocket_disconnected("dashboard", connected)
+
+def websocket_connected(channel: str) -> float:
+    websocket_connections_total.inc(channel=channel)
+    websocket_clients.inc(channel=channel)
+    return time.monotonic()
+
+def websocket_disconnected(channel: str, connected: float):
+    websocket_disconnections_total.inc(channel=channel)
+    websocket_clients.dec(channel=channel)
+    websocket_session_seconds.observe(time.monotonic() - connected, channel=channel)
 
 @app.get("/")
 async def get_html():
@@ -165,9 +727,20 @@ async def get_html():
             let ws;
             let reconnectAttempts = 0;
             const maxReconnectAttempts = 5;
+            let maxMessages = 100;
+            // 已应用的最后一个事件序号及事件流标识，用于断线续传
+            let lastSeq = null;
+            let streamId = null;
+            let resyncing = false;
+            // 智能体 id -> 列表中的 DOM 元素
+            const agentItems = new Map();
 
             function connect() {
-                ws = new WebSocket('ws://' + window.location.host + '/ws');
+                let url = 'ws://' + window.location.host + '/ws';
+                if (lastSeq !== null && streamId !== null) {
+                    url += '?since=' + lastSeq + '&stream=' + streamId;
+                }
+                ws = new WebSocket(url);
                 
                 ws.onopen = function() {
                     console.log('已连接到服务器');
@@ -206,48 +779,132 @@ async def get_html():
                 return date.toLocaleTimeString();
             }
 
+            function upsertAgent(agentId, capabilities) {
+                let agentDiv = agentItems.get(agentId);
+                if (!agentDiv) {
+                    agentDiv = document.createElement('div');
+                    agentDiv.className = 'agent-item';
+                    document.getElementById('agent-list').appendChild(agentDiv);
+                    agentItems.set(agentId, agentDiv);
+                }
+                agentDiv.textContent = `智能体: ${agentId} - 能力: ${capabilities.join(', ')}`;
+            }
+
+            function removeAgent(agentId) {
+                const agentDiv = agentItems.get(agentId);
+                if (agentDiv) {
+                    agentDiv.remove();
+                    agentItems.delete(agentId);
+                }
+            }
+
+            // 大对象引用只显示元数据
+            function blobSummary(key, value) {
+                if (value && typeof value === 'object' && typeof value['$blob'] === 'string') {
+                    return `[blob ${value['$blob'].slice(0, 12)}… ${formatSize(value.size)} ${value.content_type || ''}]`;
+                }
+                return value;
+            }
+
+            function formatSize(size) {
+                const units = ['B', 'KB', 'MB', 'GB'];
+                let unit = 0;
+                while (size >= 1024 && unit < units.length - 1) {
+                    size /= 1024;
+                    unit++;
+                }
+                return `${size.toFixed(unit ? 1 : 0)} ${units[unit]}`;
+            }
+
+            function appendMessage(msg) {
+                const messageList = document.getElementById('message-list');
+                const msgDiv = document.createElement('div');
+                msgDiv.className = 'message-item';
+                
+                const headerDiv = document.createElement('div');
+                headerDiv.className = 'message-header';
+                headerDiv.textContent = `${msg.sender_id} -> ${msg.receiver_id} (${msg.task})`;
+                if (msg.subscribers !== undefined) {
+                    // 主题消息只记录一次，附带投递到的订阅方数量
+                    headerDiv.textContent += ` [${msg.subscribers} subscribers]`;
+                }
+                
+                const contentDiv = document.createElement('div');
+                contentDiv.className = 'message-content';
+                contentDiv.textContent = JSON.stringify(msg.data, blobSummary, 2);
+                
+                const timeDiv = document.createElement('div');
+                timeDiv.className = 'message-time';
+                timeDiv.textContent = msg.timestamp;
+                
+                msgDiv.appendChild(headerDiv);
+                msgDiv.appendChild(contentDiv);
+                msgDiv.appendChild(timeDiv);
+                messageList.appendChild(msgDiv);
+                
+                // 只保留最近的消息
+                while (messageList.childElementCount > maxMessages) {
+                    messageList.removeChild(messageList.firstElementChild);
+                }
+            }
+
+            function renderSnapshot(data) {
+                maxMessages = data.history_size || maxMessages;
+                // 更新代理列表
+                document.getElementById('agent-list').innerHTML = '';
+                agentItems.clear();
+                data.agents.forEach(agent => upsertAgent(agent.id, agent.capabilities));
+
+                // 更新消息列表
+                document.getElementById('message-list').innerHTML = '';
+                if (data.messages) {
+                    data.messages.forEach(appendMessage);
+                }
+            }
+
+            function applyEvent(data) {
+                switch (data.event) {
+                    case 'agent_registered':
+                        upsertAgent(data.data.data.agent_id, data.data.data.capabilities);
+                        appendMessage(data.data);
+                        break;
+                    case 'agent_removed':
+                        data.data.data.agent_ids.forEach(removeAgent);
+                        appendMessage(data.data);
+                        break;
+                    case 'message':
+                        appendMessage(data.data);
+                        break;
+                }
+            }
+
             function updateUI(data) {
-                if (data.event === 'update') {
-                    // 更新代理列表
-                    const agentList = document.getElementById('agent-list');
-                    agentList.innerHTML = '';
-                    data.data.agents.forEach(agent => {
-                        const agentDiv = document.createElement('div');
-                        agentDiv.className = 'agent-item';
-                        agentDiv.textContent = `智能体: ${agent.id} - 能力: ${agent.capabilities.join(', ')}`;
-                        agentList.appendChild(agentDiv);
-                    });
-
-                    // 更新消息列表
-                    const messageList = document.getElementById('message-list');
-                    messageList.innerHTML = '';
-                    if (data.data.messages) {
-                        data.data.messages.forEach(msg => {
-                            const msgDiv = document.createElement('div');
-                            msgDiv.className = 'message-item';
-                            
-                            const headerDiv = document.createElement('div');
-                            headerDiv.className = 'message-header';
-                            headerDiv.textContent = `${msg.sender_id} -> ${msg.receiver_id} (${msg.task})`;
-                            
-                            const contentDiv = document.createElement('div');
-                            contentDiv.className = 'message-content';
-                            contentDiv.textContent = JSON.stringify(msg.data, null, 2);
-                            
-                            const timeDiv = document.createElement('div');
-                            timeDiv.className = 'message-time';
-                            timeDiv.textContent = msg.timestamp;
-                            
-                            msgDiv.appendChild(headerDiv);
-                            msgDiv.appendChild(contentDiv);
-                            msgDiv.appendChild(timeDiv);
-                            messageList.appendChild(msgDiv);
-                        });
-                        
-                        // 自动滚动到最新消息
-                        messageList.scrollTop = messageList.scrollHeight;
+                if (data.event === 'batch') {
+                    // 批量事件：逐个按序号应用
+                    data.events.forEach(updateUI);
+                    return;
+                }
+                if (data.event === 'snapshot') {
+                    renderSnapshot(data.data);
+                    lastSeq = data.seq;
+                    streamId = data.stream;
+                    resyncing = false;
+                } else {
+                    if (lastSeq === null || resyncing || data.seq <= lastSeq) {
+                        return;
                     }
+                    if (data.seq !== lastSeq + 1) {
+                        // 序号不连续，请求重新同步
+                        resyncing = true;
+                        ws.send('resync');
+                        return;
+                    }
+                    applyEvent(data);
+                    lastSeq = data.seq;
                 }
+                // 自动滚动到最新消息
+                const messageList = document.getElementById('message-list');
+                messageList.scrollTop = messageList.scrollHeight;
             }
 
             window.onload = connect;
@@ -271,79 +928,855 @@ async def get_html():
     """
     return HTMLResponse(content=html_content)
 
+# 内容协商：请求体按 Content-Type、响应按 Accept 在 JSON（默认）与 MessagePack 之间选择
+async def read_body(request: Request) -> Any:
+    """按 Content-Type 解析请求体"""
+    try:
+        return codec.decode(await request.body(), codec.media_type(request.headers.get("content-type")))
+    except codec.UnsupportedEncoding as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid request body: {str(e)}")
+
+def parse_model(model, value: Any):
+    """校验请求体，失败时返回与 FastAPI 请求体校验相同的 422 响应"""
+    try:
+        return model.model_validate(value)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False, include_input=False))
+
+def respond(request: Request, content: Any) -> Response:
+    """按 Accept 编码响应；MessagePack 中二进制数据原样返回，JSON 中为 {"$bytes": base64}"""
+    media = codec.media_type(request.headers.get("accept"))
+    if codec.msgpack is None:
+        media = codec.JSON
+    return Response(codec.encode(content, media), media_type=media)
+
+async def receive_frame(websocket: WebSocket) -> Any:
+    """接收一个文本或二进制帧"""
+    frame = await websocket.receive()
+    if frame["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(frame.get("code", 1000))
+    return frame.get("text") if frame.get("text") is not None else frame.get("bytes")
+
+def frame_credits(frame: Any, media: str) -> int:
+    """客户端帧中追加的流控额度 {"credits": n}；其他内容（如 "ping"）为 0"""
+    try:
+        if isinstance(frame, bytes):
+            value = codec.decode(frame, media)
+        elif frame and frame.startswith("{"):
+            value = codec.loads_json(frame)
+        else:
+            return 0
+        return int(value.get("credits", 0)) if isinstance(value, dict) else 0
+    except (ValueError, TypeError, codec.UnsupportedEncoding, AttributeError):
+        return 0
+
+def add_agent(agent_info: AgentInfo) -> Dict[str, Any]:
+    """生成注册事件的历史记录条目，经 backend.publish 发布后生效"""
+    logger.debug(f"Agent {agent_info.agent_id} registered successfully")
+    
+    # 注册消息写入历史记录
+    entry = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "sender_id": "system",
+        "receiver_id": "all",
+        "task": "agent_registered",
+        "data": {
+            "agent_id": agent_info.agent_id,
+            "capabilities": agent_info.capabilities
+        }
+    }
+    ttl = lease_ttl(agent_info.ttl)
+    if ttl is not None:
+        entry["data"]["ttl"] = ttl
+    return entry
+
 @app.post("/register")
-async def register_agent(agent_info: AgentInfo):
+@register_seconds.timed(endpoint="register")
+async def register_agent(request: Request):
     """注册一个新的AI代理"""
+    agent_info = parse_model(AgentInfo, await read_body(request))
     try:
-        registered_agents[agent_info.agent_id] = agent_info.capabilities
-        logger.info(f"Agent {agent_info.agent_id} registered successfully")
+        entry = add_agent(agent_info)
+        await persist([entry])
         
-        # 添加注册消息到历史记录
-        message_history.append({
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "sender_id": "system",
-            "receiver_id": "all",
-            "task": "agent_registered",
-            "data": {
-                "agent_id": agent_info.agent_id,
-                "capabilities": agent_info.capabilities
-            }
-        })
-        
-        # 广播更新
-        await broadcast_update()
-        return {
+        # 更新注册表并广播增量事件（所有工作进程）
+        backend.publish([("agent_registered", entry)])
+        registrations_total.inc(endpoint="register")
+        logger.info(f"Agent {agent_info.agent_id} registered successfully")
+        return respond(request, {
             "status": "success",
             "message": f"Agent {agent_info.agent_id} registered successfully",
             "agent_id": agent_info.agent_id,
-            "capabilities": agent_info.capabilities
-        }
+            "capabilities": agent_info.capabilities,
+            # 租约时长，代理需在到期前调用心跳接口续约；为 None 时不会过期
+            "ttl": entry["data"].get("ttl")
+        })
+    except BackendBusy:
+        raise
     except Exception as e:
         logger.error(f"Error registering agent: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/send_message")
-async def send_message(message: Message):
-    """处理代理之间的消息传递"""
+@app.post("/register_batch")
+@register_seconds.timed(endpoint="register_batch")
+async def register_agents(request: Request):
+    """批量注册代理，整批只触发一次仪表盘广播"""
+    agents = parse_model(AgentBatch, await read_body(request)).root
+    if len(agents) > config.BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {config.BATCH_MAX_SIZE} agents")
     try:
+        entries = [add_agent(agent_info) for agent_info in agents]
+        await persist(entries)
+        backend.publish([("agent_registered", entry) for entry in entries])
+        registrations_total.inc(len(entries), endpoint="register_batch")
+        logger.info(f"{len(entries)} agents registered in batch")
+        return respond(request, {
+            "status": "success",
+            "registered": [agent_info.agent_id for agent_info in agents],
+            "ttl": {entry["data"]["agent_id"]: entry["data"].get("ttl") for entry in entries}
+        })
+    except BackendBusy:
+        raise
+    except Exception as e:
+        logger.error(f"Error registering agents: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def resolve_receiver(message: Message) -> str:
+    """确定消息的接收方：直接指定的 receiver_id，或按能力路由选出的代理；响应发给调用方"""
+    if message.in_reply_to is not None:
+        return resolve_caller(message)
+    if (message.receiver_id is None) == (message.capability is None):
+        raise HTTPException(status_code=400, detail="Exactly one of receiver_id and capability is required")
+    if message.receiver_id is not None:
+        if message.receiver_id not in registered_agents:
+            # 可能刚在其他工作进程注册
+            backend.refresh()
         if message.receiver_id not in registered_agents:
             raise HTTPException(status_code=404, detail=f"Receiver {message.receiver_id} not found")
+        return message.receiver_id
+    try:
+        try:
+            return router.route(message.capability, message.data, message.routing, message.route_key)
+        except NoRouteError:
+            backend.refresh()
+            return router.route(message.capability, message.data, message.routing, message.route_key)
+    except NoRouteError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def resolve_caller(message: Message) -> str:
+    """响应的接收方：仍在等待该调用的调用方"""
+    caller = calls.caller(message.in_reply_to)
+    if caller is None:
+        # 可能由其他工作进程受理
+        backend.refresh()
+        caller = calls.caller(message.in_reply_to)
+    if caller is None:
+        raise HTTPException(status_code=410, detail=f"Call {message.in_reply_to} is not pending (already answered or timed out)")
+    if message.capability is not None or message.receiver_id not in (None, caller):
+        raise HTTPException(status_code=400, detail=f"Reply to call {message.in_reply_to} must go to its caller {caller}")
+    return caller
+
+def overloaded(reason: str, detail: str, retry_after: float, limit: Optional[float] = None) -> HTTPException:
+    """过载响应：429，Retry-After 为整数秒，X-Retry-After-Ms 供客户端精确调节发送节奏"""
+    throttled_total.inc(reason=reason)
+    headers = {
+        "Retry-After": str(max(1, math.ceil(retry_after))),
+        "X-Retry-After-Ms": str(max(1, math.ceil(retry_after * 1000)))
+    }
+    if limit:
+        headers["X-RateLimit-Limit"] = f"{limit:g}"
+    return HTTPException(status_code=429, detail=detail, headers=headers)
+
+def admit(message: Message) -> Callable[[], None]:
+    """检查发送方限速和全局限速，超限时抛出 429；通过时返回取走令牌的函数
+
+    令牌在消息确认可投递后才取走，被其他原因拒绝的消息不占用配额。
+    """
+    now = time.monotonic()
+    sender = sender_limiter.bucket(message.sender_id, now)
+    total = global_limiter.bucket("", now)
+    if sender is not None:
+        delay = sender.delay(1, now)
+        if delay:
+            raise overloaded("sender_rate", f"Sender {message.sender_id} exceeds {sender.rate:g} messages/s",
+                             delay, sender.rate)
+    if total is not None:
+        delay = total.delay(1, now)
+        if delay:
+            raise overloaded("global_rate", f"Server exceeds {total.rate:g} messages/s", delay, total.rate)
+    
+    def consume():
+        if sender is not None:
+            sender.consume(1)
+        if total is not None:
+            total.consume(1)
+    return consume
+
+def deliver(message: Message) -> Dict[str, Any]:
+    """把消息投递到接收方收件箱，返回历史记录条目（经 backend.publish 发布后写入历史记录）"""
+    consume = admit(message)
+    receiver_id = resolve_receiver(message)
+    if config.INBOX_HIGH_WATER and inboxes.depth(receiver_id) >= config.INBOX_HIGH_WATER:
+        raise overloaded("inbox_high_water", f"Receiver {receiver_id} has too many pending messages",
+                         config.INBOX_RETRY_AFTER)
+    # 引用的大对象必须已上传；刷新其修改时间以免在消息被取走前被清理
+    for digest in references(message.data):
+        if not blobs.touch(digest):
+            raise HTTPException(status_code=404, detail=f"Blob {digest} not found")
+    
+    entry = {
+        "message_id": uuid.uuid4().hex,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "sender_id": message.sender_id,
+        "receiver_id": receiver_id,
+        "task": message.task,
+        "data": message.data
+    }
+    if message.capability is not None:
+        entry["capability"] = message.capability
+    if message.in_reply_to is not None:
+        entry["in_reply_to"] = message.in_reply_to
+        if message.error is not None:
+            entry["error"] = message.error
+    elif message.correlation_id is not None or message.timeout is not None:
+        correlation_id = message.correlation_id or uuid.uuid4().hex
+        if correlation_id in calls:
+            raise HTTPException(status_code=409, detail=f"Call {correlation_id} is already pending")
+        timeout = message.timeout if message.timeout is not None else config.CALL_TIMEOUT
+        entry["correlation_id"] = correlation_id
+        entry["deadline"] = time.time() + min(max(timeout, 0.0), config.CALL_MAX_TIMEOUT)
+    
+    # 投递到接收方的收件箱
+    try:
+        inboxes.get(receiver_id).put(entry)
+    except InboxFull as e:
+        throttled_total.inc(reason="inbox_full")
+        raise HTTPException(status_code=503, detail=f"Receiver {receiver_id}: {str(e)}",
+                            headers={"Retry-After": str(max(1, math.ceil(config.INBOX_RETRY_AFTER)))})
+    consume()
+    if "in_reply_to" in entry:
+        calls.pop(entry["in_reply_to"])
+        calls_total.inc(outcome="replied")
+    elif "correlation_id" in entry:
+        start_call(entry["correlation_id"], message.sender_id, entry["deadline"])
+    return entry
+
+@app.post("/send_message")
+@send_seconds.timed(endpoint="send_message")
+async def send_message(request: Request):
+    """处理代理之间的消息传递"""
+    started = time.perf_counter()
+    message = parse_model(Message, await read_body(request))
+    try:
+        entry = deliver(message)
+        delivered = time.perf_counter()
+        await persist([entry])
+        persisted = time.perf_counter()
         
-        # 添加消息到历史记录
-        message_history.append({
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "sender_id": message.sender_id,
-            "receiver_id": message.receiver_id,
-            "task": message.task,
-            "data": message.data
-        })
-        
-        # 保持消息历史在合理范围内
-        if len(message_history) > 100:
-            message_history.pop(0)
+        # 写入历史记录并广播增量事件
+        backend.publish([("message", entry)])
+        messages_total.inc(endpoint="send_message", status="accepted")
         
-        # 广播更新
-        await broadcast_update()
+        if sampled():
+            finished = time.perf_counter()
+            trace_logger.info(
+                f"message_id={entry['message_id']} sender={entry['sender_id']} receiver={entry['receiver_id']} "
+                f"task={entry['task']} parse_deliver_ms={(delivered - started) * 1000:.3f} "
+                f"persist_ms={(persisted - delivered) * 1000:.3f} publish_ms={(finished - persisted) * 1000:.3f} "
+                f"total_ms={(finished - started) * 1000:.3f}"
+            )
         
-        return {
+        return respond(request, {
             "status": "success",
             "message": "Message delivered",
-            "receiver": message.receiver_id,
-            "task": message.task
-        }
+            "message_id": entry["message_id"],
+            "receiver": entry["receiver_id"],
+            "task": message.task,
+            "correlation_id": entry.get("correlation_id")
+        })
+    except HTTPException:
+        messages_total.inc(endpoint="send_message", status="rejected")
+        raise
+    except BackendBusy:
+        messages_total.inc(endpoint="send_message", status="rejected")
+        raise
     except Exception as e:
         logger.error(f"Error sending message: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def read_batch(request: Request) -> List[Any]:
+    """读取批量消息请求体：JSON 或 MessagePack 数组，或逐行流式读取的 NDJSON"""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" not in content_type:
+        items = codec.decode(await request.body(), codec.media_type(content_type))
+        if not isinstance(items, list):
+            raise ValueError("Request body must be a JSON array")
+        if len(items) > config.BATCH_MAX_SIZE:
+            raise OverflowError(f"Batch exceeds {config.BATCH_MAX_SIZE} messages")
+        return items
+    items = []
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                items.append(codec.loads_json(line))
+        if len(items) > config.BATCH_MAX_SIZE:
+            raise OverflowError(f"Batch exceeds {config.BATCH_MAX_SIZE} messages")
+    if buffer.strip():
+        items.append(codec.loads_json(buffer))
+    if len(items) > config.BATCH_MAX_SIZE:
+        raise OverflowError(f"Batch exceeds {config.BATCH_MAX_SIZE} messages")
+    return items
+
+@app.post("/send_messages")
+@send_seconds.timed(endpoint="send_messages")
+async def send_messages(request: Request):
+    """批量发送消息
+
+    请求体为消息数组（application/json 或 application/msgpack）或每行一条消息的 NDJSON（application/x-ndjson）。
+    每条消息独立校验和投递，返回逐条结果；整批消息只触发一次仪表盘广播。
+    """
+    started = time.perf_counter()
+    try:
+        items = await read_batch(request)
+    except OverflowError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except codec.UnsupportedEncoding as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch: {str(e)}")
+    
+    results = []
+    entries = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise HTTPException(status_code=422, detail="Message must be a JSON object")
+            entry = deliver(Message(**item))
+        except ValidationError as e:
+            results.append({
+                "index": index, "status": "error", "code": 422,
+                "detail": e.errors(include_url=False, include_input=False)
+            })
+            continue
+        except BackendBusy as e:
+            throttled_total.inc(reason="backend_busy")
+            results.append({"index": index, "status": "error", "code": 503, "detail": f"Shared backend is busy: {str(e)}"})
+            continue
+        except HTTPException as e:
+            result = {"index": index, "status": "error", "code": e.status_code, "detail": e.detail}
+            if e.status_code == 429:
+                result["retry_after"] = int(e.headers["X-Retry-After-Ms"]) / 1000
+            results.append(result)
+            continue
+        entries.append(entry)
+        results.append({
+            "index": index,
+            "status": "success",
+            "message_id": entry["message_id"],
+            "receiver": entry["receiver_id"],
+            "correlation_id": entry.get("correlation_id")
+        })
+    
+    delivered = time.perf_counter()
+    await persist(entries)
+    persisted = time.perf_counter()
+    
+    # 整批只广播一次
+    backend.publish([("message", entry) for entry in entries])
+    messages_total.inc(len(entries), endpoint="send_messages", status="accepted")
+    messages_total.inc(len(results) - len(entries), endpoint="send_messages", status="rejected")
+    
+    if sampled():
+        finished = time.perf_counter()
+        trace_logger.info(
+            f"batch accepted={len(entries)} rejected={len(results) - len(entries)} "
+            f"parse_deliver_ms={(delivered - started) * 1000:.3f} persist_ms={(persisted - delivered) * 1000:.3f} "
+            f"publish_ms={(finished - persisted) * 1000:.3f} total_ms={(finished - started) * 1000:.3f}"
+        )
+    
+    return respond(request, {
+        "status": "success",
+        "accepted": len(entries),
+        "rejected": len(results) - len(entries),
+        "results": results
+    })
+
+@app.post("/report_messages")
+@send_seconds.timed(endpoint="report_messages")
+async def report_messages(request: Request):
+    """记录代理在进程内直接投递的消息：不进入收件箱，只写入持久化日志和消息历史并广播给仪表盘"""
+    reported = parse_model(ReportBatch, await read_body(request)).root
+    if len(reported) > config.BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {config.BATCH_MAX_SIZE} messages")
+    entries = [message.model_dump(exclude_none=True) for message in reported]
+    for entry in entries:
+        if "correlation_id" in entry and "in_reply_to" not in entry and "deadline" not in entry:
+            raise HTTPException(status_code=422, detail=f"Call {entry['correlation_id']} has no deadline")
+    await persist(entries)
+    backend.publish([("message", entry) for entry in entries])
+    messages_total.inc(len(entries), endpoint="report_messages", status="accepted")
+    return respond(request, {"status": "success", "recorded": len(entries)})
+
+def require_agent(agent_id: str):
+    if agent_id not in registered_agents:
+        backend.refresh()
+    if agent_id not in registered_agents:
+        raise HTTPException(status_code=404, detail=f"Agent {agent_id} not found")
+
+def subscription_entry(task: str, agent_id: str, topics: List[str]) -> Dict[str, Any]:
+    return {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "sender_id": "system",
+        "receiver_id": "all",
+        "task": task,
+        "data": {"agent_id": agent_id, "topics": topics}
+    }
+
+@app.post("/subscribe")
+async def subscribe(request: Request):
+    """订阅主题，已有的订阅保持不变"""
+    subscription = parse_model(Subscription, await read_body(request))
+    require_agent(subscription.agent_id)
+    if not subscription.topics:
+        raise HTTPException(status_code=400, detail="No topics to subscribe")
+    try:
+        for pattern in subscription.topics:
+            validate_topic(pattern, pattern=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    current = set(topic_index.subscriptions(subscription.agent_id))
+    added = [pattern for pattern in dict.fromkeys(subscription.topics) if pattern not in current]
+    if added:
+        entry = subscription_entry("topic_subscribed", subscription.agent_id, added)
+        await persist([entry])
+        backend.publish([("topic_subscribed", entry)])
+        logger.info(f"Agent {subscription.agent_id} subscribed to {', '.join(added)}")
+    return respond(request, {
+        "status": "success",
+        "agent_id": subscription.agent_id,
+        "subscriptions": topic_index.subscriptions(subscription.agent_id)
+    })
+
+@app.post("/unsubscribe")
+async def unsubscribe(request: Request):
+    """取消订阅（未指定 topics 时取消全部订阅）"""
+    subscription = parse_model(Subscription, await read_body(request))
+    require_agent(subscription.agent_id)
+    current = topic_index.subscriptions(subscription.agent_id)
+    removed = current if subscription.topics is None else [
+        pattern for pattern in dict.fromkeys(subscription.topics) if pattern in current
+    ]
+    if removed:
+        entry = subscription_entry("topic_unsubscribed", subscription.agent_id, removed)
+        await persist([entry])
+        backend.publish([("topic_unsubscribed", entry)])
+        logger.info(f"Agent {subscription.agent_id} unsubscribed from {', '.join(removed)}")
+    return respond(request, {
+        "status": "success",
+        "agent_id": subscription.agent_id,
+        "subscriptions": topic_index.subscriptions(subscription.agent_id)
+    })
+
+@app.post("/publish")
+@send_seconds.timed(endpoint="publish")
+async def publish(request: Request):
+    """向主题发布消息
+
+    订阅方通过前缀树匹配；消息只生成一条历史记录（带订阅方数量），同一个条目对象放入每个订阅方的收件箱，
+    整个发布只触发一次持久化写入和一次仪表盘广播。发布方自身不会收到自己的消息；
+    收件箱已满或积压达到高水位的订阅方被跳过，在响应的 dropped 中列出。
+    """
+    publication = parse_model(Publication, await read_body(request))
+    try:
+        validate_topic(publication.topic)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    consume = admit(publication)
+    for digest in references(publication.data):
+        if not blobs.touch(digest):
+            raise HTTPException(status_code=404, detail=f"Blob {digest} not found")
+    
+    subscribers = topic_index.match(publication.topic, exclude=publication.sender_id)
+    if config.INBOX_HIGH_WATER:
+        backlogged = [agent_id for agent_id in subscribers if inboxes.depth(agent_id) >= config.INBOX_HIGH_WATER]
+    else:
+        backlogged = []
+    entry = {
+        "message_id": uuid.uuid4().hex,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "sender_id": publication.sender_id,
+        "receiver_id": f"topic:{publication.topic}",
+        "task": publication.task,
+        "data": publication.data,
+        "topic": publication.topic,
+        "subscribers": len(subscribers)
+    }
+    delivered, full = inboxes.put_many(sorted(subscribers.difference(backlogged)), entry)
+    consume()
+    if backlogged:
+        throttled_total.inc(len(backlogged), reason="inbox_high_water")
+    if full:
+        throttled_total.inc(len(full), reason="inbox_full")
+    await persist([entry])
+    backend.publish([("message", entry)])
+    messages_total.inc(endpoint="publish", status="accepted")
+    return respond(request, {
+        "status": "success",
+        "message_id": entry["message_id"],
+        "topic": publication.topic,
+        "subscribers": len(subscribers),
+        "delivered": len(delivered),
+        "dropped": sorted(backlogged + full)
+    })
+
 @app.get("/agents")
-async def list_agents():
-    """列出所有注册的代理"""
+async def list_agents(request: Request, capability: Optional[str] = None, limit: Optional[int] = None, cursor: Optional[str] = None):
+    """列出注册的代理
+
+    不带参数时返回全部代理（agent_id -> 能力列表）；指定 capability、limit 或 cursor 时
+    通过能力索引分页查询，cursor 为上一页返回的 next_cursor。
+    """
+    backend.refresh()
+    if capability is None and limit is None and cursor is None:
+        return respond(request, registered_agents.as_dict())
+    if limit is None:
+        limit = config.AGENT_PAGE_SIZE
+    if not 1 <= limit <= config.AGENT_PAGE_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {config.AGENT_PAGE_MAX_SIZE}")
     try:
-        return registered_agents
+        agents, next_cursor = registered_agents.page(capability, limit, cursor)
+        return respond(request, {
+            "agents": [
+                {"id": agent_id, "capabilities": capabilities}
+                for agent_id, capabilities in agents
+            ],
+            "total": registered_agents.count(capability),
+            "next_cursor": next_cursor
+        })
     except Exception as e:
         logger.error(f"Error listing agents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def parse_time(value: Optional[str], name: str) -> Optional[str]:
+    """把查询参数中的时间（ISO 8601 或 Unix 时间戳）转换为历史记录 timestamp 的格式（本地时间）"""
+    if value is None:
+        return None
+    try:
+        try:
+            moment = datetime.fromtimestamp(float(value))
+        except ValueError:
+            moment = datetime.fromisoformat(value)
+            if moment.tzinfo is not None:
+                moment = moment.astimezone().replace(tzinfo=None)
+    except (ValueError, OverflowError, OSError):
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: {value}")
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+@app.get("/messages")
+async def query_messages(request: Request, sender_id: Optional[str] = None, receiver_id: Optional[str] = None,
+                         task: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                         limit: Optional[int] = None, cursor: Optional[int] = None, order: str = "desc"):
+    """查询消息历史（包括注册、注销等系统记录）
+
+    按 sender_id、receiver_id、task 精确过滤，since/until 为时间范围（闭区间，ISO 8601 或 Unix 时间戳）；
+    order 为 desc（从新到旧，默认）或 asc。cursor 为上一页返回的 next_cursor。
+    查询由二级索引完成；启用持久化日志时覆盖日志中保留的全部记录，否则为内存中最近的 AIXP_HISTORY_SIZE 条。
+    """
+    if limit is None:
+        limit = config.MESSAGE_PAGE_SIZE
+    if not 1 <= limit <= config.MESSAGE_PAGE_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {config.MESSAGE_PAGE_MAX_SIZE}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    filters = {
+        field: value
+        for field, value in zip(INDEXED_FIELDS, (sender_id, receiver_id, task))
+        if value is not None
+    }
+    messages, next_cursor = history_index.query(
+        filters,
+        since=parse_time(since, "since"),
+        until=parse_time(until, "until"),
+        cursor=cursor,
+        limit=limit,
+        descending=order == "desc"
+    )
+    return respond(request, {"messages": messages, "next_cursor": next_cursor, "source": history_source})
+
+@app.get("/inbox/{agent_id}")
+async def receive_messages(request: Request, agent_id: str, max_messages: int = 100, timeout: float = 30.0):
+    """长轮询：取出代理收件箱中的消息，收件箱为空时最多等待 timeout 秒"""
+    if agent_id not in inboxes:
+        backend.refresh()
+    inbox = inboxes.get(agent_id)
+    if inbox is None:
+        raise HTTPException(status_code=404, detail=f"Agent {agent_id} not found")
+    if max_messages < 1:
+        raise HTTPException(status_code=400, detail="max_messages must be positive")
+    timeout = min(max(timeout, 0.0), config.INBOX_MAX_TIMEOUT)
+    messages = await inbox.get(max_messages, timeout)
+    return respond(request, {"agent_id": agent_id, "messages": messages})
+
+class InboxPoll(BaseModel):
+    agent_ids: List[str]
+    max_messages: int = 100
+    timeout: float = 30.0
+
+@app.post("/inboxes/poll")
+async def poll_inboxes(request: Request):
+    """多路长轮询：同时等待多个代理的收件箱，任一收件箱有消息即返回
+
+    供共享一个连接的大量代理使用，一个请求代替每个代理各自的长轮询。
+    返回 {"messages": {agent_id: [...]}, "unknown": [不存在的代理]}。
+    """
+    poll = parse_model(InboxPoll, await read_body(request))
+    if poll.max_messages < 1:
+        raise HTTPException(status_code=400, detail="max_messages must be positive")
+    if len(poll.agent_ids) > config.POLL_MAX_AGENTS:
+        raise HTTPException(status_code=413, detail=f"Poll exceeds {config.POLL_MAX_AGENTS} agents")
+    timeout = min(max(poll.timeout, 0.0), config.INBOX_MAX_TIMEOUT)
+    if any(agent_id not in inboxes for agent_id in poll.agent_ids):
+        backend.refresh()
+    messages, unknown = await inboxes.get_many(poll.agent_ids, poll.max_messages, timeout)
+    return respond(request, {"messages": messages, "unknown": unknown})
+
+@app.websocket("/ws/agent/{agent_id}")
+async def agent_websocket(websocket: WebSocket, agent_id: str, max_messages: int = 100,
+                          encoding: Optional[str] = None, credits: Optional[int] = None):
+    """代理的消息推送通道：收件箱中的新消息到达后立即推送
+
+    encoding=msgpack 时以 MessagePack 二进制帧推送，默认为 JSON 文本帧。
+    指定 credits 时启用基于额度的流控：服务器至多推送 credits 条消息，客户端处理完后发送
+    {"credits": n} 追加额度；额度用完时消息留在收件箱中，积压超过高水位后发送方收到 429。
+    """
+    if agent_id not in inboxes:
+        backend.refresh()
+    inbox = inboxes.get(agent_id)
+    try:
+        media = codec.encoding_name(encoding)
+    except codec.UnsupportedEncoding:
+        inbox = None
+    if inbox is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    connected = websocket_connected("agent")
+    credit_granted = asyncio.Event()
+    
+    async def push():
+        nonlocal credits
+        # 代理被注销后收件箱会被替换或删除，此时结束推送
+        while inboxes.get(agent_id) is inbox:
+            if credits is not None and credits <= 0:
+                credit_granted.clear()
+                await credit_granted.wait()
+                continue
+            messages = await inbox.get(max_messages if credits is None else min(max_messages, credits), None)
+            if not messages:
+                continue
+            if credits is not None:
+                credits -= len(messages)
+            frame = {"agent_id": agent_id, "messages": messages}
+            if media == codec.MSGPACK:
+                await websocket.send_bytes(codec.encode(frame, media))
+            else:
+                await websocket.send_text(codec.dumps_json(frame))
+        await websocket.close(code=1000)
+    
+    push_task = asyncio.create_task(push())
+    try:
+        # 保持连接；客户端发送的任何内容（如 "ping"）都视为心跳
+        while True:
+            frame = await receive_frame(websocket)
+            renew_leases([agent_id])
+            if credits is not None:
+                granted = frame_credits(frame, media)
+                if granted > 0:
+                    credits += granted
+                    credit_granted.set()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Agent WebSocket error: {str(e)}")
+    finally:
+        push_task.cancel()
+        websocket_disconnected("agent", connected)
+
+@app.post("/agents/{agent_id}/heartbeat")
+async def heartbeat(request: Request, agent_id: str):
+    """续约代理的注册租约"""
+    renewed, unknown = renew_leases([agent_id])
+    if unknown:
+        # 租约已过期或代理已被注销，代理应重新注册
+        raise HTTPException(status_code=404, detail=f"Agent {agent_id} not found")
+    return respond(request, {"agent_id": agent_id, "ttl": leases.ttl(agent_id) if agent_id in renewed else None})
+
+class Heartbeat(BaseModel):
+    agent_ids: List[str]
+
+@app.post("/heartbeat")
+async def heartbeat_batch(request: Request):
+    """批量续约，供共享一个连接的大量代理使用；unknown 中的代理需要重新注册"""
+    heartbeat = parse_model(Heartbeat, await read_body(request))
+    if len(heartbeat.agent_ids) > config.BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {config.BATCH_MAX_SIZE} agents")
+    renewed, unknown = renew_leases(heartbeat.agent_ids)
+    return respond(request, {"renewed": len(renewed), "unknown": unknown})
+
+@app.post("/blobs")
+async def upload_blob(request: Request, digest: Optional[str] = None):
+    """流式上传大对象，返回可放入消息 data 的引用
+
+    请求体边接收边写入磁盘，不在内存中缓冲整个对象；digest 为可选的 SHA-256，
+    与内容不一致时拒绝。相同内容只保存一份。
+    """
+    length = request.headers.get("content-length")
+    if length is not None:
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if length and config.BLOB_MAX_BYTES and length > config.BLOB_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Blob exceeds {config.BLOB_MAX_BYTES} bytes")
+    content_type = request.headers.get("content-type") or "application/octet-stream"
+    try:
+        reference = await blobs.write(request.stream(), content_type, expected=digest)
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except DigestMismatch as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    blob_bytes_total.inc(reference["size"], direction="upload")
+    logger.info(f"Stored blob {reference['$blob']} ({reference['size']} bytes)")
+    return respond(request, reference)
+
+def blob_headers(reference: Dict[str, Any]) -> Dict[str, str]:
+    return {"Accept-Ranges": "bytes", "ETag": f'"{reference["$blob"]}"', "Cache-Control": "max-age=31536000, immutable"}
+
+@app.head("/blobs/{digest}")
+async def blob_info(digest: str):
+    try:
+        reference = blobs.stat(digest)
+    except BlobNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    headers = blob_headers(reference)
+    headers["Content-Length"] = str(reference["size"])
+    return Response(headers=headers, media_type=reference["content_type"])
+
+@app.get("/blobs/{digest}")
+async def download_blob(request: Request, digest: str):
+    """流式读取大对象，支持单个 Range 请求（206 Partial Content）"""
+    try:
+        reference = blobs.stat(digest)
+        size = reference["size"]
+        headers = blob_headers(reference)
+        byte_range = parse_range(request.headers.get("range"), size)
+        if byte_range is None:
+            start, end, status_code = 0, size - 1, 200
+        else:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        chunks = blobs.read(digest, start, end)
+    except BlobNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RangeNotSatisfiable:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    blob_bytes_total.inc(end - start + 1, direction="download")
+    return StreamingResponse(chunks, status_code=status_code, headers=headers, media_type=reference["content_type"])
+
+@app.get("/broadcaster/stats")
+async def broadcaster_stats():
+    """仪表盘广播器的队列深度和丢弃统计"""
+    return broadcaster.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的指标（每个工作进程各自统计）"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+class ProfileRequest(BaseModel):
+    duration: Optional[float] = None
+    sample_rate: float = config.PROFILE_SAMPLE_RATE
+    interval_ms: Optional[float] = None
+
+@app.post("/profiler/start")
+async def start_profiler(request: Optional[ProfileRequest] = None):
+    """开始采样分析（本工作进程），duration 秒后自动停止并写出文件，不指定时直到 /profiler/stop"""
+    request = request or ProfileRequest()
+    if not 0 < request.sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="sample_rate must be in (0, 1]")
+    try:
+        profiler.start(
+            request.duration,
+            request.sample_rate,
+            request.interval_ms / 1000 if request.interval_ms else None
+        )
+    except ProfilerRunning as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profiler.status()
+
+@app.post("/profiler/stop")
+async def stop_profiler():
+    """停止采样分析，返回各路由的样本数和写出的 collapsed stack / speedscope 文件"""
+    if not profiler.running:
+        raise HTTPException(status_code=409, detail="Profiler is not running")
+    # 等待采样线程退出并写完文件，不阻塞事件循环
+    return await asyncio.to_thread(profiler.stop)
+
+@app.get("/profiler")
+async def profiler_status():
+    return profiler.status()
+
+@app.delete("/agents/{agent_id}")
+async def unregister_agent(request: Request, agent_id: str):
+    """注销一个AI代理"""
+    if agent_id not in registered_agents:
+        backend.refresh()
+    if agent_id not in registered_agents:
+        raise HTTPException(status_code=404, detail=f"Agent {agent_id} not found")
+    try:
+        logger.info(f"Agent {agent_id} unregistered")
+        
+        entry = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "sender_id": "system",
+            "receiver_id": "all",
+            "task": "agent_removed",
+            "data": {"agent_ids": [agent_id]}
+        }
+        await persist([entry])
+        
+        # 更新注册表并广播增量事件（所有工作进程）
+        backend.publish([("agent_removed", entry)])
+        unregistrations_total.inc(reason="unregister")
+        return respond(request, {
+            "status": "success",
+            "message": f"Agent {agent_id} unregistered",
+            "agent_id": agent_id
+        })
+    except BackendBusy:
+        raise
+    except Exception as e:
+        logger.error(f"Error unregistering agent: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 if __name__ == "__main__":
     logger.info("Starting AIXP Demo server")
-    uvicorn.run(app, host="127.0.0.1", port=9000) 
\ No newline at end of file
+    if config.WORKERS > 1:
+        if config.BACKEND == "memory":
+            logger.warning("Multiple workers with the memory backend do not share agents or messages")
+        # 多工作进程需要以导入字符串启动
+        uvicorn.run("server:app", host="127.0.0.1", port=9000, workers=config.WORKERS,
+                    ws_per_message_deflate=config.WS_COMPRESSION)
+    else:
+        uvicorn.run(app, host="127.0.0.1", port=9000, ws_per_message_deflate=config.WS_COMPRESSION) 
\ No newline at end of file
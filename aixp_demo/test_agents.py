@@ -1,12 +1,13 @@
 from agent import AIXPAgent
 import time
 import logging
+import os
 import sys
 import traceback
 
 # 配置日志
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.environ.get("AIXP_LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.FileHandler("aixp_demo/test_agents.log"),
@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import httpx
+
+from async_agent import AIXPConnection, AsyncAIXPAgent
+
+
+class FakeServer:
+    """只实现注册、订阅和续约的内存服务器；expire() 模拟租约过期后服务器注销代理"""
+
+    def __init__(self):
+        self.agents = set()
+        self.subscriptions = {}
+        self.fail_subscribe = False
+
+    def expire(self, agent_id):
+        self.agents.discard(agent_id)
+        self.subscriptions.pop(agent_id, None)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content) if request.content else None
+        path = request.url.path
+        if path == "/register_batch":
+            self.agents.update(info["agent_id"] for info in body)
+            return httpx.Response(200, json={"ttl": {info["agent_id"]: 0.3 for info in body}})
+        if path == "/subscribe":
+            if self.fail_subscribe:
+                return httpx.Response(503, text="busy")
+            topics = self.subscriptions.setdefault(body["agent_id"], set())
+            topics.update(body["topics"])
+            return httpx.Response(200, json={"subscriptions": sorted(topics)})
+        if path == "/unsubscribe":
+            topics = self.subscriptions.setdefault(body["agent_id"], set())
+            topics.difference_update(body["topics"] or list(topics))
+            return httpx.Response(200, json={"subscriptions": sorted(topics)})
+        if path == "/heartbeat":
+            unknown = [agent_id for agent_id in body["agent_ids"] if agent_id not in self.agents]
+            return httpx.Response(200, json={"unknown": unknown})
+        return httpx.Response(404)
+
+
+def connect(server: FakeServer) -> AIXPConnection:
+    connection = AIXPConnection("http://aixp.test")
+    connection.client = httpx.AsyncClient(base_url="http://aixp.test", transport=httpx.MockTransport(server.handle))
+    return connection
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_reregister_restores_subscriptions():
+    async def main():
+        server = FakeServer()
+        async with connect(server) as connection:
+            agent = AsyncAIXPAgent("watcher", [], connection=connection)
+            await agent.subscribe("orders.*", "alerts.#")
+            await agent.unsubscribe("alerts.#")
+            server.expire("watcher")
+            await wait_for(lambda: "watcher" in server.agents)
+            await wait_for(lambda: server.subscriptions.get("watcher") == {"orders.*"})
+
+    asyncio.run(main())
+
+
+def test_failed_restore_is_retried():
+    async def main():
+        server = FakeServer()
+        async with connect(server) as connection:
+            agent = AsyncAIXPAgent("watcher", [], connection=connection)
+            await agent.subscribe("orders.*")
+            server.fail_subscribe = True
+            server.expire("watcher")
+            await wait_for(lambda: "watcher" in connection._unrestored)
+            server.fail_subscribe = False
+            await wait_for(lambda: server.subscriptions.get("watcher") == {"orders.*"})
+            assert not connection._unrestored
+
+    asyncio.run(main())
+
+
+def test_resubscribe_does_not_poll_twice():
+    async def main():
+        polls = []
+
+        async def handle(request: httpx.Request) -> httpx.Response:
+            body = json.loads(request.content)
+            polls.append(tuple(body["agent_ids"]))
+            await asyncio.sleep(0.01)
+            return httpx.Response(200, json={"messages": {}, "unknown": []})
+
+        async with AIXPConnection("http://aixp.test", register_delay=0) as connection:
+            connection.client = httpx.AsyncClient(base_url="http://aixp.test", transport=httpx.MockTransport(handle))
+            connection.subscribe("a")
+            connection.subscribe("b")
+            assert connection.subscribe("a") is connection.subscribe("a")
+            await wait_for(lambda: ("a", "b") in polls)
+            connection.unsubscribe("a")
+            await wait_for(lambda: polls[-1] == ("b",))
+            # 原轮询组仍在运行（b 还在其中），重新订阅的 a 由原组继续轮询，不另起一组
+            connection.subscribe("a")
+            await wait_for(lambda: polls[-1] == ("a", "b"))
+            polls.clear()
+            await asyncio.sleep(0.1)
+            assert polls and set(polls) == {("a", "b")}
+            assert len(connection._poll_tasks) == 1
+
+    asyncio.run(main())
+
+
+def test_resubscribe_after_group_exits():
+    async def main():
+        polls = []
+
+        async def handle(request: httpx.Request) -> httpx.Response:
+            polls.append(tuple(json.loads(request.content)["agent_ids"]))
+            await asyncio.sleep(0.01)
+            return httpx.Response(200, json={"messages": {}, "unknown": []})
+
+        async with AIXPConnection("http://aixp.test", register_delay=0) as connection:
+            connection.client = httpx.AsyncClient(base_url="http://aixp.test", transport=httpx.MockTransport(handle))
+            connection.subscribe("a")
+            await wait_for(lambda: polls)
+            connection.unsubscribe("a")
+            # 组内没有订阅的代理后轮询循环退出，重新订阅时启动新组
+            await wait_for(lambda: connection._poll_tasks[0].done())
+            connection.subscribe("a")
+            await wait_for(lambda: len(connection._poll_tasks) == 2)
+            polls.clear()
+            await asyncio.sleep(0.1)
+            assert polls and set(polls) == {("a",)}
+
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+import sqlite3
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from backends import BackendBusy, SqliteBackend
+
+
+def registered(agent_id):
+    return "agent_registered", {"data": {"agent_id": agent_id, "capabilities": ["sqlite"]}}
+
+
+@pytest.fixture
+def locked(tmp_path):
+    """一个 SqliteBackend、在另一个连接上持有写锁的 sqlite3 连接，以及后端已应用的事件"""
+    path = str(tmp_path / "aixp.db")
+    backend = SqliteBackend(path, busy_timeout=0.05)
+    applied = []
+    backend.bind(applied.extend)
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    yield backend, other, applied
+    other.close()
+    backend.conn.close()
+
+
+def test_write_lock_contention_fails_fast(locked):
+    backend, other, applied = locked
+    started = time.monotonic()
+    with pytest.raises(BackendBusy):
+        backend.publish([registered("sqlite-a")])
+    assert time.monotonic() - started < 1
+    other.execute("ROLLBACK")
+    assert backend.load_state()[0] == {}
+    assert applied == []
+    backend.publish([registered("sqlite-a")])
+    assert backend.load_state()[0] == {"sqlite-a": ["sqlite"]}
+    assert [event_type for event_type, _ in applied] == ["agent_registered"]
+
+
+def test_busy_backend_returns_503_with_retry_after(locked, monkeypatch):
+    backend, other, applied = locked
+    monkeypatch.setattr(server, "backend", backend)
+    agent_id = f"sqlite-{uuid.uuid4().hex[:8]}"
+    response = TestClient(server.app).post("/register", json={"agent_id": agent_id, "capabilities": ["sqlite"]})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert "busy" in response.json()["detail"]
+    assert agent_id not in server.registered_agents
@@ -0,0 +1,48 @@
+import threading
+import time
+
+from agent import MessageBatcher
+
+
+class FakeAgent:
+    """记录每次 send_many() 的批次，不连接服务器"""
+
+    agent_id = "sender"
+
+    def __init__(self):
+        self.batches = []
+        self.sent = threading.Event()
+
+    def send_many(self, messages):
+        self.batches.append([message["task"] for message in messages])
+        self.sent.set()
+        return {"results": [{"status": "success", "task": message["task"]} for message in messages]}
+
+
+def test_single_message_flushes_within_max_delay():
+    agent = FakeAgent()
+    batcher = MessageBatcher(agent, max_batch_size=100, max_delay=0.05)
+    started = time.monotonic()
+    future = batcher.send("receiver", "ping", {})
+    assert future.result(timeout=1.0) == {"status": "success", "task": "ping"}
+    # 只有一条消息，不会攒满一批；由 max_delay 触发发送，而不是等到 flush() 或 close()
+    assert time.monotonic() - started < 0.5
+    assert agent.batches == [["ping"]]
+    batcher.close()
+
+
+def test_full_batch_sent_without_waiting():
+    agent = FakeAgent()
+    with MessageBatcher(agent, max_batch_size=3, max_delay=60) as batcher:
+        futures = [batcher.send("receiver", f"t{n}", {}) for n in range(3)]
+        assert futures[-1].result(timeout=1.0)["task"] == "t2"
+    assert agent.batches == [["t0", "t1", "t2"]]
+
+
+def test_close_sends_remaining_messages():
+    agent = FakeAgent()
+    batcher = MessageBatcher(agent, max_batch_size=2, max_delay=60)
+    futures = [batcher.send("receiver", f"t{n}", {}) for n in range(5)]
+    batcher.close()
+    assert [future.result(timeout=0)["task"] for future in futures] == ["t0", "t1", "t2", "t3", "t4"]
+    assert sorted(len(batch) for batch in agent.batches) == [1, 2, 2]
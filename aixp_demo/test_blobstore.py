@@ -0,0 +1,43 @@
+import pytest
+
+from blobstore import RangeNotSatisfiable, parse_range
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=10-19", (10, 19)),
+    ("bytes=0-0", (0, 0)),
+    ("bytes=99-99", (99, 99)),
+    # 结束位置超出对象时截到最后一个字节
+    ("bytes=90-1000", (90, 99)),
+    ("bytes=50-", (50, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-1", (99, 99)),
+    # 后缀长度超过对象大小时返回整个对象
+    ("bytes=-1000", (0, 99)),
+    ("bytes= 5-6 ", (5, 6)),
+])
+def test_satisfiable(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", [
+    None, "", "items=0-10", "bytes=0-1,5-6", "bytes=", "bytes=-", "bytes=abc", "bytes=a-b",
+    "bytes=1-b", "bytes=--5", "bytes=+1-2", "bytes=1--2", "bytes=0x10-", "bytes=1-2-3",
+    # last < first 语法不合法，按规范忽略 Range
+    "bytes=20-10",
+])
+def test_ignored(header):
+    assert parse_range(header, 100) is None
+
+
+@pytest.mark.parametrize("header,size", [
+    ("bytes=100-", 100),
+    ("bytes=100-200", 100),
+    ("bytes=-0", 100),
+    ("bytes=0-", 0),
+    ("bytes=-5", 0),
+])
+def test_not_satisfiable(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, size)
@@ -0,0 +1,129 @@
+import asyncio
+import json
+
+import pytest
+
+from broadcaster import COALESCE, DISCONNECT, DROP_OLDEST, Broadcaster
+
+
+class FakeWebSocket:
+    """记录发送的帧；release 之前发送会一直阻塞，模拟慢客户端"""
+
+    client = None
+
+    def __init__(self, blocked=False):
+        self.sent = []
+        self.closed_with = None
+        self.ready = asyncio.Event()
+        if not blocked:
+            self.ready.set()
+
+    async def send_text(self, data):
+        await self.ready.wait()
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        await self.ready.wait()
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+    def events(self):
+        return [json.loads(data) for data in self.sent]
+
+
+def snapshot():
+    return {"event": "snapshot", "seq": 0}
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def fill(policy, count):
+    """向一个尚未开始写出的客户端连续发布 count 个事件（队列容量 3）"""
+    async def main():
+        broadcaster = Broadcaster(snapshot, queue_size=3, policy=policy)
+        websocket = FakeWebSocket(blocked=True)
+        channel = broadcaster.add(websocket, [])
+        for seq in range(1, count + 1):
+            broadcaster.publish({"event": "tick", "seq": seq})
+        depth = len(channel.queue)
+        websocket.ready.set()
+        await settle()
+        await broadcaster.remove(channel)
+        return broadcaster, channel, websocket, depth
+    return asyncio.run(main())
+
+
+def test_rejects_unknown_policy():
+    with pytest.raises(ValueError):
+        Broadcaster(snapshot, policy="block")
+
+
+def test_drop_oldest_keeps_latest_events():
+    broadcaster, channel, websocket, depth = fill(DROP_OLDEST, 5)
+    assert depth == 3
+    assert channel.dropped == 2
+    assert [event["seq"] for event in websocket.events()] == [3, 4, 5]
+
+
+def test_coalesce_replaces_backlog_with_snapshot():
+    broadcaster, channel, websocket, depth = fill(COALESCE, 4)
+    assert depth == 1
+    assert channel.coalesced == 3
+    assert websocket.events() == [snapshot()]
+
+
+def test_coalesce_keeps_events_after_snapshot():
+    broadcaster, channel, websocket, depth = fill(COALESCE, 5)
+    assert depth == 2
+    assert [event["event"] for event in websocket.events()] == ["snapshot", "tick"]
+    assert websocket.events()[1]["seq"] == 5
+
+
+def test_disconnect_closes_slow_client():
+    broadcaster, channel, websocket, depth = fill(DISCONNECT, 4)
+    assert depth == 0
+    assert channel.closed
+    assert channel not in broadcaster.channels
+    assert broadcaster.disconnected_slow_clients == 1
+    assert websocket.closed_with == 1013
+    assert websocket.sent == []
+
+
+def test_queue_below_capacity_is_delivered_in_order():
+    for policy in (DROP_OLDEST, COALESCE, DISCONNECT):
+        broadcaster, channel, websocket, depth = fill(policy, 3)
+        assert [event["seq"] for event in websocket.events()] == [1, 2, 3]
+        assert channel.dropped == channel.coalesced == 0
+
+
+def test_slow_client_does_not_stall_publisher_or_other_clients():
+    async def main():
+        broadcaster = Broadcaster(snapshot, queue_size=4, policy=DROP_OLDEST)
+        slow, fast = FakeWebSocket(blocked=True), FakeWebSocket()
+        slow_channel = broadcaster.add(slow, [])
+        fast_channel = broadcaster.add(fast, [])
+        await settle()
+        for seq in range(1, 101):
+            # publish 只入队，不等待任何客户端写出
+            broadcaster.publish({"event": "tick", "seq": seq})
+            await asyncio.sleep(0)
+        await settle()
+        assert [event["seq"] for event in fast.events()] == list(range(1, 101))
+        assert slow.sent == []
+        assert len(slow_channel.queue) <= 4
+        # 慢客户端恢复后只收到最近的事件
+        slow.ready.set()
+        await settle()
+        assert [event["seq"] for event in slow.events()][-1] == 100
+        assert slow_channel.dropped > 0 and fast_channel.dropped == 0
+        # 每个帧只编码一次，两个客户端共享编码结果
+        assert broadcaster.frames_encoded == 100
+        assert slow.sent[-1] is fast.sent[-1]
+        await broadcaster.remove(slow_channel)
+        await broadcaster.remove(fast_channel)
+    asyncio.run(main())
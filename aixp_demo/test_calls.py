@@ -0,0 +1,88 @@
+import uuid
+
+from fastapi.testclient import TestClient
+
+import server
+from calls import CallTable
+
+
+def test_expired_in_deadline_order():
+    table = CallTable()
+    table.add("c3", "caller", 30, local=True)
+    table.add("c1", "caller", 10, local=True)
+    table.add("c2", "caller", 20, local=True)
+    assert table.next_deadline() == 10
+    assert table.expired(5) == []
+    assert table.expired(15) == [("c1", "caller")]
+    assert table.next_deadline() == 20
+    assert table.expired(40) == [("c2", "caller"), ("c3", "caller")]
+    assert len(table) == 0 and table.next_deadline() is None
+
+
+def test_answered_and_foreign_calls_are_not_reported():
+    table = CallTable()
+    table.add("answered", "a", 10, local=True)
+    table.add("foreign", "b", 10)
+    table.add("pending", "c", 10, local=True)
+    assert table.pop("answered") == "a"
+    assert table.pop("answered") is None
+    # 其他工作进程受理的调用到期后只清理记录
+    assert table.expired(10) == [("pending", "c")]
+    assert "foreign" not in table
+
+
+def test_replaced_call_uses_new_deadline():
+    table = CallTable()
+    table.add("c", "a", 10, local=True)
+    table.pop("c")
+    table.add("c", "a", 20, local=True)
+    assert table.expired(15) == []
+    assert table.caller("c") == "a"
+    assert table.expired(20) == [("c", "a")]
+
+
+def register(client):
+    agent_id = f"calls-{uuid.uuid4().hex[:8]}"
+    assert client.post("/register", json={"agent_id": agent_id, "capabilities": ["calls"]}).status_code == 200
+    return agent_id
+
+
+def call(client, caller, callee, timeout):
+    response = client.post("/send_message", json={
+        "sender_id": caller, "receiver_id": callee, "task": "add", "data": {"a": 1}, "timeout": timeout
+    })
+    assert response.status_code == 200
+    return response.json()["correlation_id"]
+
+
+def reply(client, callee, correlation_id):
+    return client.post("/send_message", json={
+        "sender_id": callee, "task": "add_result", "data": {"sum": 1}, "in_reply_to": correlation_id
+    })
+
+
+def test_first_reply_is_delivered_and_duplicate_is_gone():
+    with TestClient(server.app) as client:
+        caller, callee = register(client), register(client)
+        correlation_id = call(client, caller, callee, 30)
+        request = client.get(f"/inbox/{callee}", params={"timeout": 0}).json()["messages"][0]
+        assert request["correlation_id"] == correlation_id
+        response = reply(client, callee, correlation_id)
+        assert response.status_code == 200
+        assert response.json()["receiver"] == caller
+        assert correlation_id not in server.calls
+        assert reply(client, callee, correlation_id).status_code == 410
+        messages = client.get(f"/inbox/{caller}", params={"timeout": 0}).json()["messages"]
+        assert [(m["task"], m["in_reply_to"]) for m in messages] == [("add_result", correlation_id)]
+
+
+def test_unanswered_call_times_out_and_notifies_caller():
+    with TestClient(server.app) as client:
+        caller, callee = register(client), register(client)
+        correlation_id = call(client, caller, callee, 0.2)
+        messages = client.get(f"/inbox/{caller}", params={"timeout": 5}).json()["messages"]
+        assert len(messages) == 1
+        assert messages[0]["task"] == "call_timeout"
+        assert messages[0]["in_reply_to"] == correlation_id
+        assert messages[0]["error"]
+        assert reply(client, callee, correlation_id).status_code == 410
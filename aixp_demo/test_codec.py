@@ -0,0 +1,64 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import codec
+import server
+
+pytestmark = pytest.mark.skipif(codec.msgpack is None, reason="msgpack is not installed")
+
+
+def test_bytes_round_trip_between_json_and_msgpack():
+    value = {"name": "frame", "data": b"\x00\xffpayload", "nested": [b"", {"x": b"\x01"}]}
+    as_json = codec.encode(value)
+    assert b'"$bytes":"AP9wYXlsb2Fk"' in as_json
+    assert codec.decode(as_json) == value
+    # JSON 中的 {"$bytes": ...} 解码后按 bin 类型写入 MessagePack，反之亦然
+    as_msgpack = codec.encode(codec.decode(as_json), codec.MSGPACK)
+    assert codec.msgpack.unpackb(as_msgpack, raw=False)["data"] == b"\x00\xffpayload"
+    assert codec.decode(codec.encode(codec.decode(as_msgpack, codec.MSGPACK)), codec.JSON) == value
+
+
+def test_media_type_negotiation():
+    assert codec.media_type(None) == codec.JSON
+    assert codec.media_type("application/json") == codec.JSON
+    assert codec.media_type("application/msgpack") == codec.MSGPACK
+    assert codec.media_type("application/x-msgpack, application/json;q=0.5") == codec.MSGPACK
+    assert codec.encoding_name(None) == codec.JSON
+    with pytest.raises(codec.UnsupportedEncoding):
+        codec.encoding_name("xml")
+
+
+def test_agent_endpoints_answer_in_msgpack():
+    agent_id = f"codec-{uuid.uuid4().hex[:8]}"
+    msgpack_headers = {"Content-Type": codec.MSGPACK, "Accept": codec.MSGPACK}
+    with TestClient(server.app) as client:
+        response = client.post(
+            "/register",
+            content=codec.encode({"agent_id": agent_id, "capabilities": ["codec"]}, codec.MSGPACK),
+            headers=msgpack_headers
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == codec.MSGPACK
+        assert codec.decode(response.content, codec.MSGPACK)["agent_id"] == agent_id
+
+        response = client.post(f"/agents/{agent_id}/heartbeat", headers={"Accept": codec.MSGPACK})
+        assert response.headers["content-type"] == codec.MSGPACK
+        assert codec.decode(response.content, codec.MSGPACK)["agent_id"] == agent_id
+
+        response = client.post(
+            "/heartbeat",
+            content=codec.encode({"agent_ids": [agent_id, "codec-missing"]}, codec.MSGPACK),
+            headers=msgpack_headers
+        )
+        assert codec.decode(response.content, codec.MSGPACK) == {"renewed": 1, "unknown": ["codec-missing"]}
+
+        response = client.get("/agents", params={"capability": "codec"}, headers={"Accept": codec.MSGPACK})
+        assert response.headers["content-type"] == codec.MSGPACK
+        assert [agent["id"] for agent in codec.decode(response.content, codec.MSGPACK)["agents"]] == [agent_id]
+
+        # 不带 Accept 时仍为 JSON
+        response = client.delete(f"/agents/{agent_id}")
+        assert response.headers["content-type"] == codec.JSON
+        assert response.json()["agent_id"] == agent_id
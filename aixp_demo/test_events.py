@@ -0,0 +1,83 @@
+import uuid
+
+from fastapi.testclient import TestClient
+
+import server
+from events import EventStream
+
+
+def test_since_returns_missed_events():
+    stream = EventStream(maxlen=4)
+    for n in range(3):
+        stream.publish("tick", n)
+    assert stream.seq == 3
+    assert [event["seq"] for event in stream.since(1)] == [2, 3]
+    assert stream.since(3) == []
+
+
+def test_since_outside_window_needs_snapshot():
+    stream = EventStream(maxlen=4)
+    for n in range(10):
+        stream.publish("tick", n)
+    assert [event["seq"] for event in stream.since(6)] == [7, 8, 9, 10]
+    # 序号 6 之后的事件仍全部在缓冲区中，再早的已被淘汰
+    assert stream.since(5) is None
+    assert stream.since(11) is None
+    assert stream.since(-1) is None
+
+
+def register(client, count):
+    agent_ids = [f"events-{uuid.uuid4().hex[:8]}" for _ in range(count)]
+    for agent_id in agent_ids:
+        assert client.post("/register", json={"agent_id": agent_id, "capabilities": ["events"]}).status_code == 200
+    return agent_ids
+
+
+def registered_id(event):
+    assert event["event"] == "agent_registered"
+    return event["data"]["data"]["agent_id"]
+
+
+def test_resume_within_window_sends_only_missed_events():
+    with TestClient(server.app) as client:
+        with client.websocket_connect("/ws") as websocket:
+            snapshot = websocket.receive_json()
+        assert snapshot["event"] == "snapshot"
+        missed = register(client, 2)
+
+        with client.websocket_connect(f"/ws?since={snapshot['seq']}&stream={snapshot['stream']}") as websocket:
+            first, second = websocket.receive_json(), websocket.receive_json()
+            assert [first["seq"], second["seq"]] == [snapshot["seq"] + 1, snapshot["seq"] + 2]
+            assert [registered_id(first), registered_id(second)] == missed
+            # 补发之后紧接着是实时事件，序号连续
+            live = register(client, 1)
+            event = websocket.receive_json()
+            assert event["seq"] == snapshot["seq"] + 3
+            assert registered_id(event) == live[0]
+
+
+def test_stale_stream_gets_snapshot():
+    with TestClient(server.app) as client:
+        seq = server.event_stream.seq
+        with client.websocket_connect(f"/ws?since={seq}&stream=stale") as websocket:
+            snapshot = websocket.receive_json()
+            assert snapshot["event"] == "snapshot"
+            assert snapshot["stream"] == server.event_stream.stream_id
+
+
+def test_evicted_since_gets_snapshot_matching_following_events(monkeypatch):
+    monkeypatch.setattr(server, "event_stream", EventStream(maxlen=2))
+    with TestClient(server.app) as client:
+        stream = server.event_stream.stream_id
+        register(client, 3)
+        # 缓冲区只保留序号 2、3，续传需要的序号 1 已被淘汰
+        with client.websocket_connect(f"/ws?since=0&stream={stream}") as websocket:
+            snapshot = websocket.receive_json()
+            assert snapshot["event"] == "snapshot"
+            assert snapshot["seq"] == 3
+            agent_ids = [agent["id"] for agent in snapshot["data"]["agents"]]
+            live = register(client, 1)
+            assert live[0] not in agent_ids
+            event = websocket.receive_json()
+            assert event["seq"] == snapshot["seq"] + 1
+            assert registered_id(event) == live[0]
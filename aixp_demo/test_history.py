@@ -0,0 +1,146 @@
+import pytest
+
+from history import HistoryIndex, RingBuffer
+
+
+def filled(capacity, count):
+    ring = RingBuffer(capacity)
+    for n in range(1, count + 1):
+        assert ring.append(n) == n
+    return ring
+
+
+def test_rejects_empty_capacity():
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+
+
+def test_before_wrap():
+    ring = filled(4, 3)
+    assert (len(ring), ring.first_seq, ring.last_seq) == (3, 1, 3)
+    assert list(ring) == [1, 2, 3]
+    assert ring.last(2) == [2, 3]
+    assert ring.last(10) == [1, 2, 3]
+    assert ring.since(1) == [2, 3]
+    assert ring.get(4) is None
+
+
+def test_wrap_around_evicts_oldest():
+    ring = filled(4, 10)
+    assert (len(ring), ring.first_seq, ring.last_seq) == (4, 7, 10)
+    assert list(ring) == [7, 8, 9, 10]
+    assert ring.get(6) is None
+    assert ring.get(7) == 7
+    assert ring.get(11) is None
+
+
+@pytest.mark.parametrize("count", range(4, 13))
+def test_last_across_wrap(count):
+    # 覆盖最旧元素位于缓冲区各个位置的情况
+    ring = filled(4, count)
+    for n in range(0, 6):
+        expected = list(range(max(count - 4, count - n) + 1, count + 1))
+        assert ring.last(n) == expected
+
+
+@pytest.mark.parametrize("count", range(4, 13))
+def test_since_across_wrap(count):
+    ring = filled(4, count)
+    for seq in range(0, count + 2):
+        # 已被淘汰的部分不返回
+        expected = list(range(max(seq, count - 4) + 1, count + 1))
+        assert ring.since(seq) == expected
+        assert ring.since(seq, limit=2) == expected[:2]
+    assert ring.since(0, limit=0) == []
+
+
+def test_last_and_since_on_empty():
+    ring = RingBuffer(3)
+    assert ring.last(5) == []
+    assert ring.since(0) == []
+    assert ring.last(-1) == []
+    assert ring.last_seq == 0
+
+
+class Store:
+    """环形缓冲区 + 索引，覆盖最旧的条目时从索引中移除（与服务器的用法相同）"""
+
+    def __init__(self, capacity):
+        self.ring = RingBuffer(capacity)
+        self.index = HistoryIndex(self.ring.get)
+
+    def add(self, n, sender, task="t"):
+        if len(self.ring) == self.ring.capacity:
+            self.index.evict(self.ring.first_seq, self.ring.get(self.ring.first_seq))
+        entry = {"n": n, "sender_id": sender, "receiver_id": "r", "task": task,
+                 "timestamp": f"2026-01-01 00:00:{n:02d}"}
+        self.index.add(self.ring.append(entry), entry)
+
+
+def pages(index, filters, limit, **options):
+    result, cursor = [], None
+    while True:
+        entries, cursor = index.query(filters, cursor=cursor, limit=limit, **options)
+        result.append([entry["n"] for entry in entries])
+        if cursor is None:
+            return result
+
+
+def test_cursor_paging_descending_and_ascending():
+    store = Store(100)
+    for n in range(10):
+        store.add(n, "a" if n % 2 else "b")
+    assert pages(store.index, {"sender_id": "a"}, 2) == [[9, 7], [5, 3], [1]]
+    assert pages(store.index, {"sender_id": "a"}, 2, descending=False) == [[1, 3], [5, 7], [9]]
+    # 最后一页恰好凑满时游标为 None，不会多出一个空页
+    assert pages(store.index, {}, 5) == [[9, 8, 7, 6, 5], [4, 3, 2, 1, 0]]
+
+
+def test_filters_combine():
+    store = Store(100)
+    for n in range(10):
+        store.add(n, "a" if n % 2 else "b", task="x" if n < 5 else "y")
+    entries, cursor = store.index.query({"sender_id": "a", "task": "y"})
+    assert [entry["n"] for entry in entries] == [9, 7, 5]
+    assert cursor is None
+    assert store.index.query({"sender_id": "nobody"}) == ([], None)
+
+
+def test_time_range():
+    store = Store(100)
+    for n in range(10):
+        store.add(n, "a")
+    entries, _ = store.index.query({}, since="2026-01-01 00:00:03", until="2026-01-01 00:00:06",
+                                   descending=False)
+    assert [entry["n"] for entry in entries] == [3, 4, 5, 6]
+
+
+def test_eviction_drops_old_positions_and_keys():
+    store = Store(4)
+    store.add(0, "old")
+    for n in range(1, 10):
+        store.add(n, "a")
+    assert len(store.index) == 4
+    # 只在被淘汰的条目中出现的键被删除
+    assert store.index.query({"sender_id": "old"}) == ([], None)
+    assert pages(store.index, {"sender_id": "a"}, 3) == [[9, 8, 7], [6]]
+
+
+def test_remove_before():
+    store = Store(100)
+    for n in range(10):
+        store.add(n, "a" if n < 3 else "b")
+    store.index.remove_before(5)
+    assert store.index.query({"sender_id": "a"}) == ([], None)
+    assert pages(store.index, {}, 10) == [[9, 8, 7, 6, 5, 4]]
+
+
+def test_long_eviction_compacts_postings():
+    store = Store(10)
+    for n in range(3000):
+        store.add(n % 60, "a")
+    postings = store.index._keys["sender_id"]["a"]
+    assert len(postings) == 10
+    assert len(postings.positions) < 2100
+    entries, cursor = store.index.query({"sender_id": "a"}, limit=10)
+    assert len(entries) == 10 and cursor is None
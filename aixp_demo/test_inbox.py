@@ -0,0 +1,75 @@
+import threading
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+
+import server
+
+
+def register(client):
+    agent_id = f"inbox-{uuid.uuid4().hex[:8]}"
+    assert client.post("/register", json={"agent_id": agent_id, "capabilities": ["inbox"]}).status_code == 200
+    return agent_id
+
+
+def send(client, sender_id, receiver_id, n):
+    message = {"sender_id": sender_id, "receiver_id": receiver_id, "task": "inbox_test", "data": {"n": n}}
+    assert client.post("/send_message", json=message).status_code == 200
+
+
+def test_long_poll_times_out_empty():
+    with TestClient(server.app) as client:
+        agent_id = register(client)
+        started = time.monotonic()
+        response = client.get(f"/inbox/{agent_id}", params={"timeout": 0.2})
+        assert response.status_code == 200
+        assert response.json() == {"agent_id": agent_id, "messages": []}
+        assert time.monotonic() - started >= 0.15
+
+
+def test_delivery_wakes_long_poll():
+    with TestClient(server.app) as client:
+        sender_id, receiver_id = register(client), register(client)
+        result = {}
+
+        def poll():
+            started = time.monotonic()
+            result["response"] = client.get(f"/inbox/{receiver_id}", params={"timeout": 10})
+            result["elapsed"] = time.monotonic() - started
+
+        poller = threading.Thread(target=poll)
+        poller.start()
+        time.sleep(0.2)
+        send(client, sender_id, receiver_id, 1)
+        poller.join(5)
+        assert not poller.is_alive()
+        assert [message["data"] for message in result["response"].json()["messages"]] == [{"n": 1}]
+        assert result["elapsed"] < 2
+
+
+def test_poll_reports_unknown_agents():
+    with TestClient(server.app) as client:
+        sender_id, receiver_id = register(client), register(client)
+        send(client, sender_id, receiver_id, 1)
+        missing = f"inbox-missing-{uuid.uuid4().hex[:8]}"
+        response = client.post("/inboxes/poll", json={"agent_ids": [receiver_id, missing], "timeout": 0})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["unknown"] == [missing]
+        assert [message["data"] for message in body["messages"][receiver_id]] == [{"n": 1}]
+
+
+def test_websocket_push_stops_when_credits_run_out():
+    with TestClient(server.app) as client:
+        sender_id, receiver_id = register(client), register(client)
+        with client.websocket_connect(f"/ws/agent/{receiver_id}?credits=1") as websocket:
+            send(client, sender_id, receiver_id, 1)
+            send(client, sender_id, receiver_id, 2)
+            assert [message["data"] for message in websocket.receive_json()["messages"]] == [{"n": 1}]
+            # 额度用完，第二条消息留在收件箱中
+            time.sleep(0.1)
+            assert len(server.inboxes.get(receiver_id)) == 1
+            websocket.send_json({"credits": 1})
+            assert [message["data"] for message in websocket.receive_json()["messages"]] == [{"n": 2}]
+            assert len(server.inboxes.get(receiver_id)) == 0
@@ -0,0 +1,64 @@
+from leases import LeaseTable
+
+
+def test_grant_and_expire():
+    leases = LeaseTable()
+    assert leases.grant("a", 10, now=0) == 10
+    assert "a" in leases and leases.ttl("a") == 10
+    assert leases.next_deadline() == 10
+    assert leases.expired(9.9) == []
+    assert leases.expired(10) == ["a"]
+    # 过期的租约由调用方撤销
+    assert "a" in leases
+    leases.revoke("a")
+    assert "a" not in leases and len(leases) == 0
+    assert leases.renew("a", now=11) is None
+
+
+def test_renew_reschedules_lazily():
+    leases = LeaseTable()
+    leases.grant("a", 10, now=0)
+    for now in range(1, 50):
+        assert leases.renew("a", now=now) == now + 10
+    # 续约只更新到期时间，不向堆中追加定时项
+    assert len(leases._heap) == 1
+    assert leases.next_deadline() == 10
+    # 弹出旧定时项时发现已续约，按新的到期时间重新入堆
+    assert leases.expired(10) == []
+    assert leases.next_deadline() == 59
+    assert leases.expired(58) == []
+    assert leases.expired(59) == ["a"]
+
+
+def test_extend_earlier_supersedes_scheduled_item():
+    leases = LeaseTable()
+    leases.grant("a", 10, now=0)
+    leases.extend("a", 5)
+    assert leases.next_deadline() == 5
+    assert leases.expired(5) == ["a"]
+    # 被取代的定时项弹出时丢弃，不会重复报告
+    leases.revoke("a")
+    assert leases.expired(10) == []
+    assert leases._heap == []
+
+
+def test_batched_expiry():
+    leases = LeaseTable()
+    for n in range(1000):
+        leases.grant(f"agent-{n}", 10 + n % 10, now=0)
+    leases.renew("agent-0", now=6)
+    expired = leases.expired(15)
+    # 到期时间 10..15 的代理在一次调用中全部弹出，续约过的代理除外
+    assert len(expired) == 600 - 1
+    assert "agent-0" not in expired
+    assert set(expired) == {f"agent-{n}" for n in range(1, 1000) if n % 10 <= 5}
+    assert leases.next_deadline() == 16
+    assert len(leases.expired(100)) == 401
+
+
+def test_revoked_lease_is_not_reported():
+    leases = LeaseTable()
+    leases.grant("a", 10, now=0)
+    leases.grant("b", 10, now=0)
+    leases.revoke("a")
+    assert leases.expired(10) == ["b"]
@@ -1,6 +1,7 @@
 from agent import AIXPAgent
 import time
 import logging
+import os
 import sys
 import traceback
 import requests
@@ -11,7 +12,7 @@ sys.stdout.reconfigure(line_buffering=True)
 
 # 配置日志
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.environ.get("AIXP_LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(sys.stdout)
@@ -19,10 +20,6 @@ logging.basicConfig(
     force=True  # 强制重新配置日志
 )
 
-# 设置requests的日志级别
-logging.getLogger('requests').setLevel(logging.DEBUG)
-logging.getLogger('urllib3').setLevel(logging.DEBUG)
-
 logger = logging.getLogger(__name__)
 
 def wait_for_server(url: str = "http://127.0.0.1:9000", max_retries: int = 5):
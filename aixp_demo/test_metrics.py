@@ -0,0 +1,70 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from metrics import Registry
+
+
+def parse(text):
+    """Prometheus 文本 -> {指标名和标签: 值}"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_counter_labels_are_escaped():
+    registry = Registry()
+    counter = registry.counter("test_total", "Test counter", ["path"])
+    counter.inc(path='a"b\\c\nd')
+    counter.inc(2, path='a"b\\c\nd')
+    assert 'test_total{path="a\\"b\\\\c\\nd"} 3' in registry.render().splitlines()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("test_seconds", "Test latency", ["endpoint"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, endpoint="x")
+    samples = parse(registry.render())
+    assert samples['test_seconds_bucket{endpoint="x",le="0.1"}'] == 2
+    assert samples['test_seconds_bucket{endpoint="x",le="1"}'] == 3
+    assert samples['test_seconds_bucket{endpoint="x",le="+Inf"}'] == 4
+    assert samples['test_seconds_count{endpoint="x"}'] == 4
+    assert samples['test_seconds_sum{endpoint="x"}'] == pytest.approx(3.65)
+
+
+def test_gauge_function_is_read_at_scrape_time():
+    registry = Registry()
+    items = []
+    registry.gauge("test_items", "Items", function=lambda: len(items))
+    assert parse(registry.render())["test_items"] == 0
+    items.extend([1, 2])
+    assert parse(registry.render())["test_items"] == 2
+
+
+def test_scrape_after_send():
+    accepted = 'aixp_messages_total{endpoint="send_message",status="accepted"}'
+    count = 'aixp_send_seconds_count{endpoint="send_message"}'
+    with TestClient(server.app) as client:
+        agent_ids = [f"metrics-{uuid.uuid4().hex[:8]}" for _ in range(2)]
+        for agent_id in agent_ids:
+            client.post("/register", json={"agent_id": agent_id, "capabilities": ["metrics"]})
+        before = parse(client.get("/metrics").text)
+        response = client.post("/send_message", json={
+            "sender_id": agent_ids[0], "receiver_id": agent_ids[1], "task": "metrics_test", "data": {}
+        })
+        assert response.status_code == 200
+        response = client.get("/metrics")
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        after = parse(response.text)
+        assert after[accepted] - before.get(accepted, 0) == 1
+        assert after[count] - before.get(count, 0) == 1
+        assert after['aixp_send_seconds_bucket{endpoint="send_message",le="+Inf"}'] == after[count]
+        assert after['aixp_send_seconds_sum{endpoint="send_message"}'] > before.get('aixp_send_seconds_sum{endpoint="send_message"}', 0)
+        assert after["aixp_agents"] == len(server.registered_agents)
+        assert after["aixp_inbox_messages"] >= 1
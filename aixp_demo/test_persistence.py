@@ -0,0 +1,118 @@
+import os
+
+from persistence import HEADER, SegmentLog
+
+
+def write(log, records):
+    futures = [log.append(record) for record in records]
+    return [future.result(timeout=5) for future in futures]
+
+
+def test_replay_after_restart(tmp_path):
+    log = SegmentLog(str(tmp_path), fsync=False)
+    log.open()
+    assert write(log, [{"n": n} for n in range(5)]) == [1, 2, 3, 4, 5]
+    log.close()
+
+    log = SegmentLog(str(tmp_path), fsync=False)
+    assert list(log.replay()) == [(n + 1, {"n": n}) for n in range(5)]
+    log.open()
+    assert write(log, [{"n": 5}]) == [6]
+    assert log.read(3) == {"n": 2}
+    assert log.read(6) == {"n": 5}
+    assert log.read(7) is None
+    log.close()
+
+
+def test_open_without_replay_continues_sequence(tmp_path):
+    log = SegmentLog(str(tmp_path), fsync=False)
+    log.open()
+    write(log, [{"n": 0}, {"n": 1}])
+    log.close()
+    log = SegmentLog(str(tmp_path), fsync=False)
+    log.open()
+    assert write(log, [{"n": 2}]) == [3]
+    log.close()
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    log = SegmentLog(str(tmp_path), fsync=False)
+    log.open()
+    write(log, [{"n": 0}, {"n": 1}])
+    log.close()
+    path = log.segments()[-1]
+    intact = os.path.getsize(path)
+    # 崩溃时只写入了记录头和一部分负载
+    with open(path, "ab") as f:
+        f.write(HEADER.pack(100, 0, 3) + b'{"n": 2')
+
+    log = SegmentLog(str(tmp_path), fsync=False)
+    assert [seq for seq, _ in log.replay()] == [1, 2]
+    assert os.path.getsize(path) == intact
+    log.open()
+    assert write(log, [{"n": 2}]) == [3]
+    log.close()
+    assert list(SegmentLog(str(tmp_path)).replay())[-1] == (3, {"n": 2})
+
+
+def test_corrupt_record_stops_replay(tmp_path):
+    log = SegmentLog(str(tmp_path), fsync=False)
+    log.open()
+    write(log, [{"n": 0}, {"n": 1}])
+    log.close()
+    path = log.segments()[-1]
+    with open(path, "r+b") as f:
+        # 破坏第二条记录负载的最后一个字节，CRC 不再匹配
+        f.seek(-2, os.SEEK_END)
+        f.write(b"X")
+    assert [seq for seq, _ in SegmentLog(str(tmp_path)).replay()] == [1]
+
+
+def test_segment_roll(tmp_path):
+    log = SegmentLog(str(tmp_path), segment_bytes=100, fsync=False)
+    log.open()
+    for n in range(10):
+        write(log, [{"n": n, "pad": "x" * 20}])
+    segments = log.segments()
+    assert len(segments) > 1
+    # 分段以第一条记录的序号命名
+    assert os.path.basename(segments[0]) == "segment-00000000000000000001.log"
+    assert all(os.path.getsize(path) < 100 + HEADER.size + 40 for path in segments)
+    assert [log.read(n + 1)["n"] for n in range(10)] == list(range(10))
+    log.close()
+
+    log = SegmentLog(str(tmp_path), segment_bytes=100, fsync=False)
+    assert [seq for seq, _ in log.replay()] == list(range(1, 11))
+
+
+def test_compaction_removes_old_segments(tmp_path):
+    log = SegmentLog(str(tmp_path), segment_bytes=100, max_total_bytes=150, fsync=False)
+    log.open()
+    for n in range(10):
+        write(log, [{"n": n, "pad": "x" * 20}])
+    before = log.segments()
+    snapshot_seq = log.compact({"snapshot": True}).result(timeout=5)
+    after = log.segments()
+    assert len(after) < len(before)
+    # 快照之前的分段在超出大小上限时删除，快照本身仍可读取
+    assert log.read(1) is None
+    assert log.first_seq > 1
+    assert log.read(snapshot_seq) == {"snapshot": True}
+    log.close()
+
+    replayed = list(SegmentLog(str(tmp_path)).replay())
+    assert replayed[-1] == (snapshot_seq, {"snapshot": True})
+    assert replayed[0][0] == log.first_seq
+
+
+def test_compaction_keeps_segments_within_limits(tmp_path):
+    log = SegmentLog(str(tmp_path), segment_bytes=100, fsync=False)
+    log.open()
+    for n in range(10):
+        write(log, [{"n": n, "pad": "x" * 20}])
+    before = log.segments()
+    log.compact({"snapshot": True}).result(timeout=5)
+    # 未设置保留时间和大小上限时不删除任何分段
+    assert set(before) <= set(log.segments())
+    assert log.read(1) == {"n": 0, "pad": "x" * 20}
+    log.close()
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import time
+
+from fastapi.testclient import TestClient
+
+import server
+from profiler import ProfilingMiddleware, SamplingProfiler
+
+
+def test_profile_endpoints_write_collapsed_stacks(tmp_path, monkeypatch):
+    monkeypatch.setattr(server.profiler, "output_dir", str(tmp_path))
+    with TestClient(server.app) as client:
+        assert client.post("/profiler/stop").status_code == 409
+        response = client.post("/profiler/start", json={"interval_ms": 1})
+        assert response.status_code == 200
+        assert response.json()["running"]
+        assert client.post("/profiler/start", json={}).status_code == 409
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline:
+            client.get("/agents")
+        response = client.post("/profiler/stop")
+        assert response.status_code == 200
+        result = response.json()
+        assert result["samples"] > 0
+        assert sum(result["routes"].values()) == result["samples"]
+        collapsed, speedscope = result["files"]
+        assert os.path.dirname(collapsed) == str(tmp_path)
+        with open(collapsed, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert lines
+        # 每行为 "路由;外层帧;...;内层帧 样本数"
+        assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == result["samples"]
+        assert os.path.getsize(speedscope) > 0
+        assert not client.get("/profiler").json()["running"]
+
+
+def test_middleware_passes_requests_through_when_idle():
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append((scope, receive, send))
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+
+    async def receive():
+        return {"type": "http.request"}
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    profiler = SamplingProfiler("unused")
+    middleware = ProfilingMiddleware(app, profiler)
+    scope = {"type": "http", "method": "GET", "path": "/agents"}
+    asyncio.run(middleware(scope, receive, send))
+    assert calls == [(scope, receive, send)]
+    assert sent == [{"type": "http.response.start", "status": 204, "headers": []}]
+    assert profiler.sampled_requests == 0 and not profiler.requests
+
+
+def test_middleware_registers_sampled_requests_only_while_running():
+    seen = []
+    profiler = SamplingProfiler("unused")
+
+    async def app(scope, receive, send):
+        seen.append(list(profiler.requests.values()))
+
+    middleware = ProfilingMiddleware(app, profiler)
+    scope = {"type": "http", "method": "GET", "path": "/agents"}
+    profiler.running = True
+    profiler.sample_rate = 1.0
+    asyncio.run(middleware(scope, None, None))
+    profiler.sample_rate = 0.0
+    asyncio.run(middleware(scope, None, None))
+    assert seen == [[scope], []]
+    assert profiler.sampled_requests == 1 and not profiler.requests
@@ -0,0 +1,75 @@
+import pytest
+
+from ratelimit import AdaptivePacer, RateLimiter, TokenBucket, overload_hint
+
+
+def test_bucket_starts_full_and_drains():
+    bucket = TokenBucket(rate=10, burst=5, now=0)
+    for _ in range(5):
+        assert bucket.delay(1, now=0) == 0
+        bucket.consume(1)
+    # 令牌用完：下一个令牌在 1/rate 秒后补充
+    assert bucket.delay(1, now=0) == pytest.approx(0.1)
+    # delay() 本身不消耗令牌
+    assert bucket.delay(1, now=0) == pytest.approx(0.1)
+
+
+def test_refill():
+    bucket = TokenBucket(rate=10, burst=5, now=0)
+    bucket.consume(5)
+    assert bucket.delay(2, now=0.1) == pytest.approx(0.1)
+    assert bucket.delay(2, now=0.2) == 0
+    # 补充不超过 burst
+    assert bucket.delay(1, now=100) == 0
+    assert bucket.tokens == 5
+
+
+def test_retry_after_for_batches():
+    bucket = TokenBucket(rate=10, burst=5, now=0)
+    bucket.consume(5)
+    assert bucket.delay(3, now=0) == pytest.approx(0.3)
+    # 超过 burst 的批量只需等到桶满，而不是永远等待
+    assert bucket.delay(50, now=0) == pytest.approx(0.5)
+    assert bucket.delay(50, now=0.5) == 0
+
+
+def test_limiter_disabled_when_rate_is_zero():
+    assert RateLimiter(0).bucket("a", now=0) is None
+
+
+def test_limiter_buckets_per_key():
+    limiter = RateLimiter(rate=2)
+    assert limiter.burst == 2
+    a = limiter.bucket("a", now=0)
+    a.consume(2)
+    assert limiter.bucket("a", now=0) is a
+    assert limiter.bucket("a", now=0).delay(1, now=0) == pytest.approx(0.5)
+    assert limiter.bucket("b", now=0).delay(1, now=0) == 0
+
+
+def test_limiter_prunes_idle_buckets():
+    limiter = RateLimiter(rate=1, burst=2, prune_every=3)
+    limiter.bucket("a", now=0).delay(1, now=0)
+    limiter.bucket("b", now=0).delay(1, now=0)
+    # 第三次调用时清理：空闲不少于 burst / rate 秒的桶已补满，与新桶等价
+    limiter.bucket("c", now=2)
+    assert len(limiter) == 1
+
+
+def test_overload_hint():
+    assert overload_hint({"Retry-After": "2", "X-RateLimit-Limit": "50"}) == (2.0, 50.0)
+    assert overload_hint({"X-Retry-After-Ms": "250", "Retry-After": "1"}) == (0.25, None)
+    assert overload_hint({}) == (1.0, None)
+
+
+def test_pacer_backs_off_and_recovers():
+    pacer = AdaptivePacer(max_interval=1.0, decrease=0.5)
+    assert pacer.reserve() == 0
+    pacer.backoff(0.0, limit=100)
+    assert pacer.interval == pytest.approx(0.01)
+    # 同一退避窗口内的多个 429 只加倍一次
+    pacer.backoff(0.0, limit=100)
+    assert pacer.interval == pytest.approx(0.01)
+    for _ in range(10):
+        pacer.success()
+    assert pacer.interval == 0.0
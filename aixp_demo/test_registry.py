@@ -0,0 +1,78 @@
+import uuid
+
+from fastapi.testclient import TestClient
+
+import server
+from registry import AgentRegistry
+
+
+def filled(count):
+    registry = AgentRegistry()
+    for n in range(count):
+        registry.register(f"agent-{n:02d}", ["even" if n % 2 == 0 else "odd", "all"])
+    return registry
+
+
+def walk(registry, capability, limit, between_pages=None):
+    seen, cursor = [], None
+    while True:
+        page, cursor = registry.page(capability, limit, cursor)
+        seen.extend(agent_id for agent_id, _ in page)
+        if cursor is None:
+            return seen
+        if between_pages is not None:
+            between_pages(registry, cursor)
+
+
+def test_pages_cover_every_agent_once():
+    registry = filled(25)
+    assert walk(registry, None, 4) == [f"agent-{n:02d}" for n in range(25)]
+    assert walk(registry, "odd", 5) == [f"agent-{n:02d}" for n in range(1, 25, 2)]
+    assert walk(registry, "missing", 5) == []
+
+
+def test_exact_multiple_of_limit_has_no_empty_last_page():
+    registry = filled(8)
+    page, cursor = registry.page(None, 4, None)
+    page, cursor = registry.page(None, 4, cursor)
+    assert [agent_id for agent_id, _ in page] == [f"agent-{n:02d}" for n in range(4, 8)]
+    assert cursor is None
+
+
+def test_removal_between_pages_skips_nothing_else():
+    removed = []
+
+    def remove_cursor_and_next(registry, cursor):
+        # 删除作为游标的代理本身，以及下一页的第一个代理
+        following = registry.ordered("all")[registry.ordered("all").index(cursor) + 1]
+        registry.unregister(cursor)
+        registry.unregister(following)
+        removed.extend([cursor, following])
+
+    registry = filled(20)
+    seen = walk(registry, "all", 6, remove_cursor_and_next)
+    assert len(seen) == len(set(seen))
+    assert set(seen) | set(removed) == {f"agent-{n:02d}" for n in range(20)}
+    assert seen == sorted(seen)
+
+
+def test_agents_endpoint_pages_by_capability():
+    capability = f"paging-{uuid.uuid4().hex[:8]}"
+    agent_ids = [f"{capability}-{n:02d}" for n in range(7)]
+    with TestClient(server.app) as client:
+        for agent_id in agent_ids:
+            assert client.post("/register", json={"agent_id": agent_id, "capabilities": [capability]}).status_code == 200
+        seen, cursor = [], None
+        while True:
+            params = {"capability": capability, "limit": 3}
+            if cursor is not None:
+                params["cursor"] = cursor
+            body = client.get("/agents", params=params).json()
+            seen.extend(agent["id"] for agent in body["agents"])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+            if agent_ids[3] not in seen:
+                assert client.delete(f"/agents/{agent_ids[3]}").status_code == 200
+        assert seen == agent_ids[:3] + agent_ids[4:]
+        assert client.get("/agents", params={"capability": capability, "limit": 0}).status_code == 400
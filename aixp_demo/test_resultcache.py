@@ -0,0 +1,32 @@
+from resultcache import ResultCache
+
+
+def test_memory_lookup_does_not_read_disk(tmp_path):
+    cache = ResultCache(max_bytes=20, spill_dir=str(tmp_path))
+    first, second = ResultCache.key("t", 1), ResultCache.key("t", 2)
+    cache.put(first, {"v": "a" * 5})
+    # 第二条挤出第一条，第一条写入磁盘
+    cache.put(second, {"v": "b" * 5})
+    assert cache.get_memory(first) is None
+    assert cache.stats()["misses"] == 0
+    assert cache.get_memory(second) == {"v": "bbbbb"}
+    assert cache.get_spilled(first) == {"v": "aaaaa"}
+    # 命中磁盘后放回内存
+    assert cache.get_memory(first) == {"v": "aaaaa"}
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"], stats["spills"]) == (2, 1, 0, 2)
+
+
+def test_get_counts_one_miss(tmp_path):
+    cache = ResultCache(spill_dir=str(tmp_path))
+    assert cache.get(ResultCache.key("t", 0)) is None
+    assert ResultCache().get(ResultCache.key("t", 0)) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_expired_entry(tmp_path):
+    cache = ResultCache(ttl=-1)
+    key = ResultCache.key("t", 0)
+    cache.put(key, {"v": 1})
+    assert cache.get_memory(key) is None
+    assert cache.stats()["expirations"] == 1
@@ -0,0 +1,98 @@
+import pytest
+
+import routing
+from registry import AgentRegistry
+from routing import CONSISTENT_HASH, LEAST_OUTSTANDING, ROUND_ROBIN, NoRouteError, Router
+
+
+def make_router(agent_ids, depths=None, capability="work"):
+    registry = AgentRegistry()
+    for agent_id in agent_ids:
+        registry.register(agent_id, [capability])
+    depths = depths if depths is not None else {}
+    return registry, Router(registry, lambda agent_id: depths.get(agent_id, 0))
+
+
+def owners(router, keys):
+    return {key: router.route("work", {"key": key}, CONSISTENT_HASH) for key in keys}
+
+
+def test_round_robin_order():
+    registry, router = make_router(["c", "a", "b"])
+    registry.register("x", ["other"])
+    assert [router.route("work", {}) for _ in range(7)] == ["a", "b", "c", "a", "b", "c", "a"]
+    # 每种能力有独立的轮询位置
+    assert router.route("other", {}, ROUND_ROBIN) == "x"
+    assert router.route("work", {}) == "b"
+
+
+def test_consistent_hash_is_stable():
+    registry, router = make_router([f"agent-{n}" for n in range(5)])
+    keys = [f"user-{n}" for n in range(500)]
+    before = owners(router, keys)
+    assert owners(router, keys) == before
+    assert len(set(before.values())) == 5
+
+
+def test_consistent_hash_join_moves_keys_only_to_new_agent():
+    registry, router = make_router([f"agent-{n}" for n in range(5)])
+    keys = [f"user-{n}" for n in range(500)]
+    before = owners(router, keys)
+    registry.register("agent-new", ["work"])
+    after = owners(router, keys)
+    moved = [key for key in keys if after[key] != before[key]]
+    assert moved and all(after[key] == "agent-new" for key in moved)
+    assert len(moved) < len(keys) / 2
+
+
+def test_consistent_hash_leave_moves_only_departed_keys():
+    registry, router = make_router([f"agent-{n}" for n in range(5)])
+    keys = [f"user-{n}" for n in range(500)]
+    before = owners(router, keys)
+    registry.unregister("agent-2")
+    after = owners(router, keys)
+    assert {key for key in keys if after[key] != before[key]} == {key for key in keys if before[key] == "agent-2"}
+
+
+def test_consistent_hash_ignores_agents_with_other_capabilities():
+    registry, router = make_router([f"agent-{n}" for n in range(5)])
+    keys = [f"user-{n}" for n in range(500)]
+    before = owners(router, keys)
+    registry.register("bystander", ["other"])
+    assert owners(router, keys) == before
+    registry.unregister("bystander")
+    assert owners(router, keys) == before
+
+
+def test_consistent_hash_without_key_falls_back_to_round_robin():
+    registry, router = make_router(["a", "b"])
+    assert [router.route("work", {}, CONSISTENT_HASH) for _ in range(3)] == ["a", "b", "a"]
+    assert router.route("work", {"shard": 7}, CONSISTENT_HASH, route_key="shard") == \
+        router.route("work", {"shard": 7}, CONSISTENT_HASH, route_key="shard")
+
+
+def test_least_outstanding_prefers_idle_agent():
+    depths = {"a": 3, "b": 0, "c": 5}
+    registry, router = make_router(["a", "b", "c"], depths)
+    assert router.route("work", {}, LEAST_OUTSTANDING) == "b"
+    depths["b"] = 9
+    assert router.route("work", {}, LEAST_OUTSTANDING) == "a"
+
+
+def test_least_outstanding_two_choices_prefers_idler(monkeypatch):
+    agent_ids = [f"agent-{n:02d}" for n in range(40)]
+    depths = {agent_id: 10 for agent_id in agent_ids}
+    depths["agent-07"] = 0
+    registry, router = make_router(agent_ids, depths)
+    monkeypatch.setattr(routing.random, "sample", lambda candidates, k: ["agent-30", "agent-07"])
+    assert router.route("work", {}, LEAST_OUTSTANDING) == "agent-07"
+
+
+def test_errors():
+    registry, router = make_router(["a"])
+    with pytest.raises(NoRouteError):
+        router.route("missing", {})
+    with pytest.raises(ValueError):
+        router.route("work", {}, "random")
+    with pytest.raises(ValueError):
+        Router(registry, lambda agent_id: 0, default_policy="random")
@@ -0,0 +1,81 @@
+import queue
+import threading
+
+import pytest
+
+from agent import AIXPAgent
+from runtime import AgentRuntime
+
+
+class _Response:
+    status_code = 200
+    text = ""
+    content = b"{}"
+    headers = {"content-type": "application/json"}
+
+
+@pytest.fixture
+def agent():
+    # 不连接服务器：拉取和发送替换为内存中的收件箱
+    agent = AIXPAgent("caller", [], server_url=None)
+    agent.inbox = queue.Queue()
+    agent.polling = threading.Event()
+    agent.replies = queue.Queue()
+
+    def fetch(max_messages, timeout):
+        agent.polling.set()
+        try:
+            return [agent.inbox.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+    def post_paced(path, body):
+        if "correlation_id" in body:
+            agent.inbox.put({"sender_id": body["receiver_id"], "receiver_id": agent.agent_id, "task": body["task"],
+                             "data": {"echo": body["data"]}, "in_reply_to": body["correlation_id"]})
+        elif "in_reply_to" in body:
+            agent.replies.put(body)
+        return _Response()
+
+    agent._fetch = fetch
+    agent._post_paced = post_paced
+    yield agent
+    agent._stopped.set()
+
+
+def test_call_started_while_runtime_polls(agent):
+    """运行时的长轮询进行中发起的调用：响应被运行时拉取到后仍交给调用的 Future"""
+    runtime = AgentRuntime(agent, poll_timeout=0.2).start()
+    try:
+        assert agent.polling.wait(2.0)
+        future = agent.call("callee", "echo", {"value": 1})
+        reply = future.result(timeout=2.0)
+        assert reply["data"] == {"echo": {"value": 1}}
+    finally:
+        runtime.stop()
+    assert runtime.processed == 0
+
+
+def test_receive_resolves_replies(agent):
+    """没有接收线程时 receive() 拉取到的响应交给对应调用，不返回给调用方"""
+    future = agent.call("callee", "echo", {"value": 2})
+    agent.inbox.put({"sender_id": "other", "task": "note", "data": {}})
+    messages = agent.receive(timeout=0.2) + agent.receive(timeout=0.2)
+    assert [message["task"] for message in messages] == ["note"]
+    assert future.result(timeout=0)["data"] == {"echo": {"value": 2}}
+
+
+def test_call_without_deadline_is_answered(agent):
+    """没有 deadline 的调用（旧版服务器或其他客户端发来的）照常处理并响应"""
+    runtime = AgentRuntime(agent, poll_timeout=0.2)
+    runtime.register("double", lambda data: {"value": data["value"] * 2})
+    runtime.start()
+    try:
+        agent.inbox.put({"sender_id": "other", "receiver_id": agent.agent_id, "task": "double",
+                         "data": {"value": 21}, "correlation_id": "c1"})
+        reply = agent.replies.get(timeout=2.0)
+    finally:
+        runtime.stop()
+    assert (reply["in_reply_to"], reply["data"]) == ("c1", {"value": 42})
+    assert "error" not in reply
+    assert runtime.processed == 1
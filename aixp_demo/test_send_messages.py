@@ -0,0 +1,70 @@
+import json
+import uuid
+
+from fastapi.testclient import TestClient
+
+import server
+
+
+def register(client):
+    agent_id = f"batch-{uuid.uuid4().hex[:8]}"
+    assert client.post("/register", json={"agent_id": agent_id, "capabilities": ["batch"]}).status_code == 200
+    return agent_id
+
+
+def message(sender_id, receiver_id, n):
+    return {"sender_id": sender_id, "receiver_id": receiver_id, "task": "batch_test", "data": {"n": n}}
+
+
+def received(client, agent_id):
+    messages = client.get(f"/inbox/{agent_id}", params={"timeout": 0}).json()["messages"]
+    return [m["data"]["n"] for m in messages]
+
+
+def test_per_item_statuses():
+    with TestClient(server.app) as client:
+        sender_id, receiver_id = register(client), register(client)
+        missing = message(sender_id, f"batch-missing-{uuid.uuid4().hex[:8]}", 2)
+        invalid = {"sender_id": sender_id, "receiver_id": receiver_id, "data": {}}
+        response = client.post("/send_messages", json=[
+            message(sender_id, receiver_id, 1), missing, "not an object", invalid, message(sender_id, receiver_id, 5)
+        ])
+        assert response.status_code == 200
+        body = response.json()
+        assert (body["accepted"], body["rejected"]) == (2, 3)
+        results = body["results"]
+        assert [result["index"] for result in results] == [0, 1, 2, 3, 4]
+        assert [result["status"] for result in results] == ["success", "error", "error", "error", "success"]
+        assert [result.get("code") for result in results] == [None, 404, 422, 422, None]
+        assert results[3]["detail"][0]["loc"] == ["task"]
+        assert results[0]["receiver"] == receiver_id and results[0]["message_id"]
+        assert received(client, receiver_id) == [1, 5]
+
+
+def test_ndjson_body():
+    with TestClient(server.app) as client:
+        sender_id, receiver_id = register(client), register(client)
+        lines = [json.dumps(message(sender_id, receiver_id, n)) for n in range(3)]
+        # 分块发送，块边界不与行边界对齐；空行被忽略，最后一行可以没有换行符
+        body = ("\n".join(lines[:2]) + "\n\n" + lines[2]).encode("utf-8")
+        chunks = [body[i:i + 37] for i in range(0, len(body), 37)]
+        response = client.post("/send_messages", content=iter(chunks), headers={"Content-Type": "application/x-ndjson"})
+        assert response.status_code == 200
+        assert response.json()["accepted"] == 3
+        assert received(client, receiver_id) == [0, 1, 2]
+
+
+def test_malformed_batches(monkeypatch):
+    with TestClient(server.app) as client:
+        sender_id, receiver_id = register(client), register(client)
+        assert client.post("/send_messages", json=message(sender_id, receiver_id, 0)).status_code == 400
+        assert client.post("/send_messages", content=b"[{", headers={"Content-Type": "application/json"}).status_code == 400
+        response = client.post("/send_messages", content=b"{\n", headers={"Content-Type": "application/x-ndjson"})
+        assert response.status_code == 400
+        monkeypatch.setattr(server.config, "BATCH_MAX_SIZE", 2)
+        batch = [message(sender_id, receiver_id, n) for n in range(3)]
+        assert client.post("/send_messages", json=batch).status_code == 413
+        ndjson = "\n".join(json.dumps(item) for item in batch)
+        response = client.post("/send_messages", content=ndjson, headers={"Content-Type": "application/x-ndjson"})
+        assert response.status_code == 413
+        assert received(client, receiver_id) == []
@@ -0,0 +1,92 @@
+import pytest
+
+from topics import TopicIndex, validate_topic
+
+
+@pytest.mark.parametrize("topic", ["a", "a.b.c", "orders.eu"])
+def test_valid_topics(topic):
+    validate_topic(topic)
+
+
+@pytest.mark.parametrize("topic,pattern", [
+    ("", False), ("a..b", False), (".a", False), ("a.*", False), ("a.#", False),
+    ("a.#.b", True), ("a.b*", True), ("#a", True),
+])
+def test_invalid_topics(topic, pattern):
+    with pytest.raises(ValueError):
+        validate_topic(topic, pattern=pattern)
+
+
+def test_wildcard_patterns_are_valid():
+    for pattern in ("*", "#", "a.*.c", "a.#", "*.#"):
+        validate_topic(pattern, pattern=True)
+
+
+@pytest.fixture
+def index():
+    index = TopicIndex()
+    index.subscribe("exact", "orders.eu.created")
+    index.subscribe("one", "orders.*.created")
+    index.subscribe("rest", "orders.#")
+    index.subscribe("all", "#")
+    index.subscribe("two", "*.*")
+    return index
+
+
+@pytest.mark.parametrize("topic,expected", [
+    ("orders.eu.created", {"exact", "one", "rest", "all"}),
+    ("orders.us.created", {"one", "rest", "all"}),
+    # "#" 匹配零层
+    ("orders", {"rest", "all"}),
+    ("orders.eu", {"rest", "all", "two"}),
+    # "*" 恰好匹配一层
+    ("orders.eu.west.created", {"rest", "all"}),
+    ("users.new", {"all", "two"}),
+])
+def test_match(index, topic, expected):
+    assert index.match(topic) == expected
+
+
+def test_match_excludes_sender(index):
+    assert index.match("orders", exclude="rest") == {"all"}
+
+
+def test_duplicate_subscription(index):
+    assert not index.subscribe("one", "orders.*.created")
+    assert len(index) == 5
+
+
+def test_unsubscribe_prunes_empty_nodes():
+    index = TopicIndex()
+    index.subscribe("a", "x.y.z")
+    index.subscribe("b", "x.y")
+    assert index.unsubscribe("a", "x.y.z")
+    # 仍有订阅方的节点保留，空的子节点被删除
+    assert list(index._root.children) == ["x"]
+    assert list(index._root.children["x"].children["y"].children) == []
+    assert index.match("x.y") == {"b"}
+    assert index.unsubscribe("b", "x.y")
+    assert index._root.children == {}
+    assert len(index) == 0
+    assert not index.unsubscribe("b", "x.y")
+
+
+def test_unsubscribe_keeps_shared_prefix():
+    index = TopicIndex()
+    index.subscribe("a", "x.*")
+    index.subscribe("b", "x.y")
+    index.unsubscribe("a", "x.*")
+    assert set(index._root.children["x"].children) == {"y"}
+    assert index.match("x.y") == {"b"}
+
+
+def test_unsubscribe_all():
+    index = TopicIndex()
+    index.subscribe("a", "x.#")
+    index.subscribe("a", "y")
+    index.subscribe("b", "y")
+    assert index.unsubscribe_all("a") == ["x.#", "y"]
+    assert index.subscriptions("a") == []
+    assert dict(index.items()) == {"b": ["y"]}
+    assert index.match("y") == {"b"}
+    assert "x" not in index._root.children
@@ -0,0 +1,56 @@
+import threading
+import time
+
+from transport import Batcher, HistoryReporter
+
+
+class Recorder:
+    def __init__(self):
+        self.batches = []
+        self.sent = threading.Event()
+
+    def __call__(self, batch):
+        self.batches.append(list(batch))
+        self.sent.set()
+
+
+def test_partial_batch_sent_after_delay():
+    send = Recorder()
+    batcher = Batcher(send, "test", max_batch_size=10, max_delay=0.05)
+    started = time.monotonic()
+    assert batcher.add(1) and batcher.add(2)
+    assert send.sent.wait(1.0)
+    assert time.monotonic() - started >= 0.04
+    assert send.batches == [[1, 2]]
+    batcher.close()
+
+
+def test_full_batch_sent_immediately():
+    send = Recorder()
+    batcher = Batcher(send, "test", max_batch_size=3, max_delay=60)
+    for item in range(7):
+        batcher.add(item)
+    assert send.sent.wait(1.0)
+    batcher.close()
+    assert send.batches == [[0, 1, 2], [3, 4, 5], [6]]
+    assert not batcher.add(7)
+
+
+def test_max_pending_drops_oldest():
+    send = Recorder()
+    batcher = Batcher(send, "test", max_batch_size=10, max_delay=60, max_pending=3)
+    for item in range(5):
+        batcher.add(item)
+    batcher.close()
+    assert send.batches == [[2, 3, 4]]
+    assert batcher.dropped == 2
+
+
+def test_reporter_counts_failed_batches():
+    def post(batch):
+        raise ConnectionError("down")
+
+    reporter = HistoryReporter(post, "test", max_delay=60)
+    reporter.report({"task": "a"})
+    reporter.close()
+    assert (reporter.reported, reporter.dropped) == (0, 1)
@@ -0,0 +1,65 @@
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 批量分析每块的默认文本条数
+CHUNK_SIZE = 1000
+
+# str.split() 视为空白的码位（都不超过 U+3000）
+_MAX_SPACE = 0x3000
+_WHITESPACE = [code for code in range(_MAX_SPACE + 1) if chr(code).isspace()]
+if np is not None:
+    _SPACE_TABLE = np.zeros(_MAX_SPACE + 1, dtype=bool)
+    _SPACE_TABLE[_WHITESPACE] = True
+
+
+def analyze_texts(texts: Sequence[str]) -> Dict[str, List[int]]:
+    """一批文本的词数和字符数（列式），与逐条计算 len(text.split())、len(text) 的结果相同
+
+    有 NumPy 时把整批文本拼接为一个码位数组（全部为 Latin-1 字符时每个码位 1 字节，否则为 UTF-32），
+    一次向量化判断空白、求出所有词的起点，再按文本边界分段求和；没有 NumPy 时逐条计算。
+    """
+    if np is None or not texts:
+        return {
+            "word_count": [len(text.split()) for text in texts],
+            "text_length": [len(text) for text in texts],
+        }
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    joined = "".join(texts)
+    try:
+        codes = np.frombuffer(joined.encode("latin-1"), dtype=np.uint8)
+    except UnicodeEncodeError:
+        codes = np.frombuffer(joined.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    # ASCII 空白（\t-\r、\x1c-空格）直接比较，其余可能的空白码位（U+0085 到 U+3000）再查表
+    space = codes <= 32
+    space &= (codes >= 28) | ((codes >= 9) & (codes <= 13))
+    rare = np.flatnonzero((codes >= 0x85) & (codes <= _MAX_SPACE))
+    if rare.size:
+        space[rare] = _SPACE_TABLE[codes[rare]]
+    # 词的起点：非空白字符，且位于文本开头或空白之后
+    starts = ~space
+    starts[1:] &= space[:-1]
+    begins = np.cumsum(lengths) - lengths
+    nonempty = np.flatnonzero(lengths)
+    firsts = begins[nonempty]
+    # 每条文本的第一个字符不受前一条文本结尾的影响
+    starts[firsts] = ~space[firsts]
+    word_count = np.zeros(len(texts), dtype=np.int64)
+    if firsts.size:
+        # 相邻两个非空文本的起点之间恰好是前一个文本（空文本不占码位）
+        word_count[nonempty] = np.add.reduceat(starts, firsts, dtype=np.int64)
+    return {
+        "word_count": word_count.tolist(),
+        "text_length": lengths.tolist(),
+    }
+
+
+def iter_chunks(texts: Sequence[str], chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[int, Dict[str, List[int]]]]:
+    """按 chunk_size 条分块分析，逐块产出 (起始下标, 列式结果)，同一时间只保留一块的结果"""
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+    for offset in range(0, len(texts), chunk_size):
+        yield offset, analyze_texts(texts[offset:offset + chunk_size])
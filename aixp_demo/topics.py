@@ -0,0 +1,126 @@
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+# 主题按 "." 分为若干层；订阅模式中 "*" 匹配恰好一层，"#" 只能作为最后一层，匹配零层或多层
+SEPARATOR = "."
+ONE_LEVEL = "*"
+ANY_LEVELS = "#"
+
+
+def validate_topic(topic: str, pattern: bool = False):
+    """检查主题（pattern=True 时为订阅模式）的格式，不合法时抛出 ValueError"""
+    levels = topic.split(SEPARATOR)
+    if not topic or not all(levels):
+        raise ValueError(f"Invalid topic {topic!r}: levels must be non-empty")
+    for index, level in enumerate(levels):
+        if level in (ONE_LEVEL, ANY_LEVELS):
+            if not pattern:
+                raise ValueError(f"Invalid topic {topic!r}: wildcards are only allowed in subscriptions")
+            if level == ANY_LEVELS and index != len(levels) - 1:
+                raise ValueError(f"Invalid topic {topic!r}: '{ANY_LEVELS}' must be the last level")
+        elif ONE_LEVEL in level or ANY_LEVELS in level:
+            raise ValueError(f"Invalid topic {topic!r}: wildcards must occupy a whole level")
+
+
+class _Node:
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.subscribers: Set[str] = set()
+
+
+class TopicIndex:
+    """主题订阅的前缀树
+
+    订阅模式按层插入树中，通配层（"*"、"#"）是普通的子节点。
+    匹配一个主题时逐层向下，每层只查看与该层同名、"*" 和 "#" 三个子节点，
+    代价取决于主题层数和命中的通配分支，而与订阅总数无关。
+    另维护 agent_id -> 订阅模式 的反向表，用于代理注销时移除其全部订阅。
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._by_agent: Dict[str, Set[str]] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def subscribe(self, agent_id: str, pattern: str) -> bool:
+        """添加订阅，已存在时返回 False"""
+        node = self._root
+        for level in pattern.split(SEPARATOR):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _Node()
+            node = child
+        if agent_id in node.subscribers:
+            return False
+        node.subscribers.add(agent_id)
+        self._by_agent.setdefault(agent_id, set()).add(pattern)
+        self._count += 1
+        return True
+
+    def unsubscribe(self, agent_id: str, pattern: str) -> bool:
+        """取消订阅并删除不再有订阅的节点，订阅不存在时返回 False"""
+        patterns = self._by_agent.get(agent_id)
+        if patterns is None or pattern not in patterns:
+            return False
+        path = [self._root]
+        levels = pattern.split(SEPARATOR)
+        for level in levels:
+            path.append(path[-1].children[level])
+        path[-1].subscribers.discard(agent_id)
+        for depth in range(len(levels), 0, -1):
+            node = path[depth]
+            if node.subscribers or node.children:
+                break
+            del path[depth - 1].children[levels[depth - 1]]
+        patterns.discard(pattern)
+        if not patterns:
+            del self._by_agent[agent_id]
+        self._count -= 1
+        return True
+
+    def unsubscribe_all(self, agent_id: str) -> List[str]:
+        """取消代理的全部订阅，返回被取消的模式"""
+        patterns = sorted(self._by_agent.get(agent_id, ()))
+        for pattern in patterns:
+            self.unsubscribe(agent_id, pattern)
+        return patterns
+
+    def clear(self):
+        self._root = _Node()
+        self._by_agent.clear()
+        self._count = 0
+
+    def subscriptions(self, agent_id: str) -> List[str]:
+        return sorted(self._by_agent.get(agent_id, ()))
+
+    def items(self) -> Iterator[Tuple[str, List[str]]]:
+        """(agent_id, 订阅模式列表)，用于状态快照"""
+        for agent_id, patterns in self._by_agent.items():
+            yield agent_id, sorted(patterns)
+
+    def match(self, topic: str, exclude: Optional[str] = None) -> Set[str]:
+        """订阅了与 topic 匹配的模式的代理（不含 exclude）"""
+        levels = topic.split(SEPARATOR)
+        matched: Set[str] = set()
+        stack = [(self._root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            # "#" 匹配剩余的零层或多层
+            any_levels = node.children.get(ANY_LEVELS)
+            if any_levels is not None:
+                matched |= any_levels.subscribers
+            if depth == len(levels):
+                matched |= node.subscribers
+                continue
+            child = node.children.get(levels[depth])
+            if child is not None:
+                stack.append((child, depth + 1))
+            one_level = node.children.get(ONE_LEVEL)
+            if one_level is not None:
+                stack.append((one_level, depth + 1))
+        matched.discard(exclude)
+        return matched
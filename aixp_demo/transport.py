@@ -0,0 +1,244 @@
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from calls import CallError, CallTable
+
+logger = logging.getLogger(__name__)
+
+# 未指定超时的本地调用使用的超时（秒），与服务器 AIXP_CALL_TIMEOUT 的默认值相同
+CALL_TIMEOUT = 30.0
+
+
+def local_entry(sender_id: str, receiver_id: str, task: str, data: Dict[str, Any],
+                correlation_id: Optional[str] = None, timeout: Optional[float] = None,
+                in_reply_to: Optional[str] = None, error: Optional[str] = None) -> Dict[str, Any]:
+    """构造进程内投递的消息，字段与服务器投递的历史记录条目相同，另带 transport 为 local"""
+    entry = {
+        "message_id": uuid.uuid4().hex,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "sender_id": sender_id,
+        "receiver_id": receiver_id,
+        "task": task,
+        "data": data,
+        "transport": "local"
+    }
+    if in_reply_to is not None:
+        entry["in_reply_to"] = in_reply_to
+        if error is not None:
+            entry["error"] = error
+    elif correlation_id is not None or timeout is not None:
+        entry["correlation_id"] = correlation_id or uuid.uuid4().hex
+        entry["deadline"] = time.time() + max(timeout if timeout is not None else CALL_TIMEOUT, 0.0)
+    return entry
+
+
+class LocalBus:
+    """进程内消息总线
+
+    同一进程中的 AIXPAgent 以 bus 参数加入同一总线后，发给总线上代理的消息（包括调用和响应）
+    不经过服务器：消息以只读映射（MappingProxyType）直接放入接收方的本地队列，
+    data 按引用传递，不序列化、不复制，收发双方都不应再修改它。
+    本地调用的截止时间由总线的计时线程管理，到期时向调用方投递 call_timeout 响应。
+    投递记录由发送方的 HistoryReporter 在后台批量补报给服务器，仪表盘和消息历史照常可见。
+    """
+
+    def __init__(self):
+        self._agents: Dict[str, Any] = {}
+        self._calls = CallTable()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._timer: Optional[threading.Thread] = None
+        self.delivered = 0
+        self.timed_out = 0
+
+    def __contains__(self, agent_id: Any) -> bool:
+        return agent_id in self._agents
+
+    def attach(self, agent: Any):
+        with self._lock:
+            current = self._agents.get(agent.agent_id)
+            if current is not None and current is not agent:
+                raise ValueError(f"Agent {agent.agent_id} is already attached to the bus")
+            self._agents[agent.agent_id] = agent
+
+    def detach(self, agent_id: str):
+        with self._lock:
+            self._agents.pop(agent_id, None)
+
+    def deliver(self, entry: Dict[str, Any]) -> Mapping[str, Any]:
+        """把消息交给接收方，返回接收方收到的只读消息
+
+        接收方不在总线上时抛出 LookupError；响应的调用不是本地调用、已超时或已响应时抛出 CallError。
+        """
+        receiver = self._agents.get(entry["receiver_id"])
+        if receiver is None:
+            raise LookupError(f"Receiver {entry['receiver_id']} is not attached to the bus")
+        with self._lock:
+            if "in_reply_to" in entry:
+                if self._calls.pop(entry["in_reply_to"]) is None:
+                    raise CallError(f"Call {entry['in_reply_to']} is not pending")
+            elif "correlation_id" in entry:
+                if entry["correlation_id"] in self._calls:
+                    raise CallError(f"Call {entry['correlation_id']} is already pending")
+                head = self._calls.next_deadline()
+                self._calls.add(entry["correlation_id"], entry["sender_id"], entry["deadline"], local=True)
+                self._start_timer()
+                if head is None or entry["deadline"] < head:
+                    self._wakeup.notify()
+            self.delivered += 1
+        message = MappingProxyType(entry)
+        receiver._accept(message)
+        return message
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "agents": len(self._agents),
+            "pending_calls": len(self._calls),
+            "delivered": self.delivered,
+            "timed_out": self.timed_out,
+        }
+
+    def _start_timer(self):
+        if self._timer is None:
+            self._timer = threading.Thread(target=self._expire_calls, name="local-bus-calls", daemon=True)
+            self._timer.start()
+
+    def _expire_calls(self):
+        """按调用堆的堆顶时间休眠，到期后向未收到响应的调用方投递超时响应"""
+        while True:
+            with self._wakeup:
+                deadline = self._calls.next_deadline()
+                now = time.time()
+                if deadline is None or deadline > now:
+                    self._wakeup.wait(None if deadline is None else deadline - now)
+                    continue
+                expired = self._calls.expired(now)
+                self.timed_out += len(expired)
+            for correlation_id, caller_id in expired:
+                caller = self._agents.get(caller_id)
+                if caller is None:
+                    # 调用方已离开总线
+                    continue
+                entry = local_entry("system", caller_id, "call_timeout", {},
+                                    in_reply_to=correlation_id, error="Call timed out")
+                caller._accept(MappingProxyType(entry))
+                caller._report(entry)
+
+
+class Batcher:
+    """按大小和时间攒批的后台发送线程
+
+    add() 只把条目放入缓冲区；缓冲区攒满 max_batch_size 条或最早的条目等待超过 max_delay 秒时，
+    后台线程以整批调用 send(batch)。max_pending 不为 None 时限制积压，超过时丢弃最旧的条目（计入 dropped）。
+    send 在后台线程（flush()、close() 时在调用方线程）中执行，应自行处理异常。
+    """
+
+    def __init__(self, send: Callable[[List[Any]], Any], name: str, max_batch_size: int = 100,
+                 max_delay: float = 0.05, max_pending: Optional[int] = None):
+        self.send = send
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._pending: List[Any] = []
+        self._first_at = 0.0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def add(self, item: Any) -> bool:
+        """缓冲一个条目，已关闭时返回 False"""
+        with self._condition:
+            if self._closed:
+                return False
+            if not self._pending:
+                self._first_at = time.monotonic()
+                # 后台线程在缓冲区为空时无限期等待，第一个条目到达后开始计时
+                self._condition.notify()
+            self._pending.append(item)
+            if self.max_pending is not None and len(self._pending) > self.max_pending:
+                del self._pending[0]
+                self.dropped += 1
+            elif len(self._pending) >= self.max_batch_size:
+                self._condition.notify()
+        return True
+
+    def flush(self):
+        """在调用方线程中立即发送缓冲区中的所有条目"""
+        with self._condition:
+            pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self.max_batch_size):
+            self.send(pending[start:start + self.max_batch_size])
+
+    def close(self):
+        """停止后台线程并发送剩余条目"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if len(self._pending) >= self.max_batch_size:
+                        break
+                    if self._pending:
+                        remaining = self._first_at + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+                batch = self._pending[:self.max_batch_size]
+                self._pending = self._pending[self.max_batch_size:]
+                if self._pending:
+                    self._first_at = time.monotonic()
+            self.send(batch)
+
+
+class HistoryReporter:
+    """把进程内投递的消息批量补报给服务器（POST /report_messages），不阻塞发送方
+
+    记录攒满 max_batch_size 条或最早的记录等待超过 max_delay 秒时由后台线程发送；
+    积压超过 max_pending 条（服务器不可用时）丢弃最旧的记录。补报失败只记录日志，不影响本地投递。
+    """
+
+    def __init__(self, post: Callable[[List[Dict[str, Any]]], Any], name: str, max_batch_size: int = 500,
+                 max_delay: float = 0.05, max_pending: int = 100000):
+        self.post = post
+        self.reported = 0
+        self.failed = 0
+        self._batcher = Batcher(self._send, f"reporter-{name}", max_batch_size, max_delay, max_pending)
+
+    @property
+    def dropped(self) -> int:
+        """因积压被丢弃和补报失败的记录数"""
+        return self._batcher.dropped + self.failed
+
+    def report(self, entry: Dict[str, Any]):
+        self._batcher.add(entry)
+
+    def close(self):
+        """发送剩余记录并停止后台线程"""
+        self._batcher.close()
+
+    def _send(self, batch: List[Dict[str, Any]]):
+        if not batch:
+            return
+        try:
+            self.post(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.warning(f"补报 {len(batch)} 条本地消息失败: {str(e)}")
+            return
+        self.reported += len(batch)